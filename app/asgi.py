@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from main import app as flask_app
+from src import const
+from src.async_views import PositionsASGI
+
+app = PositionsASGI(flask_app, int(os.environ.get(const.ASGI_WSGI_THREADS, const.DEFAULT_ASGI_WSGI_THREADS)))
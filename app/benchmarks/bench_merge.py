@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+micro-benchmark of the x/y merge in the positions view.
+
+usage: python -m benchmarks.bench_merge [num]
+"""
+import sys
+import timeit
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dateutil import parser
+from pytz import timezone
+
+from src import merge
+
+TZ = timezone('Asia/Tokyo')
+
+
+def make_values(num, base):
+    start = datetime(2018, 1, 2)
+    return [{'recvTime': (start + timedelta(milliseconds=100 * i)).isoformat(timespec='milliseconds') + 'Z',
+             'attrType': 'float',
+             'attrValue': str(base + i / 1000)} for i in range(num)]
+
+
+def legacy(x_values, y_values):
+    points = OrderedDict()
+    for attr in x_values:
+        recv_time = attr['recvTime']
+        if recv_time not in points:
+            points[recv_time] = {'time': parser.parse(recv_time).astimezone(TZ).isoformat()}
+        points[recv_time]['x'] = float(attr['attrValue'])
+
+    for attr in y_values:
+        recv_time = attr['recvTime']
+        if recv_time in points:
+            points[recv_time]['y'] = float(attr['attrValue'])
+    return list(points.values())
+
+
+def columnar(x_values, y_values):
+    columns = merge.join(merge.TimeConverter(TZ), [x_values, y_values])
+    return [point for _, point in merge.to_positions(('x', 'y'), *columns)]
+
+
+def main(num):
+    x_values = make_values(num, 0.0)
+    y_values = make_values(num, 1.0)
+    assert legacy(x_values, y_values) == columnar(x_values, y_values)
+
+    legacy_sec = min(timeit.repeat(lambda: legacy(x_values, y_values), number=1, repeat=3))
+    columnar_sec = min(timeit.repeat(lambda: columnar(x_values, y_values), number=1, repeat=3))
+    print(f'points={num}')
+    print(f'legacy   : {legacy_sec:.3f} sec')
+    print(f'columnar : {columnar_sec:.3f} sec')
+    print(f'speedup  : {legacy_sec / columnar_sec:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+end-to-end benchmark of /positions/ against a local fake sth-comet.
+
+For each combination of the number of points and FETCH_LIMIT, the application is started in a subprocess and
+measured for the latency of sequential requests, the throughput of concurrent clients and its peak RSS (summed over
+its worker processes). The application is run by uwsgi with the uwsgi.ini of the image, serving http on a local port
+instead of the socket for nginx, or by uvicorn with asgi.py if --asgi is given.
+Unless --cache is given, the caches of the application are disabled and every request asks for a window of its own,
+so that each request is served by fetching the positions from sth-comet.
+
+usage: python -m benchmarks.bench_positions [--points 10000,100000] [--fetch-limits 128,1024] [--clients 4]
+                                            [--processes 2] [--threads 4]
+"""
+import argparse
+import configparser
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import itertools
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from benchmarks import fake_comet
+from src import const
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UWSGI_INI = os.path.join(os.path.dirname(APP_DIR), 'uwsgi.ini')
+
+# the options of uwsgi.ini which bind the socket for nginx and drop the privileges in the image
+UWSGI_DEPLOY_OPTIONS = ('uid', 'gid', 'socket', 'chown-socket', 'chmod-socket', 'protocol')
+
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_peak_rss(pid):
+    """
+    return the sum of the peak resident set sizes of the process and its children in bytes, or None if it is not
+    available.
+    """
+    total = None
+    for child in [pid] + get_children(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total = (total or 0) + int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def get_children(pid):
+    children = list()
+    for name in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # the fields after the command name in parentheses, where the second one is the parent pid
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    children.append(int(name))
+        except (OSError, ValueError, IndexError):
+            pass
+    return children
+
+
+def write_uwsgi_ini(port, args):
+    """
+    write uwsgi.ini of the image serving http on port with args.processes and args.threads to a temporary file, and
+    return its path.
+    """
+    config = configparser.RawConfigParser()
+    config.read(args.uwsgi_ini)
+    uwsgi = config['uwsgi']
+    for option in UWSGI_DEPLOY_OPTIONS:
+        uwsgi.pop(option, None)
+    uwsgi['http-socket'] = f'127.0.0.1:{port}'
+    uwsgi['die-on-term'] = 'true'
+    if args.processes is not None:
+        uwsgi['processes'] = str(args.processes)
+        if int(uwsgi.get('cheaper', '0')) >= args.processes:
+            uwsgi.pop('cheaper')
+    if args.threads is not None:
+        uwsgi['threads'] = str(args.threads)
+    with tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False) as f:
+        config.write(f)
+    return f.name
+
+
+def start_app(port, comet_port, fetch_limit, args):
+    env = dict(os.environ)
+    env.update({
+        const.LISTEN_PORT: str(port),
+        const.COMET_ENDPOINT: f'http://127.0.0.1:{comet_port}',
+        const.FIWARE_SERVICE: 'bench',
+        const.FIWARE_SERVICEPATH: '/bench',
+        const.ENTITY_TYPE: 'robot',
+        const.ENTITY_ID: 'robot01',
+        const.FETCH_LIMIT: str(fetch_limit),
+        const.COMET_FETCH_CONCURRENCY: str(args.concurrency),
+        const.POSITION_CACHE_SIZE: const.DEFAULT_POSITION_CACHE_SIZE if args.cache else '0',
+        const.RESPONSE_CACHE_SIZE: const.DEFAULT_RESPONSE_CACHE_SIZE if args.cache else '0',
+        const.LOD_CACHE_SIZE: const.DEFAULT_LOD_CACHE_SIZE if args.cache else '0',
+        const.LOG_LEVEL: 'WARNING',
+    })
+    if args.fetch_limit_bounds:
+        env[const.FETCH_LIMIT_MIN], env[const.FETCH_LIMIT_MAX] = args.fetch_limit_bounds.split(',')
+        env[const.FETCH_TARGET_LATENCY] = str(args.target_latency)
+    if args.asgi:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning',
+                   '--workers', str(args.processes or 1)]
+        if args.threads is not None:
+            env[const.ASGI_WSGI_THREADS] = str(args.threads)
+        ini = None
+    else:
+        ini = write_uwsgi_ini(port, args)
+        command = [shutil.which('uwsgi') or 'uwsgi', '--ini', ini]
+    try:
+        process = subprocess.Popen(command, cwd=APP_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return process
+            except OSError:
+                time.sleep(0.1)
+        process.kill()
+        raise RuntimeError('the application did not start')
+    finally:
+        if ini is not None:
+            os.remove(ini)
+
+
+def request_positions(url, params):
+    start = time.perf_counter()
+    response = requests.get(url, params=params)
+    response.raise_for_status()
+    return time.perf_counter() - start, len(response.content)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def measure(points, fetch_limit, args):
+    comet = fake_comet.start(get_free_port(), points, args.interval, args.latency, args.jitter)
+    port = get_free_port()
+    process = start_app(port, comet.server_address[1], fetch_limit, args)
+    try:
+        url = f'http://127.0.0.1:{port}/positions/'
+        end = fake_comet.ORIGIN + timedelta(seconds=points * args.interval)
+        params = {'st': fake_comet.ORIGIN.isoformat(), 'et': end.isoformat()}
+        params.update(dict(param.split('=', 1) for param in args.params))
+        windows = itertools.count()
+
+        def get_params():
+            if args.cache:
+                return params
+            # a window ending a few microseconds earlier has the same positions but is not the same request
+            return dict(params, et=(end - timedelta(microseconds=next(windows))).isoformat())
+
+        request_positions(url, get_params())
+        comet.requests = 0
+        latencies = [request_positions(url, get_params())[0] for _ in range(args.requests)]
+        comet_requests = comet.requests / args.requests
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            results = list(executor.map(lambda _: request_positions(url, get_params()),
+                                        range(args.clients * args.requests)))
+        elapsed = time.perf_counter() - start
+
+        return {
+            'points': points,
+            'fetch_limit': fetch_limit,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'throughput': len(results) / elapsed,
+            'comet_requests': comet_requests,
+            'bytes': results[-1][1],
+            'peak_rss': get_peak_rss(process.pid),
+        }
+    finally:
+        process.terminate()
+        process.wait()
+        comet.shutdown()
+        comet.server_close()
+
+
+def print_result(result):
+    peak_rss = f'{result["peak_rss"] / 1024 / 1024:.1f}' if result['peak_rss'] is not None else 'n/a'
+    print(f'{result["points"]:>9} {result["fetch_limit"]:>11} {result["p50"]:>8.3f} {result["p95"]:>8.3f} '
+          f'{result["throughput"]:>10.2f} {result["comet_requests"]:>9.1f} {result["bytes"]:>11} {peak_rss:>12}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='end-to-end benchmark of /positions/')
+    arg_parser.add_argument('--points', default='10000,100000', help='comma separated numbers of points')
+    arg_parser.add_argument('--fetch-limits', default='128,1024', help='comma separated FETCH_LIMIT')
+    arg_parser.add_argument('--fetch-limit-bounds', help='FETCH_LIMIT_MIN,FETCH_LIMIT_MAX to adapt hLimit')
+    arg_parser.add_argument('--target-latency', type=float, default=float(const.DEFAULT_FETCH_TARGET_LATENCY),
+                            help='FETCH_TARGET_LATENCY of the application')
+    arg_parser.add_argument('--concurrency', type=int, default=int(const.DEFAULT_COMET_FETCH_CONCURRENCY),
+                            help='COMET_FETCH_CONCURRENCY of the application')
+    arg_parser.add_argument('--clients', type=int, default=4, help='the number of concurrent clients')
+    arg_parser.add_argument('--requests', type=int, default=5, help='the number of requests of each client')
+    arg_parser.add_argument('--interval', type=float, default=0.1, help='the seconds between values')
+    arg_parser.add_argument('--latency', type=float, default=0.02, help='the seconds to delay a response of sth-comet')
+    arg_parser.add_argument('--jitter', type=float, default=0.005, help='the jitter seconds of the latency')
+    arg_parser.add_argument('--cache', action='store_true',
+                            help='enable the position, level of detail and response caches of the application')
+    arg_parser.add_argument('--asgi', action='store_true', help='run the application by uvicorn with asgi.py')
+    arg_parser.add_argument('--uwsgi-ini', default=UWSGI_INI, help='the uwsgi.ini to run the application')
+    arg_parser.add_argument('--processes', type=int,
+                            help='the worker processes of uwsgi (processes of uwsgi.ini by default) or uvicorn (1)')
+    arg_parser.add_argument('--threads', type=int,
+                            help='the threads of each uwsgi worker, or ASGI_WSGI_THREADS with --asgi')
+    arg_parser.add_argument('--param', dest='params', action='append', default=[],
+                            help='an additional query parameter like format=binary (repeatable)')
+    args = arg_parser.parse_args()
+
+    print(f'latency={args.latency} jitter={args.jitter} concurrency={args.concurrency} clients={args.clients} '
+          f'requests={args.requests} cache={args.cache} asgi={args.asgi} processes={args.processes} '
+          f'threads={args.threads} params={args.params} '
+          f'fetch_limit_bounds={args.fetch_limit_bounds} target_latency={args.target_latency}')
+    print(f'{"points":>9} {"fetch_limit":>11} {"p50(s)":>8} {"p95(s)":>8} {"req/s":>10} {"comet/req":>9} '
+          f'{"bytes":>11} {"peak_rss(MB)":>12}')
+    for points in [int(v) for v in args.points.split(',')]:
+        for fetch_limit in [int(v) for v in args.fetch_limits.split(',')]:
+            print_result(measure(points, fetch_limit, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+a local stand-in of FIWARE STH-Comet which serves a generated dataset of raw values.
+
+hLimit, hOffset, dateFrom, dateTo and fiware-total-count are honoured like STH-Comet, and each response is delayed
+by latency +/- jitter seconds. The values are generated from their index, so the server itself uses little memory.
+
+usage: python -m benchmarks.fake_comet [--port 8666] [--points 100000] [--latency 0.02] [--jitter 0.005]
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from dateutil import parser
+import pytz
+
+PATH = re.compile(r'^/STH/v1/contextEntities/type/([^/]+)/id/([^/]+)/attributes/([^/]+)$')
+ORIGIN = datetime(2018, 1, 2, tzinfo=pytz.utc)
+
+
+class Dataset:
+    """
+    points values of each attr recorded every interval seconds from ORIGIN.
+    """
+
+    def __init__(self, points, interval):
+        self.points = points
+        self.interval = interval
+
+    def get_range(self, date_from, date_to):
+        """
+        return the first index and the end index of the values between date_from and date_to.
+        """
+        first = 0
+        end = self.points
+        if date_from is not None:
+            first = max(first, math.ceil((date_from - ORIGIN).total_seconds() / self.interval))
+        if date_to is not None:
+            end = min(end, math.floor((date_to - ORIGIN).total_seconds() / self.interval) + 1)
+        return first, max(first, end)
+
+    def get_values(self, attr, first, end):
+        values = list()
+        for i in range(first, end):
+            recv_time = ORIGIN + timedelta(seconds=i * self.interval)
+            values.append({
+                'recvTime': recv_time.strftime('%Y-%m-%dT%H:%M:%S.') + f'{recv_time.microsecond // 1000:03d}Z',
+                'attrType': 'Number',
+                'attrValue': self.get_value(attr, i),
+            })
+        return values
+
+    def get_value(self, attr, i):
+        if attr == 'x':
+            return math.cos(i / 1000) * (1 + i / self.points)
+        if attr == 'y':
+            return math.sin(i / 1000) * (1 + i / self.points)
+        return i / self.points
+
+
+class FakeCometServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dataset, latency, jitter):
+        super().__init__(address, FakeCometHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+
+class FakeCometHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.count()
+        url = urlparse(self.path)
+        match = PATH.match(url.path)
+        if match is None:
+            self.__send(404, {'error': 'NotFound'})
+            return
+
+        entity_type, entity_id, attr = match.groups()
+        params = parse_qs(url.query)
+        try:
+            limit = int(params['hLimit'][0])
+            offset = int(params.get('hOffset', ['0'])[0])
+            date_from = parser.parse(params['dateFrom'][0]) if 'dateFrom' in params else None
+            date_to = parser.parse(params['dateTo'][0]) if 'dateTo' in params else None
+        except (KeyError, ValueError):
+            self.__send(400, {'error': 'BadRequest'})
+            return
+
+        delay = self.server.latency + random.uniform(-self.server.jitter, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        dataset = self.server.dataset
+        first, end = dataset.get_range(date_from, date_to)
+        values = dataset.get_values(attr, min(first + offset, end), min(first + offset + limit, end))
+        body = {
+            'contextResponses': [{
+                'contextElement': {
+                    'attributes': [{'name': attr, 'values': values}],
+                    'id': entity_id,
+                    'isPattern': False,
+                    'type': entity_type,
+                },
+                'statusCode': {'code': '200', 'reasonPhrase': 'OK'},
+            }]
+        }
+        self.__send(200, body, {'fiware-total-count': str(end - first)})
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(port, points, interval=0.1, latency=0.0, jitter=0.0):
+    """
+    start a fake sth-comet in a daemon thread and return the server.
+    """
+    server = FakeCometServer(('127.0.0.1', port), Dataset(points, interval), latency, jitter)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='a local stand-in of FIWARE STH-Comet')
+    arg_parser.add_argument('--port', type=int, default=8666)
+    arg_parser.add_argument('--points', type=int, default=100000, help='the number of values of each attribute')
+    arg_parser.add_argument('--interval', type=float, default=0.1, help='the seconds between values')
+    arg_parser.add_argument('--latency', type=float, default=0.02, help='the seconds to delay each response')
+    arg_parser.add_argument('--jitter', type=float, default=0.005, help='the max seconds added to or subtracted from latency')
+    args = arg_parser.parse_args()
+
+    server = FakeCometServer(('0.0.0.0', args.port), Dataset(args.points, args.interval), args.latency, args.jitter)
+    end = ORIGIN + timedelta(seconds=args.points * args.interval)
+    print(f'fake sth-comet on port {args.port}, values from {ORIGIN.isoformat()} to {end.isoformat()}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
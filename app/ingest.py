@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+import logging.config
+from logging import getLogger
+
+from src import const
+from src.comet import CometSession, CometClient
+from src.ingest import Ingester
+from src.pager import AdaptivePager
+from src.store import PositionStore
+from src.utils import parse_attrs
+
+logger = getLogger(__name__)
+
+try:
+    with open(const.LOGGING_JSON, "r") as f:
+        logging.config.dictConfig(json.load(f))
+        if (const.LOG_LEVEL in os.environ and
+                os.environ[const.LOG_LEVEL].upper() in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']):
+            for handler in getLogger().handlers:
+                if handler.get_name() in const.TARGET_HANDLERS:
+                    handler.setLevel(getattr(logging, os.environ[const.LOG_LEVEL].upper()))
+except FileNotFoundError:
+    pass
+
+
+if __name__ == '__main__':
+    store = PositionStore(os.environ.get(const.POSITION_STORE_DIR))
+    if not store.is_enabled() or os.environ.get(const.API_VERSION) == 'v1':
+        logger.info('the position store is disabled')
+        sys.exit(0)
+
+    settle_delay = os.environ.get(const.SETTLE_DELAY, const.DEFAULT_SETTLE_DELAY)
+    fetch_limit = int(os.environ.get(const.FETCH_LIMIT, const.DEFAULT_FETCH_LIMIT))
+    session = CometSession(int(os.environ.get(const.COMET_FETCH_CONCURRENCY, const.DEFAULT_COMET_FETCH_CONCURRENCY)),
+                           int(os.environ.get(const.COMET_POOL_MAXSIZE, const.DEFAULT_COMET_POOL_MAXSIZE)),
+                           float(os.environ.get(const.COMET_TIMEOUT, const.DEFAULT_COMET_TIMEOUT)),
+                           int(os.environ.get(const.COMET_RETRY, const.DEFAULT_COMET_RETRY)),
+                           float(os.environ.get(const.COMET_RETRY_BACKOFF, const.DEFAULT_COMET_RETRY_BACKOFF)))
+    client = CometClient(session,
+                         os.environ.get(const.COMET_ENDPOINT),
+                         os.environ.get(const.FIWARE_SERVICE),
+                         os.environ.get(const.FIWARE_SERVICEPATH),
+                         os.environ.get(const.ENTITY_TYPE),
+                         os.environ.get(const.ENTITY_ID),
+                         AdaptivePager(fetch_limit,
+                                       int(os.environ.get(const.FETCH_LIMIT_MIN, fetch_limit)),
+                                       int(os.environ.get(const.FETCH_LIMIT_MAX, fetch_limit)),
+                                       float(os.environ.get(const.FETCH_TARGET_LATENCY, const.DEFAULT_FETCH_TARGET_LATENCY))))
+    ingester = Ingester(store,
+                        client,
+                        parse_attrs(os.environ.get(const.POSITION_ATTRS, const.DEFAULT_COMET_ATTRS)),
+                        float(os.environ.get(const.INGEST_DELAY, settle_delay)),
+                        float(os.environ.get(const.INGEST_BACKFILL, const.DEFAULT_INGEST_BACKFILL)),
+                        float(os.environ.get(const.INGEST_CHUNK, const.DEFAULT_INGEST_CHUNK)),
+                        float(settle_delay))
+    logger.info(f'ingest positions into {store.directory}')
+    ingester.run(float(os.environ.get(const.INGEST_INTERVAL, const.DEFAULT_INGEST_INTERVAL)))
@@ -0,0 +1,45 @@
+'use strict';
+
+const MAGIC = "RPOS";
+const VERSION = 1;
+const HEADER_SIZE = 14;
+const ALIGNMENT = 8;
+
+const unpack = (buffer) => {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic != MAGIC || view.getUint16(4, true) != VERSION) {
+        throw new Error("invalid columnar data");
+    }
+    const numColumns = view.getUint16(6, true);
+    const numPoints = view.getUint32(8, true);
+    const namesLength = view.getUint16(12, true);
+    const names = String.fromCharCode(...new Uint8Array(buffer, HEADER_SIZE, namesLength)).split(",");
+
+    let offset = HEADER_SIZE + namesLength;
+    offset += (ALIGNMENT - offset % ALIGNMENT) % ALIGNMENT;
+
+    const columns = { length: numPoints };
+    for (let i = 0; i < numColumns; ++i) {
+        columns[names[i]] = new Float64Array(buffer, offset, numPoints);
+        offset += numPoints * Float64Array.BYTES_PER_ELEMENT;
+    }
+    return columns;
+};
+
+export default (path, params) => {
+    const url = path + "?" + $.param(Object.assign({ format: "binary" }, params));
+    return fetch(url, { headers: { Accept: "application/octet-stream" } }).then((response) => {
+        if (!response.ok) {
+            throw new Error("status code = " + response.status);
+        }
+        const cursor = response.headers.get("X-Positions-Cursor");
+        return response.arrayBuffer().then((buffer) => {
+            const columns = unpack(buffer);
+            if (cursor !== null) {
+                columns.cursor = cursor;
+            }
+            return columns;
+        });
+    });
+};
@@ -0,0 +1,87 @@
+'use strict';
+
+import { WIDTH, HEIGHT, TrackPainter, getFrames } from "./track";
+
+export default class TrackRenderer {
+    constructor(canvas, workerPath) {
+        canvas.width = WIDTH;
+        canvas.height = HEIGHT;
+        this.id = 0;
+        this.pending = null;
+        this.worker = null;
+        this.painter = null;
+
+        const onProgress = (id, drawn, done) => this.progress(id, drawn, done);
+        if (workerPath && typeof Worker !== "undefined" && typeof canvas.transferControlToOffscreen === "function") {
+            const offscreen = canvas.transferControlToOffscreen();
+            this.worker = new Worker(workerPath);
+            this.worker.onmessage = event => onProgress(event.data.id, event.data.drawn, event.data.done);
+            this.worker.postMessage({ type: "init", canvas: offscreen }, [offscreen]);
+        } else {
+            this.painter = new TrackPainter(canvas.getContext("2d"), getFrames(window), onProgress);
+        }
+    }
+
+    // draw x and y (Float64Array, whose buffers are transferred to the worker) in chunks across animation frames,
+    // and resolve true when all the points are drawn, or false when the rendering is cancelled.
+    render(x, y, domain, onProgress) {
+        this.cancel();
+        const id = ++this.id;
+        return new Promise((resolve) => {
+            this.pending = { id, onProgress, resolve };
+            if (this.worker) {
+                this.worker.postMessage({ type: "render", id, x, y, domain }, [x.buffer, y.buffer]);
+            } else {
+                this.painter.render(id, x, y, domain);
+            }
+        });
+    }
+
+    // draw x and y from the index from at once, joining the line to the point before from.
+    append(x, y, from, domain) {
+        if (this.worker) {
+            this.worker.postMessage({ type: "append", x, y, from, domain }, [x.buffer, y.buffer]);
+        } else {
+            this.painter.append(x, y, from, domain);
+        }
+    }
+
+    isRendering() {
+        return this.pending !== null;
+    }
+
+    progress(id, drawn, done) {
+        if (!this.pending || this.pending.id !== id) {
+            return;
+        }
+        const pending = this.pending;
+        pending.onProgress(drawn);
+        if (done) {
+            this.pending = null;
+            pending.resolve(true);
+        }
+    }
+
+    cancel() {
+        if (!this.pending) {
+            return;
+        }
+        if (this.worker) {
+            this.worker.postMessage({ type: "cancel" });
+        } else {
+            this.painter.cancel();
+        }
+        const pending = this.pending;
+        this.pending = null;
+        pending.resolve(false);
+    }
+
+    clear() {
+        this.cancel();
+        if (this.worker) {
+            this.worker.postMessage({ type: "clear" });
+        } else {
+            this.painter.clear();
+        }
+    }
+}
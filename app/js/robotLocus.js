@@ -1,24 +1,32 @@
 'use strict';
 
-const WIDTH = 700;
-const HEIGHT = 700;
-const MARGIN = 10;
 const TICKS = 10;
 const DELTA = 50;
 const INIT_DOMAIN = 0.1
+const TAIL_INTERVAL = 1000;
 
 import setUpdatetimePicker from "./datetimePicker";
+import fetchPositions from "./positions";
+import TrackRenderer from "./renderer";
+import { WIDTH, HEIGHT, MARGIN } from "./track";
 
 class Locus {
     constructor() {
         this.svg = d3.select("svg#robotLocus")
                      .attr("width", WIDTH)
                      .attr("height", HEIGHT);
-        this.dataset = [];
+        this.renderer = new TrackRenderer(document.querySelector("canvas#robotTrack"), $("input#worker_path").val());
+        this.formatTime = timeFormatter($("input#timezone").val());
+        this.xs = [];
+        this.ys = [];
+        this.status = null;
+        this.statusFrame = null;
+        this.request = null;
         this.setAxes();
     }
 
     setAxes() {
+        this.domain = INIT_DOMAIN;
         this.xScale = d3.scaleLinear()
                         .domain([-1 * INIT_DOMAIN, INIT_DOMAIN])
                         .range([MARGIN, WIDTH - MARGIN]);
@@ -45,45 +53,19 @@ class Locus {
     }
 
     updateAxes(d) {
+        this.domain = d;
         this.xScale.domain([-1 * d, d]);
         this.yScale.domain([-1 * d, d]);
         this.svg.select("g[data-type=xAxis]").call(this.xAxis);
         this.svg.select("g[data-type=yAxis]").call(this.yAxis);
     }
 
-    plot() {
-        this.svg.append("path")
-                .datum(this.dataset)
-                .attr("data-type", "plotpath")
-                .attr("fill", "none")
-                .attr("stroke", "steelblue")
-                .attr("stroke-width", 2)
-                .attr("d", d3.line().x(d => this.xScale(d.x))
-                                    .y(d => this.yScale(d.y)));
-
-        this.svg.append("g")
-                .attr("data-type", "plotcircle")
-                .selectAll("circle")
-                .data(this.dataset)
-                .enter()
-                .append("circle")
-                .attr("cx", d => this.xScale(d.x))
-                .attr("cy", d => this.yScale(d.y))
-                .attr("fill", "steelblue")
-                .attr("r", 1);
-    }
-
     clear() {
-        this.dataset = [];
-        this.svg.selectAll("path[data-type=plotpath]")
-                .data(this.dataset)
-                .exit()
-                .remove();
-        this.svg.selectAll("g[data-type=plotcircle]")
-                .data(this.dataset)
-                .exit()
-                .remove();
+        this.renderer.clear();
+        this.xs = [];
+        this.ys = [];
         this.updateAxes(INIT_DOMAIN);
+        this.status = null;
 
         $("div#point_num").text("");
         $("div#time").text("");
@@ -91,63 +73,158 @@ class Locus {
         $("div#pos_y").text("");
     }
 
+    // update the status text with the latest one at the next animation frame, at most once per frame.
+    showStatus(status) {
+        this.status = status;
+        if (this.statusFrame !== null) {
+            return;
+        }
+        this.statusFrame = requestAnimationFrame(() => {
+            this.statusFrame = null;
+            if (this.status === null) {
+                return;
+            }
+            const { pointNum, time, x, y, theta } = this.status;
+            $("div#point_num").text("point : " + pointNum);
+            $("div#time").text("time : " + this.formatTime(time));
+            if (!isNaN(x)) {
+                $("div#pos_x").text("x : " + String(x));
+            }
+            if (!isNaN(y)) {
+                $("div#pos_y").text("y : " + String(y));
+            }
+            if (!isNaN(theta)) {
+                $("div#pos_theta").text("θ : " + String(theta));
+            }
+        });
+    }
+
     show() {
         toggleButtons(false);
         this.clear();
+        const request = this.request = {};
 
         const path = $("input#path").val();
         const st = $("input#st_datetime_value").val();
         const et = $("input#et_datetime_value").val();
 
-        $.ajax({
-            type: "GET",
-            url: path,
-            data: {
-                st: formatISO8601(new Date(st)),
-                et: formatISO8601(new Date(et))
-            },
-            dataType: 'json'
-        }).done((data) => {
-            $("p#point_num").text("0/" + String(data.length) + " points");
-            if (data.length > 0) {
-                let maxX = Math.max(...data.map(d => d.x).map(x => x ? Math.abs(x) : Number.MIN_VALUE))
-                let maxCeilX = Math.ceil(maxX * 10) / 10;
-
-                let maxY = Math.max(...data.map(d => d.y).map(y => y ? Math.abs(y) : Number.MIN_VALUE))
-                let maxCeilY = Math.ceil(maxY * 10) / 10;
-
-                this.updateAxes(Math.max(maxCeilX, maxCeilY));
-
-                let prev_x = Number.MIN_VALUE;
-                let prev_y = Number.MIN_VALUE;
-
-                for (let i = 0; i < data.length; ++i) {
-                    if (data[i].x != null && data[i].y != null && (data[i].x != prev_x || data[i].y != prev_y)) {
-                        this.dataset.push({
-                            x: data[i].x,
-                            y: data[i].y
-                        });
-                        prev_x = data[i].x
-                        prev_y = data[i].y
-                    }
-                    $("div#point_num").text("point : " + String(i + 1) + "/" + String(data.length));
-                    $("div#time").text("time : " + String(data[i].time));
-                    if (data[i].x != null) {
-                        $("div#pos_x").text("x : " + String(data[i].x));
-                    }
-                    if (data[i].y != null) {
-                        $("div#pos_y").text("y : " + String(data[i].y));
-                    }
-                    if (data[i].theta != null) {
-                        $("div#pos_theta").text("θ : " + String(data[i].theta));
-                    }
+        fetchPositions(path, {
+            st: formatISO8601(new Date(st)),
+            et: formatISO8601(new Date(et))
+        }).then((columns) => {
+            if (this.request !== request) {
+                return;
+            }
+            const length = columns.length;
+            const time = columns.time;
+            const x = columns.x || new Float64Array(length).fill(NaN);
+            const y = columns.y || new Float64Array(length).fill(NaN);
+            const theta = columns.theta || new Float64Array(length).fill(NaN);
+
+            $("div#point_num").text("point : 0/" + String(length));
+            if (length == 0) {
+                toggleButtons(true);
+                return;
+            }
+
+            // the points to be drawn, skipping the points without x or y and the points which do not move
+            const xs = new Float64Array(length);
+            const ys = new Float64Array(length);
+            const indices = new Uint32Array(length);
+            let num = 0;
+            let maxX = Number.MIN_VALUE;
+            let maxY = Number.MIN_VALUE;
+            for (let i = 0; i < length; ++i) {
+                if (x[i]) {
+                    maxX = Math.max(maxX, Math.abs(x[i]));
+                }
+                if (y[i]) {
+                    maxY = Math.max(maxY, Math.abs(y[i]));
+                }
+                if (!isNaN(x[i]) && !isNaN(y[i]) && (num == 0 || x[i] != xs[num - 1] || y[i] != ys[num - 1])) {
+                    xs[num] = x[i];
+                    ys[num] = y[i];
+                    indices[num] = i;
+                    ++num;
+                }
+            }
+            this.updateAxes(Math.max(Math.ceil(maxX * 10) / 10, Math.ceil(maxY * 10) / 10));
+
+            const toStatus = i => ({
+                pointNum: String(i + 1) + "/" + String(length), time: time[i], x: x[i], y: y[i], theta: theta[i]
+            });
+            return this.renderer.render(xs.slice(0, num), ys.slice(0, num), this.domain, (drawn) => {
+                if (drawn > 0) {
+                    this.showStatus(toStatus(indices[drawn - 1]));
+                }
+            }).then((completed) => {
+                if (completed) {
+                    this.showStatus(toStatus(length - 1));
+                    toggleButtons(true);
+                }
+            });
+        }).catch((error) => {
+            console.error("can't get the robot positions", error);
+            if (this.request === request) {
+                toggleButtons(true);
+            }
+        });
+    }
+
+    live() {
+        toggleButtons(false);
+        this.clear();
+        this.tail($("input#path").val(), String(Date.now() / 1000));
+    }
+
+    tail(path, cursor) {
+        this.timer = setTimeout(() => {
+            fetchPositions(path, { since: cursor }).then((columns) => {
+                if (!this.timer) {
+                    return;
                 }
-                this.plot();
+                this.append(columns);
+                this.tail(path, columns.cursor || cursor);
+            }).catch((error) => {
+                console.error("can't get the robot positions", error);
+                if (this.timer) {
+                    this.tail(path, cursor);
+                }
+            });
+        }, TAIL_INTERVAL);
+    }
+
+    append(columns) {
+        const length = columns.length;
+        if (length == 0) {
+            return;
+        }
+        const time = columns.time;
+        const x = columns.x || new Float64Array(length).fill(NaN);
+        const y = columns.y || new Float64Array(length).fill(NaN);
+        const from = this.xs.length;
+        let max = Math.max(this.domain, INIT_DOMAIN);
+        for (let i = 0; i < length; ++i) {
+            if (!isNaN(x[i]) && !isNaN(y[i])) {
+                this.xs.push(x[i]);
+                this.ys.push(y[i]);
+                max = Math.max(max, Math.abs(x[i]), Math.abs(y[i]));
+            }
+        }
+
+        if (max > this.domain || this.renderer.isRendering()) {
+            if (max > this.domain) {
+                this.updateAxes(Math.ceil(max * 10) / 10);
             }
-            toggleButtons(true);
-        }).fail(() => {
-            console.error("can't get the robot positions");
-            toggleButtons(true);
+            this.renderer.render(Float64Array.from(this.xs), Float64Array.from(this.ys), this.domain, () => {});
+        } else if (from < this.xs.length) {
+            const start = Math.max(from - 1, 0);
+            this.renderer.append(Float64Array.from(this.xs.slice(start)), Float64Array.from(this.ys.slice(start)),
+                                 from - start, this.domain);
+        }
+
+        this.showStatus({
+            pointNum: String(this.xs.length), time: time[length - 1], x: x[length - 1], y: y[length - 1], theta: NaN
         });
     }
 
@@ -156,6 +233,8 @@ class Locus {
             clearTimeout(this.timer);
             this.timer = null;
         }
+        this.request = null;
+        this.renderer.cancel();
         toggleButtons(true);
     }
 }
@@ -170,6 +249,32 @@ const toggleButtons = (can_render) => {
     }
 };
 
+// format epoch milliseconds in the TIMEZONE of the server like the "time" of the positions in json, which is
+// the isoformat of python with the microseconds (if any) and the utc offset
+const timeFormatter = (timeZone) => {
+    const formatter = new Intl.DateTimeFormat("en-US", {
+        timeZone: timeZone, hourCycle: "h23", year: "numeric", month: "2-digit", day: "2-digit",
+        hour: "2-digit", minute: "2-digit", second: "2-digit"
+    });
+    const pad = (value, width) => ("000000" + String(value)).substr(-width);
+
+    return (time) => {
+        const microseconds = Math.round(time * 1000);
+        const fraction = ((microseconds % 1000000) + 1000000) % 1000000;
+        const seconds = (microseconds - fraction) / 1000;
+        const parts = {};
+        formatter.formatToParts(new Date(seconds)).forEach(({ type, value }) => { parts[type] = value; });
+        const hour = Number(parts.hour) % 24;
+        const local = Date.UTC(Number(parts.year), Number(parts.month) - 1, Number(parts.day), hour,
+                               Number(parts.minute), Number(parts.second));
+        const offset = Math.round((local - seconds) / 60000);
+
+        return pad(parts.year, 4) + "-" + parts.month + "-" + parts.day + "T" + pad(hour, 2) + ":" + parts.minute +
+               ":" + parts.second + (fraction ? "." + pad(fraction, 6) : "") + (offset < 0 ? "-" : "+") +
+               pad(Math.floor(Math.abs(offset) / 60), 2) + ":" + pad(Math.abs(offset) % 60, 2);
+    };
+};
+
 const formatISO8601 = (date) => {
     let o = date.getTimezoneOffset() / -60;
     let offset = ((0 < o) ? '+' : '-') + ('00' + Math.abs(o)).substr(-2) + ':00';
@@ -196,6 +301,7 @@ $(() => {
 
     const locus = new Locus();
     $("button#show_button").on("click", event => locus.show());
+    $("button#live_button").on("click", event => locus.live());
     $("button#clear_button").on("click", event => locus.clear());
     $("button#stop_button").on("click", event => locus.stop());
 });
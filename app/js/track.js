@@ -0,0 +1,95 @@
+'use strict';
+
+export const WIDTH = 700;
+export const HEIGHT = 700;
+export const MARGIN = 10;
+const COLOR = "steelblue";
+const CHUNK = 2000;
+const FRAME_BUDGET = 8;
+const FRAME_INTERVAL = 16;
+
+const toCanvasX = (x, domain) => MARGIN + (x + domain) / (2 * domain) * (WIDTH - 2 * MARGIN);
+const toCanvasY = (y, domain) => HEIGHT - MARGIN - (y + domain) / (2 * domain) * (HEIGHT - 2 * MARGIN);
+
+export const getFrames = (scope) => {
+    if (typeof scope.requestAnimationFrame === "function") {
+        return {
+            request: callback => scope.requestAnimationFrame(callback),
+            cancel: handle => scope.cancelAnimationFrame(handle)
+        };
+    }
+    return {
+        request: callback => setTimeout(callback, FRAME_INTERVAL),
+        cancel: handle => clearTimeout(handle)
+    };
+};
+
+export const drawTrack = (ctx, x, y, from, to, domain) => {
+    if (from >= to) {
+        return;
+    }
+    ctx.strokeStyle = COLOR;
+    ctx.fillStyle = COLOR;
+    ctx.lineWidth = 2;
+    ctx.lineJoin = "round";
+
+    const start = Math.max(from - 1, 0);
+    ctx.beginPath();
+    ctx.moveTo(toCanvasX(x[start], domain), toCanvasY(y[start], domain));
+    for (let i = start + 1; i < to; ++i) {
+        ctx.lineTo(toCanvasX(x[i], domain), toCanvasY(y[i], domain));
+    }
+    ctx.stroke();
+
+    for (let i = from; i < to; ++i) {
+        ctx.fillRect(toCanvasX(x[i], domain) - 1, toCanvasY(y[i], domain) - 1, 2, 2);
+    }
+};
+
+export class TrackPainter {
+    constructor(ctx, frames, onProgress) {
+        this.ctx = ctx;
+        this.frames = frames;
+        this.onProgress = onProgress;
+        this.frame = null;
+    }
+
+    render(id, x, y, domain) {
+        this.cancel();
+        this.clear();
+        this.id = id;
+        this.x = x;
+        this.y = y;
+        this.domain = domain;
+        this.drawn = 0;
+        this.frame = this.frames.request(() => this.paint());
+    }
+
+    paint() {
+        const start = Date.now();
+        const length = this.x.length;
+        while (this.drawn < length && Date.now() - start < FRAME_BUDGET) {
+            const to = Math.min(this.drawn + CHUNK, length);
+            drawTrack(this.ctx, this.x, this.y, this.drawn, to, this.domain);
+            this.drawn = to;
+        }
+        const done = this.drawn >= length;
+        this.frame = done ? null : this.frames.request(() => this.paint());
+        this.onProgress(this.id, this.drawn, done);
+    }
+
+    append(x, y, from, domain) {
+        drawTrack(this.ctx, x, y, from, x.length, domain);
+    }
+
+    cancel() {
+        if (this.frame !== null) {
+            this.frames.cancel(this.frame);
+            this.frame = null;
+        }
+    }
+
+    clear() {
+        this.ctx.clearRect(0, 0, WIDTH, HEIGHT);
+    }
+}
@@ -0,0 +1,28 @@
+'use strict';
+
+import { TrackPainter, getFrames } from "./track";
+
+let painter = null;
+
+self.onmessage = (event) => {
+    const message = event.data;
+    switch (message.type) {
+        case "init":
+            painter = new TrackPainter(message.canvas.getContext("2d"), getFrames(self),
+                                       (id, drawn, done) => self.postMessage({ id, drawn, done }));
+            break;
+        case "render":
+            painter.render(message.id, message.x, message.y, message.domain);
+            break;
+        case "append":
+            painter.append(message.x, message.y, message.from, message.domain);
+            break;
+        case "cancel":
+            painter.cancel();
+            break;
+        case "clear":
+            painter.cancel();
+            painter.clear();
+            break;
+    }
+};
@@ -7,7 +7,8 @@ from logging import getLogger
 
 from flask import Flask
 
-from src.views import RobotLocusPage, RobotPositionsAPIBase, RobotPositionsAPIv2
+from src.views import (RobotLocusPage, MetricsAPI, RobotPositionsAPIBase, RobotPositionsAPIv1, RobotPositionsAPIv2,
+                       RobotAnalyticsAPI)
 from src import error_handler
 from src import const
 
@@ -27,7 +28,12 @@ app = Flask(__name__)
 app.config.from_pyfile(const.CONFIG_CFG)
 app.add_url_rule('/locus/', view_func=RobotLocusPage.as_view(RobotLocusPage.NAME))
 
-app.add_url_rule('/positions/', view_func=RobotPositionsAPIv2.as_view(RobotPositionsAPIBase.NAME))
+if os.environ.get(const.API_VERSION) == 'v1':
+    app.add_url_rule('/positions/', view_func=RobotPositionsAPIv1.as_view(RobotPositionsAPIBase.NAME))
+else:
+    app.add_url_rule('/positions/', view_func=RobotPositionsAPIv2.as_view(RobotPositionsAPIBase.NAME))
+    app.add_url_rule('/analytics/', view_func=RobotAnalyticsAPI.as_view(RobotAnalyticsAPI.NAME))
+app.add_url_rule('/metrics', view_func=MetricsAPI.as_view(MetricsAPI.NAME))
 app.register_blueprint(error_handler.blueprint)
 
 
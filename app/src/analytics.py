@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def analyze(positions, period, idle_speed, idle_seconds, cell):
+    """
+    return the travel distance, the speed profile, the idle periods and the occupancy heatmap of positions.
+
+    A step is the move from a position to the next one. The distance is the length of the steps on the x-y plane,
+    and the speed of a step is its length over its seconds. The steps are summed into the segments of period
+    seconds by the epoch of their first position. A run of steps slower than idle_speed which lasts idle_seconds
+    or more is an idle period, located at the mean of its positions. The heatmap counts the positions and the
+    seconds of the steps from them in each cell of cell wide, keyed by the lower-left corner of the cell.
+    The positions which lack 'x' or 'y' are dropped.
+
+    The steps are computed by array operations of numpy if it is installed, and by a single pure python loop
+    otherwise. Both give the same result except for the rounding of the sums.
+    """
+    points = [(epoch, point) for epoch, point in positions if 'x' in point and 'y' in point]
+    times = [point['time'] for _, point in points]
+    scan = _scan_arrays if np is not None and len(points) > 1 else _scan
+    summary, segments, idles, bins = scan(points, times, period, idle_speed, idle_seconds, cell)
+
+    if summary['duration'] > 0:
+        summary['mean_speed'] = summary['distance'] / summary['duration']
+    return {
+        'summary': summary,
+        'segments': [{'start': times[first], 'end': times[last], 'count': count, 'distance': distance,
+                      'duration': duration, 'mean_speed': distance / duration if duration > 0 else None,
+                      'max_speed': max_speed}
+                     for first, last, distance, duration, max_speed, count in segments],
+        'idle': idles,
+        'heatmap': {'cell': cell,
+                    'bins': [{'x': cx * cell, 'y': cy * cell, 'count': count, 'seconds': seconds}
+                             for (cx, cy), (count, seconds) in bins]},
+    }
+
+
+def _new_summary(count):
+    return {'count': count, 'distance': 0.0, 'duration': 0.0, 'moving_seconds': 0.0, 'idle_seconds': 0.0,
+            'mean_speed': None, 'max_speed': None}
+
+
+def _scan(points, times, period, idle_speed, idle_seconds, cell):
+    """
+    scan the steps of points one by one.
+    """
+    epochs = array('d', (epoch for epoch, _ in points))
+    xs = array('d', (point['x'] for _, point in points))
+    ys = array('d', (point['y'] for _, point in points))
+
+    summary = _new_summary(len(points))
+    segments = list()
+    idles = list()
+    bins = dict()
+    segment = None
+    run = None
+    for i in range(len(points)):
+        index = math.floor(epochs[i] / period)
+        if segment is None or segment[0] != index:
+            segment = [index, i, i, 0.0, 0.0, None, 0]
+            segments.append(segment)
+        segment[6] += 1
+
+        key = (math.floor(xs[i] / cell), math.floor(ys[i] / cell))
+        occupancy = bins.get(key)
+        if occupancy is None:
+            occupancy = bins[key] = [0, 0.0]
+        occupancy[0] += 1
+
+        if i + 1 == len(points):
+            break
+        seconds = epochs[i + 1] - epochs[i]
+        distance = math.hypot(xs[i + 1] - xs[i], ys[i + 1] - ys[i])
+        speed = distance / seconds if seconds > 0 else None
+        segment[2] = i + 1
+        segment[3] += distance
+        segment[4] += seconds
+        occupancy[1] += seconds
+        summary['distance'] += distance
+        summary['duration'] += seconds
+        if speed is None:
+            continue
+        if segment[5] is None or speed > segment[5]:
+            segment[5] = speed
+        if summary['max_speed'] is None or speed > summary['max_speed']:
+            summary['max_speed'] = speed
+
+        if speed < idle_speed:
+            summary['idle_seconds'] += seconds
+            run = [i, i + 1] if run is None else [run[0], i + 1]
+        else:
+            summary['moving_seconds'] += seconds
+            _close_run(run, epochs, xs, ys, times, idle_seconds, idles)
+            run = None
+    _close_run(run, epochs, xs, ys, times, idle_seconds, idles)
+    return summary, [tuple(segment[1:]) for segment in segments], idles, sorted(bins.items())
+
+
+def _close_run(run, epochs, xs, ys, times, idle_seconds, idles):
+    if run is None:
+        return
+    first, last = run
+    seconds = epochs[last] - epochs[first]
+    if seconds < idle_seconds:
+        return
+    num = last - first + 1
+    idles.append({'start': times[first], 'end': times[last], 'seconds': seconds,
+                  'x': sum(xs[first:last + 1]) / num, 'y': sum(ys[first:last + 1]) / num})
+
+
+def _scan_arrays(points, times, period, idle_speed, idle_seconds, cell):
+    """
+    scan the steps of two or more points by the array operations of numpy.
+    """
+    num = len(points)
+    epochs = np.fromiter((epoch for epoch, _ in points), np.float64, num)
+    xs = np.fromiter((point['x'] for _, point in points), np.float64, num)
+    ys = np.fromiter((point['y'] for _, point in points), np.float64, num)
+
+    seconds = np.diff(epochs)
+    distances = np.hypot(np.diff(xs), np.diff(ys))
+    valid = seconds > 0
+    speeds = np.full(num - 1, -np.inf)
+    np.divide(distances, seconds, out=speeds, where=valid)
+    idle = valid & (speeds < idle_speed)
+    moving = valid & ~idle
+
+    summary = _new_summary(num)
+    summary['distance'] = float(distances.sum())
+    summary['duration'] = float(seconds.sum())
+    summary['idle_seconds'] = float(seconds[idle].sum())
+    summary['moving_seconds'] = float(seconds[moving].sum())
+    if valid.any():
+        summary['max_speed'] = float(speeds.max())
+
+    # a segment starts at each change of the period, and owns the steps from its positions
+    indexes = np.floor(epochs / period)
+    starts = np.flatnonzero(np.concatenate(([True], indexes[1:] != indexes[:-1])))
+    ends = np.append(starts[1:], num)
+    padded_distances = np.append(distances, 0.0)
+    padded_seconds = np.append(seconds, 0.0)
+    padded_speeds = np.append(speeds, -np.inf)
+    segments = list(zip(starts.tolist(),
+                        np.minimum(ends, num - 1).tolist(),
+                        np.add.reduceat(padded_distances, starts).tolist(),
+                        np.add.reduceat(padded_seconds, starts).tolist(),
+                        [None if speed == -np.inf else speed
+                         for speed in np.maximum.reduceat(padded_speeds, starts).tolist()],
+                        (ends - starts).tolist()))
+
+    # the idle steps between two moving steps make a run, skipping the steps of no seconds
+    idles = list()
+    steps = np.flatnonzero(idle)
+    if len(steps) > 0:
+        groups = np.cumsum(moving)[steps]
+        heads = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+        firsts = steps[heads]
+        lasts = steps[np.append(heads[1:], len(steps)) - 1] + 1
+        for first, last in zip(firsts.tolist(), lasts.tolist()):
+            run_seconds = float(epochs[last] - epochs[first])
+            if run_seconds < idle_seconds:
+                continue
+            idles.append({'start': times[first], 'end': times[last], 'seconds': run_seconds,
+                          'x': float(xs[first:last + 1].mean()), 'y': float(ys[first:last + 1].mean())})
+
+    cxs = np.floor(xs / cell).astype(np.int64)
+    cys = np.floor(ys / cell).astype(np.int64)
+    min_cx, min_cy = int(cxs.min()), int(cys.min())
+    height = int(cys.max()) - min_cy + 1
+    if (int(cxs.max()) - min_cx + 1) * height < 2 ** 62:
+        # a cell is numbered in the order of (cx, cy) so that the cells are sorted and counted in one dimension
+        numbers, inverse, counts = np.unique((cxs - min_cx) * height + (cys - min_cy),
+                                             return_inverse=True, return_counts=True)
+        keys = [(number // height + min_cx, number % height + min_cy) for number in numbers.tolist()]
+    else:
+        cells, inverse, counts = np.unique(np.column_stack((cxs, cys)), axis=0,
+                                           return_inverse=True, return_counts=True)
+        keys = [tuple(key) for key in cells.tolist()]
+    occupancy = np.bincount(inverse.reshape(-1)[:-1], weights=seconds, minlength=len(keys))
+    bins = list(zip(keys, zip(counts.tolist(), occupancy.tolist())))
+    return summary, segments, idles, bins
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import io
+import os
+import sys
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from logging import getLogger
+
+from a2wsgi import WSGIMiddleware
+from flask import copy_current_request_context
+from werkzeug.exceptions import HTTPException
+
+from src import const
+from src.comet import IncompleteError
+from src.comet_async import AsyncCometSession, AsyncCometClient
+from src.deadline import DeadlineExceeded
+from src.views import RobotPositionsAPIBase, RobotPositionsAPIv2
+
+logger = getLogger(__name__)
+
+# the query parameters of /positions/ which are served by the flask application in a thread
+SYNC_PARAMS = ('ids', 'since', 'resolution', 'stream', 'bbox')
+
+
+class RobotPositionsAsyncAPI(RobotPositionsAPIv2):
+    """
+    RobotPositionsAPIv2 whose positions between st and et are retrieved on the event loop.
+
+    The positions are shared with RobotPositionsAPIv2 through its position cache. The work bound to the CPU or to
+    the disk (merging, simplifying, serializing and compressing the positions, and flushing the metrics) is done in
+    the default executor of the loop, so that it does not stall the other queries on the loop.
+    """
+    SESSION = AsyncCometSession(
+        int(os.environ.get(const.COMET_FETCH_CONCURRENCY, const.DEFAULT_COMET_FETCH_CONCURRENCY)),
+        int(os.environ.get(const.COMET_ASYNC_MAX_CONNECTIONS, const.DEFAULT_COMET_ASYNC_MAX_CONNECTIONS)),
+        float(os.environ.get(const.COMET_TIMEOUT, const.DEFAULT_COMET_TIMEOUT)),
+        int(os.environ.get(const.COMET_RETRY, const.DEFAULT_COMET_RETRY)),
+        float(os.environ.get(const.COMET_RETRY_BACKOFF, const.DEFAULT_COMET_RETRY_BACKOFF)),
+        RobotPositionsAPIBase.METRICS)
+
+    async def get_async(self):
+        metrics = RobotPositionsAPIBase.METRICS
+        metrics.inc('robot_positions_requests_total')
+        start = time.perf_counter()
+        try:
+            response = await self.__get()
+        except Exception:
+            metrics.inc('robot_positions_errors_total')
+            await self.__run_in_executor(metrics.flush)
+            raise
+        return await self.__run_in_executor(self._finish_response, response, start)
+
+    async def __get(self):
+        self.fields = self._parse_fields()
+        start_dt, end_dt = self._parse_params()
+        max_points, tolerance = self._parse_simplify_params()
+        self._check_planar(max_points, tolerance, None)
+        fmt = self._parse_format()
+        key, response = self._get_cached_response(end_dt, fmt)
+        if response is not None:
+            return response
+
+        headers = dict()
+        with self.timings.measure('fetch'):
+            try:
+                positions = await self.__get_positions(start_dt, end_dt)
+            except DeadlineExceeded as e:
+                key = None
+                positions = self._get_partial_positions(e, None, headers)
+        response = await self.__run_in_request_context(self._make_response, positions, headers, max_points, tolerance,
+                                                       fmt)
+        if key is None or self.incomplete:
+            return response
+        return await self.__run_in_request_context(self._cache_response, key, response)
+
+    async def __get_positions(self, start_dt, end_dt):
+        entity = self._get_entity()
+        cache = RobotPositionsAPIv2.CACHE
+        before, positions, after = await self.__run_in_executor(self._split_by_store, start_dt.timestamp(),
+                                                                end_dt.timestamp())
+        if before:
+            positions = await cache.aget(entity, *before, time.time(), self.__fetch, self.deadline) + positions
+        if after:
+            try:
+                positions = positions + await cache.aget(entity, *after, time.time(), self.__fetch, self.deadline)
+            except DeadlineExceeded as e:
+                raise DeadlineExceeded(positions + e.result, e.resume) from e
+        return positions
+
+    async def __fetch(self, start_ts, end_ts):
+        start_dt = datetime.fromtimestamp(start_ts, self.tz).isoformat()
+        end_dt = datetime.fromtimestamp(end_ts, self.tz).isoformat()
+
+        client = AsyncCometClient(RobotPositionsAsyncAPI.SESSION,
+                                  RobotPositionsAPIv2.ENDPOINT,
+                                  RobotPositionsAPIv2.FIWARE_SERVICE,
+                                  RobotPositionsAPIv2.FIWARE_SERVICEPATH,
+                                  RobotPositionsAPIv2.ENTITY_TYPE,
+                                  RobotPositionsAPIv2.ENTITY_ID,
+                                  RobotPositionsAPIv2.PAGER,
+                                  self.timings,
+                                  self.deadline)
+        try:
+            attrs = await client.fetch(self.fields, start_dt, end_dt, strict=True)
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(await self.__run_in_executor(self._to_positions, e.result), e.resume) from e
+        except IncompleteError as e:
+            self.incomplete = True
+            raise IncompleteError(str(e), await self.__run_in_executor(self._to_positions, e.result)) from e
+        return await self.__run_in_executor(self._to_positions, attrs)
+
+    async def __run_in_executor(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    async def __run_in_request_context(self, fn, *args):
+        # jsonify() and the content negotiation read the request and the application of the calling coroutine
+        return await self.__run_in_executor(copy_current_request_context(fn), *args)
+
+
+class PositionsASGI:
+    """
+    an ASGI application which serves the queries of /positions/ (v2) between st and et on the event loop, and
+    the other requests by the flask application in a pool of threads.
+
+    A query waiting for sth-comet does not hold a thread, so a process can keep many queries in flight while the
+    threads answer /locus/ and the other requests.
+    """
+
+    def __init__(self, flask_app, threads):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.__lifespan(receive, send)
+        elif scope['type'] == 'http' and self.__is_async(scope):
+            await self.__get_positions(scope, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def __is_async(self, scope):
+        if scope['method'] != 'GET':
+            return False
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        if any(name in params for name in SYNC_PARAMS):
+            return False
+        try:
+            endpoint, _ = self.flask_app.url_map.bind('localhost').match(get_path_info(scope), method='GET')
+        except HTTPException:
+            return False
+        view_class = getattr(self.flask_app.view_functions.get(endpoint), 'view_class', None)
+        return view_class is RobotPositionsAPIv2
+
+    async def __get_positions(self, scope, send):
+        app = self.flask_app
+        with app.request_context(build_environ(scope)):
+            try:
+                try:
+                    rv = await RobotPositionsAsyncAPI().get_async()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.process_response(app.make_response(rv))
+            except Exception as e:
+                response = app.make_response(app.handle_exception(e))
+            body = response.get_data()
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await RobotPositionsAsyncAPI.SESSION.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def get_path_info(scope):
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    return path[len(root_path):] if root_path and path.startswith(root_path) else path
+
+
+def build_environ(scope):
+    """
+    return the WSGI environ of a request without body in an ASGI http scope.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': get_path_info(scope),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
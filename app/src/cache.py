@@ -0,0 +1,724 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import errno
+import fcntl
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from logging import getLogger
+
+from src.comet import IncompleteError
+from src.deadline import NO_DEADLINE, DeadlineExceeded
+from src.metrics import Registry
+
+logger = getLogger(__name__)
+
+# the seconds between the attempts to take a lock file until a timeout
+LOCK_POLL_INTERVAL = 0.05
+
+# the seconds for which the access times of the entries read from SQLiteBackend are kept in memory before written
+TOUCH_INTERVAL = 10.0
+
+# the max number of the buckets claimed at once by a request, beyond which the buckets are fetched without claims
+MAX_CLAIMS = 16
+
+
+class Flights:
+    """
+    the keys being fetched in this process. A key is claimed by one thread, and the other threads wait for it.
+    """
+
+    def __init__(self):
+        self.events = dict()
+        self.lock = threading.Lock()
+
+    def claim(self, key):
+        with self.lock:
+            if key in self.events:
+                return False
+            self.events[key] = threading.Event()
+            return True
+
+    def release(self, key):
+        with self.lock:
+            event = self.events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def wait(self, key, timeout=None):
+        """
+        wait until the key is released or timeout seconds pass (forever if timeout is None), and return whether
+        the key is not claimed any more.
+        """
+        with self.lock:
+            event = self.events.get(key)
+        return event is None or event.wait(timeout)
+
+
+class SharedFetches:
+    """
+    the fetches in flight in this process whose results are shared by the identical fetches started while they are
+    in flight, for the positions which are not cached (e.g. the still-open latest bucket).
+    """
+
+    def __init__(self):
+        self.flights = dict()
+        self.lock = threading.Lock()
+
+    def fetch(self, key, fetch, timeout=None):
+        """
+        return the (positions, complete) of fetch() and whether it is shared from another fetch of the key. A fetch
+        which waits for another one longer than timeout seconds, or whose leader fails or returns an incomplete
+        result, calls fetch() by itself.
+        """
+        flight, leader = self.__join(key)
+        if not leader:
+            if flight[0].wait(timeout) and flight[1] is not None:
+                return flight[1], True
+            return fetch(), False
+        try:
+            return self.__share(flight, fetch()), False
+        finally:
+            self.__leave(key, flight)
+
+    async def afetch(self, key, fetch, timeout=None):
+        """
+        the coroutine version of fetch(), where fetch is a coroutine function. The wait for another fetch is run in
+        the default executor of the event loop.
+        """
+        flight, leader = self.__join(key)
+        if not leader:
+            if await asyncio.get_event_loop().run_in_executor(None, flight[0].wait, timeout) and flight[1] is not None:
+                return flight[1], True
+            return await fetch(), False
+        try:
+            return self.__share(flight, await fetch()), False
+        finally:
+            self.__leave(key, flight)
+
+    def __join(self, key):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self.flights[key] = [threading.Event(), None]
+            return flight, True
+
+    def __share(self, flight, result):
+        positions, complete = result
+        result = (list(positions), complete)
+        if complete:
+            flight[1] = result
+        return result
+
+    def __leave(self, key, flight):
+        with self.lock:
+            del self.flights[key]
+        flight[0].set()
+
+
+class MemoryBackend:
+    """
+    an in-process LRU store which holds at most max_points points.
+    """
+
+    def __init__(self, max_points):
+        self.max_points = max_points
+        self.points = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.flights = Flights()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def set(self, key, value):
+        if len(value) > self.max_points:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.points -= len(self.entries.pop(key))
+            self.entries[key] = value
+            self.points += len(value)
+            while self.points > self.max_points:
+                _, evicted = self.entries.popitem(last=False)
+                self.points -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.points = 0
+
+    def claim(self, key):
+        """
+        claim the key to fetch it, and return a function to release the claim, or None if it has been claimed.
+        """
+        if not self.flights.claim(key):
+            return None
+        return lambda: self.flights.release(key)
+
+    def wait(self, key, timeout=None):
+        return self.flights.wait(key, timeout)
+
+    def is_enabled(self):
+        return self.max_points > 0
+
+    def size(self):
+        return self.points
+
+
+class SQLiteBackend:
+    """
+    a store in a local sqlite file which is shared by all worker processes on the same host.
+
+    Each entry is written in one transaction, and the least recently used entries are evicted when the total size
+    of the stored values exceeds max_bytes. A key is claimed across processes by an exclusive flock of its lock file
+    in '<path>.locks', which the kernel releases even if the owner process dies.
+
+    A read does not write the database. The access times of the entries read are kept in memory, and written in one
+    transaction at most once per touch_interval seconds and before the entries are evicted, so the entries read by
+    the other processes in the last touch_interval seconds may be evicted before the ones read earlier.
+    """
+
+    def __init__(self, path, max_bytes, touch_interval=TOUCH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+        self.lock_dir = path + '.locks'
+        self.flights = Flights()
+        self.touched = dict()
+        self.touched_at = time.monotonic()
+        self.touch_lock = threading.Lock()
+
+    def get(self, key):
+        conn = self.__connect()
+        stored_key = self.__key(key)
+        row = conn.execute('SELECT value FROM positions WHERE key = ?', (stored_key, )).fetchone()
+        if row is None:
+            return None
+        self.__touch(conn, stored_key)
+        return json.loads(row[0])
+
+    def contains(self, key):
+        return self.__connect().execute('SELECT 1 FROM positions WHERE key = ?', (self.__key(key), )).fetchone() is not None
+
+    def set(self, key, value):
+        data = json.dumps(value, separators=(',', ':'))
+        if len(data) > self.max_bytes:
+            return
+        conn = self.__connect()
+        evicted = list()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # the entries read recently must not be evicted in the order of their old access times
+            conn.executemany('UPDATE positions SET accessed = MAX(accessed, ?) WHERE key = ?', self.__pop_touched())
+            conn.execute('INSERT OR REPLACE INTO positions (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                         (self.__key(key), data, len(data), time.time()))
+            total = conn.execute('SELECT TOTAL(size) FROM positions').fetchone()[0]
+            if total > self.max_bytes:
+                for evicted_key, size in conn.execute('SELECT key, size FROM positions ORDER BY accessed'):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((evicted_key, ))
+                    total -= size
+                conn.executemany('DELETE FROM positions WHERE key = ?', evicted)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        for evicted_key, in evicted:
+            self.__remove_lock_file(evicted_key)
+
+    def clear(self):
+        self.__pop_touched()
+        self.__connect().execute('DELETE FROM positions')
+
+    def claim(self, key):
+        """
+        claim the key to fetch it, and return a function to release the claim, or None if it has been claimed
+        by another thread or another process. If the lock file can not be taken (e.g. too many open files), the key
+        is claimed only in this process.
+        """
+        if not self.flights.claim(key):
+            return None
+        try:
+            fd = self.__open_lock_file(key)
+        except OSError as e:
+            logger.warning(f'can not open the lock file, key={key}, error={str(e)}')
+            return lambda: self.flights.release(key)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                self.flights.release(key)
+                return None
+            logger.warning(f'can not lock the lock file, key={key}, error={str(e)}')
+            return lambda: self.flights.release(key)
+
+        def release():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            self.flights.release(key)
+        return release
+
+    def wait(self, key, timeout=None):
+        """
+        wait until the key is released by the other threads and processes or timeout seconds pass (forever if timeout
+        is None), and return whether the key is not claimed any more.
+        """
+        until = time.monotonic() + timeout if timeout is not None else None
+        if not self.flights.wait(key, timeout):
+            return False
+        try:
+            fd = self.__open_lock_file(key)
+        except OSError as e:
+            logger.warning(f'can not open the lock file, key={key}, error={str(e)}')
+            return True
+        try:
+            if until is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while not self.__try_lock(fd):
+                    remaining = until - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    time.sleep(min(LOCK_POLL_INTERVAL, remaining))
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return True
+        finally:
+            os.close(fd)
+
+    def __try_lock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+
+    def is_enabled(self):
+        return self.max_bytes > 0
+
+    def size(self):
+        return int(self.__connect().execute('SELECT TOTAL(size) FROM positions').fetchone()[0])
+
+    def __touch(self, conn, stored_key):
+        now = time.monotonic()
+        with self.touch_lock:
+            self.touched[stored_key] = time.time()
+            if now - self.touched_at < self.touch_interval:
+                return
+            self.touched_at = now
+        touched = self.__pop_touched()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('UPDATE positions SET accessed = MAX(accessed, ?) WHERE key = ?', touched)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f'can not write the access times of the position cache, count={len(touched)}, error={str(e)}')
+
+    def __pop_touched(self):
+        """
+        return the access times of the entries read since the last call as (accessed, stored key).
+        """
+        with self.touch_lock:
+            touched = self.touched
+            self.touched = dict()
+        return [(accessed, stored_key) for stored_key, accessed in touched.items()]
+
+    def __connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS positions '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS positions_accessed ON positions (accessed)')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def __key(self, key):
+        return json.dumps(key)
+
+    def __get_lock_path(self, stored_key):
+        return os.path.join(self.lock_dir, hashlib.sha1(stored_key.encode('utf-8')).hexdigest() + '.lock')
+
+    def __open_lock_file(self, key):
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return os.open(self.__get_lock_path(self.__key(key)), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def __remove_lock_file(self, stored_key):
+        try:
+            os.remove(self.__get_lock_path(stored_key))
+        except OSError:
+            pass
+
+
+class PositionCache:
+    """
+    a cache of merged positions, which is keyed by entity and time buckets aligned to bucket_seconds.
+
+    Only the buckets which have already been closed for settle_seconds are cached, because historical samples never
+    change once they have been persisted.
+    The positions are held as a list of (epoch, point) sorted by epoch. A closed bucket which is not cached is
+    claimed in the backend before it is fetched, and the concurrent requests for the same bucket wait for the claim
+    and read the bucket from the backend instead of fetching it again. A request waits no longer than its deadline,
+    and then fetches the bucket by itself. A request holds at most MAX_CLAIMS claims at once, and fetches the other
+    missing buckets without claiming them.
+
+    The buckets which are not closed (and the whole window if the cache is disabled) are not cached, so get() and
+    aget() share the fetch of a run of them only with the identical fetches in flight in this process.
+    The hits, the misses and the coalesced buckets are counted by stats() in this process, and in registry.
+    """
+
+    def __init__(self, backend, bucket_seconds, settle_seconds=0.0, registry=None):
+        self.backend = backend
+        self.bucket_seconds = bucket_seconds
+        self.settle_seconds = settle_seconds
+        self.registry = registry if registry is not None else Registry(None)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+        self.shared = SharedFetches()
+
+    def is_enabled(self):
+        return self.backend.is_enabled() and self.bucket_seconds > 0
+
+    def get(self, entity, start_ts, end_ts, now, fetch, deadline=NO_DEADLINE):
+        """
+        return the positions of iter() as a list. If fetch raises DeadlineExceeded with the positions of a run, it is
+        raised again with the positions of the window before the run and the ones of the run.
+        The missing closed buckets of the window are claimed at first (up to MAX_CLAIMS), because they are fetched
+        at once.
+        """
+        positions = list()
+        try:
+            for position in self.__iter(entity, start_ts, end_ts, now, fetch, deadline, True):
+                positions.append(position)
+        except DeadlineExceeded as e:
+            raise self.__get_partial(positions, e, start_ts, end_ts) from e
+        return positions
+
+    def iter(self, entity, start_ts, end_ts, now, fetch, deadline=NO_DEADLINE):
+        """
+        yield the positions between start_ts and end_ts (inclusive) of the entity in epoch order.
+
+        The buckets which are not cached are retrieved by calling fetch(start_ts, end_ts), which returns an iterable
+        of (epoch, point), for each run of consecutive missing buckets. A missing bucket is fetched as a whole so that
+        it can be cached, except for the still-open latest bucket. The buckets of a run whose fetch raises an exception
+        are not cached. If fetch raises IncompleteError, the positions in its result are yielded but not cached.
+
+        The buckets of a run are claimed just before the run is fetched, because the positions are consumed as slowly
+        as the caller reads them (e.g. a streamed response), and the claims of the buckets far ahead would keep
+        the other requests waiting for them.
+        """
+        return self.__iter(entity, start_ts, end_ts, now, fetch, deadline, False)
+
+    def __iter(self, entity, start_ts, end_ts, now, fetch, deadline, ahead):
+        if not self.is_enabled():
+            if ahead:
+                yield from self.__fetch_shared(entity, fetch, start_ts, end_ts, deadline)[0]
+            else:
+                yield from self.__fetch_run(fetch, start_ts, end_ts)[0]
+            return
+        if start_ts > end_ts:
+            return
+
+        first = math.floor(start_ts / self.bucket_seconds)
+        last = math.floor(end_ts / self.bucket_seconds)
+
+        # the releases of the buckets claimed by this request, which are fetched by this request
+        claims = dict()
+        try:
+            index = first
+            planned = first - 1
+            while index <= last:
+                if index > planned:
+                    waiting, runs, planned = self.__prepare(entity, index, last, now, claims, ahead)
+                run = runs.get(index)
+                if run is None and index in waiting:
+                    run = self.__wait(entity, index, planned, waiting, claims, deadline) or None
+                positions = self.backend.get((entity, index)) if run is None else None
+                if run is None and positions is None:
+                    run = [index]
+                if run is not None:
+                    run_range = self.__get_run_range(run, start_ts, end_ts, now)
+                    if ahead and not self.__is_closed(run[-1], now):
+                        fetched, complete = self.__fetch_shared(entity, fetch, *run_range, deadline)
+                    else:
+                        fetched, complete = self.__fetch_run(fetch, *run_range)
+                    yield from self.__iter_run(entity, run, start_ts, end_ts, now, fetched, complete, claims)
+                    index = run[-1] + 1
+                    continue
+                yield from ((epoch, point) for epoch, point in positions if start_ts <= epoch <= end_ts)
+                index += 1
+        finally:
+            for release in claims.values():
+                release()
+
+    async def aget(self, entity, start_ts, end_ts, now, fetch, deadline=NO_DEADLINE):
+        """
+        the coroutine version of get(), where fetch is a coroutine function which returns a list of (epoch, point).
+        The calls of the backend, which may block on the file or the database, and the waits for the buckets being
+        fetched by other requests are run in the default executor of the event loop.
+        """
+        if not self.is_enabled():
+            try:
+                return (await self.__afetch_shared(entity, fetch, start_ts, end_ts, deadline))[0]
+            except DeadlineExceeded as e:
+                raise self.__get_partial([], e, start_ts, end_ts) from e
+        if start_ts > end_ts:
+            return []
+
+        first = math.floor(start_ts / self.bucket_seconds)
+        last = math.floor(end_ts / self.bucket_seconds)
+
+        loop = asyncio.get_event_loop()
+        claims = dict()
+        result = list()
+        try:
+            waiting, runs, _ = await loop.run_in_executor(None, self.__prepare, entity, first, last, now, claims, True)
+            index = first
+            while index <= last:
+                run = runs.get(index)
+                if run is None and index in waiting:
+                    run = await loop.run_in_executor(
+                        None, self.__wait, entity, index, last, waiting, claims, deadline) or None
+                positions = await loop.run_in_executor(None, self.backend.get, (entity, index)) if run is None else None
+                if run is None and positions is None:
+                    run = [index]
+                if run is not None:
+                    run_range = self.__get_run_range(run, start_ts, end_ts, now)
+                    try:
+                        if self.__is_closed(run[-1], now):
+                            fetched, complete = await self.__afetch_run(fetch, *run_range)
+                        else:
+                            fetched, complete = await self.__afetch_shared(entity, fetch, *run_range, deadline)
+                    except DeadlineExceeded as e:
+                        raise self.__get_partial(result, e, start_ts, end_ts) from e
+                    result.extend(await loop.run_in_executor(
+                        None, list, self.__iter_run(entity, run, start_ts, end_ts, now, fetched, complete, claims)))
+                    index = run[-1] + 1
+                    continue
+                result.extend((epoch, point) for epoch, point in positions if start_ts <= epoch <= end_ts)
+                index += 1
+        finally:
+            for release in claims.values():
+                release()
+        return result
+
+    def clear(self):
+        self.backend.clear()
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            self.coalesced = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'size': self.backend.size()}
+
+    def __get_partial(self, positions, e, start_ts, end_ts):
+        """
+        return DeadlineExceeded with positions followed by the positions of e in the window.
+        """
+        if e.resume is None:
+            return DeadlineExceeded(positions, None)
+        fetched = [(epoch, point) for epoch, point in e.result or [] if start_ts <= epoch <= end_ts]
+        return DeadlineExceeded(positions + fetched, max(start_ts, e.resume))
+
+    def __is_closed(self, index, now):
+        return (index + 1) * self.bucket_seconds <= now - self.settle_seconds
+
+    def __prepare(self, entity, first, last, now, claims, ahead):
+        """
+        return the buckets which are being fetched by another request, the runs of the buckets to be fetched keyed by
+        their first bucket, and the last bucket planned, which is before last if not ahead (see __plan()).
+        """
+        cached, waiting, last = self.__plan(entity, first, last, now, claims, ahead)
+        misses = last - first + 1 - len(cached) - len(waiting)
+        with self.lock:
+            self.hits += len(cached)
+            self.misses += misses
+            self.coalesced += len(waiting)
+        self.registry.inc('position_cache_hits_total', len(cached))
+        self.registry.inc('position_cache_misses_total', misses)
+        self.registry.inc('position_cache_coalesced_total', len(waiting))
+        logger.info(f'position cache, hits={self.hits}, misses={self.misses}, coalesced={self.coalesced}, '
+                    f'size={self.backend.size()}')
+
+        fetched = (i for i in range(first, last + 1) if i not in cached and i not in waiting)
+        return waiting, {run[0]: run for run in self.__split_runs(fetched, now)}, last
+
+    def __plan(self, entity, first, last, now, claims, ahead):
+        """
+        return the closed buckets which are cached, the ones which are being fetched by another request, and the last
+        bucket planned. The other closed buckets are claimed into claims. The buckets are claimed and waited for in
+        time order, so that two requests never wait for each other. If not ahead, the planning stops at the end of
+        the first run of the claimed buckets.
+        """
+        cached = set()
+        waiting = set()
+        for index in range(first, last + 1):
+            key = (entity, index)
+            if not self.__is_closed(index, now):
+                continue
+            if self.backend.contains(key):
+                if not ahead and index - 1 in claims:
+                    return cached, waiting, index - 1
+                cached.add(index)
+                continue
+            if len(claims) >= MAX_CLAIMS:
+                continue
+            release = self.backend.claim(key)
+            if release is None:
+                if not ahead and index - 1 in claims:
+                    return cached, waiting, index - 1
+                waiting.add(index)
+            elif self.backend.contains(key):
+                # the bucket has been stored by the previous owner of the claim
+                release()
+                if not ahead and index - 1 in claims:
+                    return cached, waiting, index - 1
+                cached.add(index)
+            else:
+                claims[index] = release
+        return cached, waiting, last
+
+    def __wait(self, entity, index, last, waiting, claims, deadline):
+        """
+        wait for the consecutive buckets from index which are being fetched by another request until the deadline,
+        and return the ones which have not been stored, e.g. because the fetch of the other request failed or is
+        still in progress at the deadline. They are claimed if possible.
+        """
+        run = list()
+        while index <= last and index in waiting:
+            key = (entity, index)
+            if not self.backend.wait(key, self.__get_timeout(deadline)):
+                logger.warning(f'stop waiting for a bucket being fetched by another request, index={index}')
+            if self.backend.contains(key):
+                break
+            release = self.backend.claim(key) if len(claims) < MAX_CLAIMS else None
+            if release is not None:
+                claims[index] = release
+            run.append(index)
+            index += 1
+        return run
+
+    def __split_runs(self, indexes, now):
+        """
+        yield the runs of consecutive indexes, where the closed buckets and the others are in separate runs so that
+        the runs of the buckets which are not closed are the same for the identical requests.
+        """
+        run = list()
+        for index in indexes:
+            if run and (index != run[-1] + 1 or self.__is_closed(index, now) != self.__is_closed(run[-1], now)):
+                yield run
+                run = list()
+            run.append(index)
+        if run:
+            yield run
+
+    def __get_run_range(self, run, start_ts, end_ts, now):
+        run_start = run[0] * self.bucket_seconds
+        run_end = (run[-1] + 1) * self.bucket_seconds
+        if not self.__is_closed(run[-1], now):
+            run_start = max(run_start, start_ts) if len(run) == 1 else run_start
+            run_end = end_ts
+        return run_start, run_end
+
+    def __fetch_run(self, fetch, run_start, run_end):
+        """
+        return the positions fetched between run_start and run_end, and whether they can be cached.
+        """
+        try:
+            return fetch(run_start, run_end), True
+        except IncompleteError as e:
+            logger.warning(f'the positions are not cached, start_ts={run_start}, end_ts={run_end}, error={str(e)}')
+            return e.result, False
+
+    def __fetch_shared(self, entity, fetch, run_start, run_end, deadline):
+        result, shared = self.shared.fetch((entity, run_start, run_end),
+                                           lambda: self.__fetch_run(fetch, run_start, run_end),
+                                           self.__get_timeout(deadline))
+        self.__count_shared(shared, run_start, run_end)
+        return result
+
+    async def __afetch_shared(self, entity, fetch, run_start, run_end, deadline):
+        result, shared = await self.shared.afetch((entity, run_start, run_end),
+                                                  lambda: self.__afetch_run(fetch, run_start, run_end),
+                                                  self.__get_timeout(deadline))
+        self.__count_shared(shared, run_start, run_end)
+        return result
+
+    def __get_timeout(self, deadline):
+        remaining = deadline.remaining()
+        return max(remaining, 0) if remaining != float('inf') else None
+
+    def __count_shared(self, shared, run_start, run_end):
+        if not shared:
+            return
+        with self.lock:
+            self.coalesced += 1
+        self.registry.inc('position_cache_coalesced_total')
+        logger.info(f'share the positions being fetched by another request, start_ts={run_start}, end_ts={run_end}')
+
+    async def __afetch_run(self, fetch, run_start, run_end):
+        try:
+            return await fetch(run_start, run_end), True
+        except IncompleteError as e:
+            logger.warning(f'the positions are not cached, start_ts={run_start}, end_ts={run_end}, error={str(e)}')
+            return e.result, False
+
+    def __iter_run(self, entity, run, start_ts, end_ts, now, fetched, complete, claims):
+        """
+        yield the fetched positions of the run in the window, storing each closed bucket of the run if complete.
+        """
+        index = run[0]
+        positions = list()
+        for epoch, point in fetched:
+            bucket = math.floor(epoch / self.bucket_seconds)
+            if bucket < index or run[-1] < bucket:
+                continue
+            while index < bucket:
+                self.__store(entity, index, positions if complete else None, now, claims)
+                index += 1
+                positions = list()
+            if self.__is_closed(index, now):
+                positions.append((epoch, point))
+            if start_ts <= epoch <= end_ts:
+                yield epoch, point
+
+        while index <= run[-1]:
+            self.__store(entity, index, positions if complete else None, now, claims)
+            index += 1
+            positions = list()
+
+    def __store(self, entity, index, positions, now, claims):
+        if positions is not None and self.__is_closed(index, now):
+            self.backend.set((entity, index), positions)
+        release = claims.pop(index, None)
+        if release is not None:
+            release()
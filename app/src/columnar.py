@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import struct
+import sys
+from array import array
+
+MAGIC = b'RPOS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIH')
+ALIGNMENT = 8
+
+
+def get_names(positions):
+    """
+    return the attribute names of positions except 'time' in the order of their first appearance.
+    """
+    names = list()
+    seen = {'time'}
+    for _, point in positions:
+        for name in point:
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return names
+
+
+def to_columns(positions):
+    """
+    convert positions to a column-oriented dict like {"time": [...], "x": [...], "y": [...]}.
+    A missing value is None.
+    """
+    names = get_names(positions)
+    columns = {'time': [point['time'] for _, point in positions]}
+    for name in names:
+        columns[name] = [point.get(name) for _, point in positions]
+    return columns
+
+
+def pack(positions):
+    """
+    pack positions to little-endian float64 column buffers.
+
+    layout:
+        magic 'RPOS' (4 bytes), version (uint16), number of columns (uint16), number of points (uint32),
+        length of names (uint16), comma separated column names (ascii), zero padding to 8 bytes boundary,
+        and then the float64 columns in the order of names.
+    The first column is 'time' in epoch milliseconds, and a missing value is NaN.
+    """
+    names = ['time'] + get_names(positions)
+    encoded_names = ','.join(names).encode('ascii')
+    header = HEADER.pack(MAGIC, VERSION, len(names), len(positions), len(encoded_names)) + encoded_names
+    chunks = [header, b'\0' * (-len(header) % ALIGNMENT)]
+
+    nan = float('nan')
+    columns = [array('d', [epoch * 1000.0 for epoch, _ in positions])]
+    for name in names[1:]:
+        columns.append(array('d', [nan if point.get(name) is None else point[name] for _, point in positions]))
+    for column in columns:
+        if sys.byteorder == 'big':
+            column.byteswap()
+        chunks.append(column.tobytes())
+    return b''.join(chunks)
+
+
+def unpack(data):
+    magic, version, num_columns, num_points, names_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('invalid columnar data')
+    offset = HEADER.size
+    names = data[offset:offset + names_length].decode('ascii').split(',')
+    offset += names_length
+    offset += -offset % ALIGNMENT
+
+    columns = dict()
+    for name in names:
+        column = array('d')
+        column.frombytes(data[offset:offset + num_points * 8])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns[name] = column
+        offset += num_points * 8
+    return columns
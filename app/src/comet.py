@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urljoin
+
+from logging import getLogger
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import const
+from src.deadline import NO_DEADLINE, DeadlineExceeded
+from src.merge import parse_microseconds
+from src.metrics import Registry, Timings
+
+logger = getLogger(__name__)
+
+# the offset of the first point in an aggregated document whose origin is the start of the enclosing period
+FIRST_OFFSETS = {'day': 1}
+
+
+class CometError(Exception):
+    pass
+
+
+class IncompleteError(CometError):
+    """
+    raised by the fetches with strict when some attrs can not be retrieved. result holds what is retrieved with
+    the failed attrs left empty, which may be returned but must not be cached.
+    """
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def get_backoff(backoff, attempt, deadline):
+    """
+    return the seconds to wait before the next attempt, which do not pass the deadline.
+    """
+    return max(min(backoff * (2 ** attempt), deadline.remaining()), 0)
+
+
+class CometSession:
+    """
+    a process-wide keep-alive connection pool and worker pool to sth-comet.
+
+    A request which fails by a connection error or by a 5xx response is retried with exponential backoff.
+    The timeout of each attempt is shortened to the deadline of a request, and DeadlineExceeded is raised instead of
+    retrying after the deadline. The round trips and the status codes of requests are recorded to the metrics registry.
+    """
+
+    def __init__(self, concurrency, pool_maxsize, timeout, retry, backoff, registry=None):
+        self.concurrency = concurrency
+        self.registry = registry if registry is not None else Registry(None)
+        self.timeout = timeout
+        self.retry = retry
+        self.backoff = backoff
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.executor = None
+        self.executor_pid = None
+        self.executor_lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self.executor_lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+                self.executor_pid = os.getpid()
+        return self.executor.submit(fn, *args)
+
+    def get(self, url, headers, params, deadline=NO_DEADLINE):
+        attempt = 0
+        while True:
+            timeout = deadline.get_timeout(self.timeout)
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=timeout)
+                self.registry.observe('comet_request_seconds', time.perf_counter() - start)
+                self.registry.inc('comet_requests_total', status=str(response.status_code))
+                if response.status_code < 500 or attempt >= self.retry:
+                    return response
+                logger.warning(f'sth-comet responds {response.status_code}, retry={attempt + 1}/{self.retry}')
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.registry.inc('comet_requests_total', status='error')
+                if deadline.is_passed():
+                    raise DeadlineExceeded(None, None)
+                if attempt >= self.retry:
+                    self.registry.inc('comet_errors_total')
+                    raise CometError(f'can not connect to sth-comet, error={str(e)}')
+                logger.warning(f'can not connect to sth-comet, retry={attempt + 1}/{self.retry}, error={str(e)}')
+            time.sleep(get_backoff(self.backoff, attempt, deadline))
+            attempt += 1
+
+    def stats(self):
+        """
+        return the number of opened connections and the number of sent requests in this process.
+        If requests are much more than connections, connections are reused.
+        """
+        connections = 0
+        requests_num = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            if pool is not None:
+                connections += pool.num_connections
+                requests_num += pool.num_requests
+        return {'connections': connections, 'requests': requests_num}
+
+
+class CometClient:
+    def __init__(self, session, endpoint, fiware_service, fiware_servicepath, entity_type, entity_id, pager,
+                 timings=None, deadline=NO_DEADLINE):
+        self.session = session
+        self.timings = timings if timings is not None else Timings()
+        self.deadline = deadline
+        self.endpoint = endpoint
+        self.fiware_service = fiware_service
+        self.fiware_servicepath = fiware_servicepath
+        self.entity_type = entity_type
+        self.entity_id = entity_id
+        self.pager = pager
+
+    def fetch(self, attrs, start_dt, end_dt, strict=False):
+        """
+        retrieve the values of attrs from sth-comet.
+
+        The first page of every attr is requested at once to learn its fiware-total-count, and then the remaining
+        pages of all attrs are requested in parallel, keeping as many pages in flight as the concurrency of the session.
+        The hLimit of each page is chosen by the pager from the latency of the pages retrieved so far.
+        The values of each attr are returned in recvTime order.
+        If an attr can not be retrieved, an empty list is returned for it, or IncompleteError is raised with the values
+        if strict. If the deadline passes, the pages still pending are cancelled and DeadlineExceeded is raised with the
+        values retrieved so far (see _get_partial()).
+        """
+        def submit(attr, offset, limit):
+            fetch_page = self.__fetch_first_page if offset == 0 else self.__fetch_page
+            return self.session.submit(fetch_page, attr, start_dt, end_dt, offset, limit)
+
+        scheduler = self._schedule_pages(attrs, start_dt, end_dt, strict, submit)
+        try:
+            futures, first_completed = next(scheduler)
+            while True:
+                done, _ = wait(futures, timeout=self._get_wait_timeout(),
+                               return_when=FIRST_COMPLETED if first_completed else ALL_COMPLETED)
+                futures, first_completed = scheduler.send(done)
+        except StopIteration as e:
+            result = e.value
+        finally:
+            scheduler.close()
+
+        stats = self.session.stats()
+        logger.debug(f'sth-comet connection pool, connections={stats["connections"]}, requests={stats["requests"]}')
+        return result
+
+    def _schedule_pages(self, attrs, start_dt, end_dt, strict, submit):
+        """
+        a generator which schedules the pages of fetch() independently of the transport.
+
+        submit(attr, offset, limit) starts to retrieve a page, and returns a future of (fiware-total-count, values,
+        seconds of the round trip), which is a concurrent.futures.Future or an asyncio.Future. The generator yields
+        (futures, first_completed) to wait for, receives the futures done within the deadline, and returns the result
+        of fetch(). The futures still pending are cancelled when it returns or is closed.
+        """
+        errors = list()
+        failed = set()
+        limit = self.pager.get_limit()
+        first_pages = [(attr, submit(attr, 0, limit)) for attr in attrs]
+        pending = dict((future, (attr, 0, limit)) for attr, future in first_pages)
+        try:
+            yield list(pending), False
+
+            pages = dict()
+            cursors = dict()
+            passed = False
+            for attr, future in first_pages:
+                del pending[future]
+                if not future.done():
+                    future.cancel()
+                    passed = True
+                    continue
+                try:
+                    count, values, latency = future.result()
+                except DeadlineExceeded:
+                    passed = True
+                    continue
+                except CometError as e:
+                    logger.error(str(e))
+                    errors.append(e)
+                    failed.add(attr)
+                    continue
+                self.pager.observe(limit, len(values), latency)
+                pages[attr] = [(0, limit, values)]
+                cursors[attr] = [limit, count]
+
+            waiting = list(cursors.keys())
+            while not passed:
+                while len(pending) < self.session.concurrency:
+                    attr = next((attr for attr in waiting if cursors[attr][0] < cursors[attr][1]), None)
+                    if attr is None:
+                        break
+                    offset, count = cursors[attr]
+                    page_limit = self.pager.get_limit(count - offset, self.session.concurrency)
+                    cursors[attr][0] = offset + page_limit
+                    pending[submit(attr, offset, page_limit)] = (attr, offset, page_limit)
+                    # request the attrs in turn
+                    waiting.remove(attr)
+                    waiting.append(attr)
+                if not pending:
+                    break
+
+                done = yield list(pending), True
+                if not done:
+                    passed = True
+                for future in done:
+                    attr, offset, page_limit = pending.pop(future)
+                    if attr not in pages:
+                        continue
+                    try:
+                        _, values, latency = future.result()
+                    except DeadlineExceeded:
+                        passed = True
+                        continue
+                    except CometError as e:
+                        logger.error(str(e))
+                        errors.append(e)
+                        failed.add(attr)
+                        del pages[attr]
+                        waiting.remove(attr)
+                        continue
+                    self.pager.observe(page_limit, len(values), latency)
+                    pages[attr].append((offset, page_limit, values))
+        finally:
+            for future in pending:
+                future.cancel()
+
+        result = self._get_result(attrs, pages, cursors, failed, start_dt, end_dt, passed)
+        if strict and errors:
+            raise IncompleteError(str(errors[0]), result)
+        return result
+
+    def _get_result(self, attrs, pages, cursors, failed, start_dt, end_dt, passed):
+        """
+        return the values of attrs joined from their pages, or raise DeadlineExceeded if the deadline has passed
+        before some pages are retrieved.
+        """
+        if not passed:
+            return {attr: self._join_pages(attr, pages[attr], start_dt, end_dt) if attr in pages else []
+                    for attr in attrs}
+        result, resume = self._get_partial(attrs, pages, cursors, failed, start_dt, end_dt)
+        if resume is None:
+            return result
+        self.session.registry.inc('comet_deadline_exceeded_total')
+        logger.warning(f'the deadline has passed, entity_id={self.entity_id}, start_dt={start_dt}, end_dt={end_dt}, '
+                       f'resume={resume}')
+        raise DeadlineExceeded(result, resume)
+
+    def _get_partial(self, attrs, pages, cursors, failed, start_dt, end_dt):
+        """
+        return the values of attrs which are complete before resume and resume (epoch seconds) from the pages retrieved
+        before the deadline, where resume is None if all the pages have been retrieved.
+
+        The values of an attr are complete up to the first page which is missing, except for the values at the last
+        recvTime, which may continue on the missing page. An attr whose first page is missing is complete before
+        start_dt. The attrs in failed are not retrieved by an error, and are ignored like fetch() without strict.
+        """
+        resume_us = None
+        prefixes = dict()
+        for attr in attrs:
+            if attr in failed:
+                continue
+            prefix = list()
+            next_offset = 0
+            for offset, limit, values in sorted(pages.get(attr, []), key=lambda page: page[0]):
+                if offset != next_offset:
+                    break
+                prefix.append((offset, limit, values))
+                next_offset = offset + limit
+            prefixes[attr] = prefix
+            if attr in cursors and next_offset >= cursors[attr][1]:
+                continue
+            values = prefix[-1][2] if prefix else []
+            until_us = parse_microseconds(values[-1]['recvTime']) if values else parse_microseconds(start_dt)
+            resume_us = until_us if resume_us is None else min(resume_us, until_us)
+
+        result = {attr: [] for attr in attrs}
+        for attr, prefix in prefixes.items():
+            values = self._join_pages(attr, prefix, start_dt, end_dt)
+            if resume_us is not None:
+                values = [value for value in values if parse_microseconds(value['recvTime']) < resume_us]
+            result[attr] = values
+        return result, (resume_us / 1000000 if resume_us is not None else None)
+
+    def _get_wait_timeout(self):
+        remaining = self.deadline.remaining()
+        return max(remaining, 0) if remaining != float('inf') else None
+
+    def fetch_aggregates(self, attrs, resolution, start_dt, end_dt, strict=False):
+        """
+        retrieve the sums of the values of attrs aggregated per resolution (second, minute, hour or day) from sth-comet.
+
+        The aggregated data of each attr is requested at once in parallel without paging, and a list of
+        (microseconds of the start of a period, number of samples, sum) is returned for it in time order.
+        If an attr can not be retrieved, an empty list is returned for it, or IncompleteError is raised with the
+        aggregates if strict. If the deadline passes, DeadlineExceeded is raised with empty lists to be retrieved again
+        from start_dt.
+        """
+        futures = [(attr, self.session.submit(self.__fetch_aggregate, attr, resolution, start_dt, end_dt))
+                   for attr in attrs]
+        _, not_done = wait([future for _, future in futures], timeout=self._get_wait_timeout())
+        for future in not_done:
+            future.cancel()
+
+        result = dict()
+        errors = list()
+        for attr, future in futures:
+            try:
+                if future in not_done:
+                    raise DeadlineExceeded(None, None)
+                result[attr] = future.result()
+            except DeadlineExceeded:
+                self.session.registry.inc('comet_deadline_exceeded_total')
+                raise DeadlineExceeded({attr: [] for attr in attrs}, parse_microseconds(start_dt) / 1000000)
+            except CometError as e:
+                logger.error(str(e))
+                errors.append(e)
+                result[attr] = []
+                continue
+            self._log_retrieved(attr, len(result[attr]), start_dt, end_dt)
+        if strict and errors:
+            raise IncompleteError(str(errors[0]), result)
+        return result
+
+    def iter_values(self, attr, start_dt, end_dt):
+        """
+        yield the values of attr from sth-comet page by page in offset order.
+
+        The first page is requested at once, and then at most as many pages as the concurrency of the session are
+        requested ahead of the page being consumed, so that the memory usage does not depend on the number of pages.
+        CometError is raised when a page can not be retrieved, so that the values are never silently truncated.
+        """
+        limit = self.pager.get_limit()
+        first_page = self.session.submit(self.__fetch_first_page, attr, start_dt, end_dt, 0, limit)
+        return self.__iter_values(attr, start_dt, end_dt, first_page, limit)
+
+    def __iter_values(self, attr, start_dt, end_dt, first_page, limit):
+        pending = deque([(first_page, limit)])
+        limits = list()
+        num = 0
+        try:
+            count, values, latency = first_page.result()
+            pending.popleft()
+            self.pager.observe(limit, len(values), latency)
+            next_offset = limit
+            while len(pending) < self.session.concurrency and next_offset < count:
+                next_offset = self.__submit_page(pending, attr, start_dt, end_dt, next_offset, count)
+            num += len(values)
+            limits.append(limit)
+            yield values
+
+            while pending:
+                future, page_limit = pending.popleft()
+                _, values, latency = future.result()
+                self.pager.observe(page_limit, len(values), latency)
+                if next_offset < count:
+                    next_offset = self.__submit_page(pending, attr, start_dt, end_dt, next_offset, count)
+                num += len(values)
+                limits.append(page_limit)
+                yield values
+        except CometError as e:
+            logger.error(str(e))
+            raise
+        finally:
+            for future, _ in pending:
+                future.cancel()
+        self.session.registry.observe('comet_pages', len(limits))
+        self._log_retrieved(attr, num, start_dt, end_dt, limits)
+
+    def __submit_page(self, pending, attr, start_dt, end_dt, offset, count):
+        limit = self.pager.get_limit(count - offset, self.session.concurrency)
+        pending.append((self.session.submit(self.__fetch_page, attr, start_dt, end_dt, offset, limit), limit))
+        return offset + limit
+
+    def _join_pages(self, attr, pages, start_dt, end_dt):
+        """
+        return the values of the pages of attr, which are (offset, hLimit, values), in recvTime order.
+        """
+        pages.sort(key=lambda page: page[0])
+        values = [value for _, _, page in pages for value in page]
+        values.sort(key=lambda v: v['recvTime'])
+        self.session.registry.observe('comet_pages', len(pages))
+        self._log_retrieved(attr, len(values), start_dt, end_dt, [limit for _, limit, _ in pages])
+        return values
+
+    def _log_retrieved(self, attr, num, start_dt, end_dt, limits=None):
+        pages = f', pages={len(limits)}, hLimit={min(limits)}..{max(limits)}' if limits else ''
+        logger.info(f'retrieve {num} data, entity_type={self.entity_type}, '
+                    f'entity_id={self.entity_id}, attr={attr}, start_dt={start_dt}, end_dt={end_dt}{pages}')
+
+    def __fetch_first_page(self, attr, start_dt, end_dt, offset, limit):
+        attempt = 0
+        while True:
+            count, values, latency = self.__fetch_page(attr, start_dt, end_dt, offset, limit)
+            if self._is_counted(attr, count, values, attempt):
+                return count, values, latency
+            time.sleep(get_backoff(self.session.backoff, attempt, self.deadline))
+            attempt += 1
+
+    def _is_counted(self, attr, count, values, attempt):
+        """
+        return whether the first page of attr has fiware-total-count, or raise CometError if it can not be retried
+        any more. sth-comet may respond 0 as the count of the values which it has not counted yet.
+        """
+        # the window has no value, or sth-comet has counted the values
+        if count > 0 or not values:
+            return True
+        if attempt >= self.session.retry:
+            self.session.registry.inc('comet_errors_total')
+            raise CometError(f'total-count is 0 with {len(values)} data, attr={attr}')
+        logger.warning(f'total-count is 0, retry={attempt + 1}/{self.session.retry}')
+        return False
+
+    def __fetch_page(self, attr, start_dt, end_dt, offset, limit):
+        """
+        return fiware-total-count, the values and the seconds of the round trip of a page.
+        """
+        logger.debug(f'get "{attr}" from {start_dt} to {end_dt}, offset={offset}, limit={limit}')
+        response, values, latency = self.__request(attr, self._get_headers(),
+                                                   self._get_page_params(start_dt, end_dt, offset, limit))
+        count = self._get_total_count(response)
+        logger.debug(f'total-count of {attr} = {count}')
+        logger.debug(f'fetched {len(values)} data of {attr}, offset={offset}, latency={latency:.3f}')
+        return count, values, latency
+
+    def __fetch_aggregate(self, attr, resolution, start_dt, end_dt):
+        logger.debug(f'get "{attr}" aggregated per {resolution} from {start_dt} to {end_dt}')
+        params = {
+            'aggrMethod': 'sum',
+            'aggrPeriod': resolution,
+            'dateFrom': start_dt,
+            'dateTo': end_dt,
+        }
+
+        _, values, _ = self.__request(attr, self._get_headers(), params)
+
+        period = dict(const.AGGREGATE_RESOLUTIONS)[resolution] * 1000000
+        first_offset = FIRST_OFFSETS.get(resolution, 0)
+        aggregates = list()
+        for value in values:
+            origin = parse_microseconds(value['_id']['origin'])
+            for point in value['points']:
+                if point.get('samples', 0) > 0:
+                    aggregates.append((origin + (point['offset'] - first_offset) * period, point['samples'], point['sum']))
+        aggregates.sort(key=lambda aggregate: aggregate[0])
+        return aggregates
+
+    def __request(self, attr, headers, params):
+        """
+        send a request to sth-comet, and return the response, its values and the seconds of the round trip.
+        """
+        start = time.perf_counter()
+        response = self.session.get(self._get_url(attr), headers, params, self.deadline)
+        latency = time.perf_counter() - start
+        return response, self._read_values(response, latency), latency
+
+    def _read_values(self, response, latency):
+        """
+        return the values in a response of sth-comet which took latency seconds.
+        """
+        self.timings.add('comet', latency)
+        if response.status_code != 200:
+            self.session.registry.inc('comet_errors_total')
+            raise CometError(f'can not retrieve data from sth-comet, status_code={response.status_code}, '
+                             f'data={response.text}')
+
+        with self.timings.measure('decode'):
+            values = response.json()["contextResponses"][0]["contextElement"]["attributes"][0]["values"]
+        self.session.registry.inc('comet_rows_total', len(values))
+        self.session.registry.inc('comet_response_bytes_total', len(response.content))
+        return values
+
+    def _get_total_count(self, response):
+        try:
+            return int(response.headers.get('fiware-total-count', '0'))
+        except (ValueError, TypeError) as e:
+            self.session.registry.inc('comet_errors_total')
+            raise CometError(f'invalid fiware-total-count, fiware-total-count={response.headers.get("fiware-total-count")} '
+                             f'error={str(e)}')
+
+    def _get_headers(self):
+        return {
+            'Fiware-Service': self.fiware_service,
+            'Fiware-Servicepath': self.fiware_servicepath,
+        }
+
+    def _get_page_params(self, start_dt, end_dt, offset, limit):
+        return {
+            'hLimit': limit,
+            'hOffset': offset,
+            'dateFrom': start_dt,
+            'dateTo': end_dt,
+            'count': 'true',
+        }
+
+    def _get_url(self, attr):
+        path = os.path.join(const.BASE_PATH,
+                            "type",
+                            self.entity_type,
+                            "id",
+                            self.entity_id,
+                            "attributes",
+                            attr)
+        return urljoin(self.endpoint, path)
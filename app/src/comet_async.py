@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from logging import getLogger
+
+import httpx
+
+from src.comet import CometError, CometClient, get_backoff
+from src.deadline import NO_DEADLINE, DeadlineExceeded
+from src.metrics import Registry
+
+logger = getLogger(__name__)
+
+
+class AsyncCometSession:
+    """
+    a keep-alive connection pool to sth-comet for the coroutines on an event loop.
+
+    No thread is held while a page is in flight, so the pages in flight in a process are bounded only by
+    max_connections, and each request keeps at most concurrency pages in flight. A request which fails by
+    a connection error or by a 5xx response is retried with exponential backoff like CometSession, within the
+    deadline of a request.
+    """
+
+    def __init__(self, concurrency, max_connections, timeout, retry, backoff, registry=None, transport=None):
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retry = retry
+        self.backoff = backoff
+        self.registry = registry if registry is not None else Registry(None)
+        self.transport = transport
+        self.client = None
+
+    def get_client(self):
+        # an AsyncClient is bound to the event loop which uses it first, so it is created in the running loop
+        if self.client is None:
+            self.client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections,
+                                                                max_keepalive_connections=self.max_connections),
+                                            timeout=self.timeout,
+                                            transport=self.transport)
+        return self.client
+
+    async def get(self, url, headers, params, deadline=NO_DEADLINE):
+        attempt = 0
+        while True:
+            timeout = deadline.get_timeout(self.timeout)
+            start = time.perf_counter()
+            try:
+                response = await self.get_client().get(url, headers=headers, params=params, timeout=timeout)
+                self.registry.observe('comet_request_seconds', time.perf_counter() - start)
+                self.registry.inc('comet_requests_total', status=str(response.status_code))
+                if response.status_code < 500 or attempt >= self.retry:
+                    return response
+                logger.warning(f'sth-comet responds {response.status_code}, retry={attempt + 1}/{self.retry}')
+            except httpx.TransportError as e:
+                self.registry.inc('comet_requests_total', status='error')
+                if deadline.is_passed():
+                    raise DeadlineExceeded(None, None)
+                if attempt >= self.retry:
+                    self.registry.inc('comet_errors_total')
+                    raise CometError(f'can not connect to sth-comet, error={str(e)}')
+                logger.warning(f'can not connect to sth-comet, retry={attempt + 1}/{self.retry}, error={str(e)}')
+            await asyncio.sleep(get_backoff(self.backoff, attempt, deadline))
+            attempt += 1
+
+    async def aclose(self):
+        if self.client is not None:
+            client = self.client
+            self.client = None
+            await client.aclose()
+
+
+class AsyncCometClient(CometClient):
+    """
+    a CometClient whose fetch() is a coroutine on an AsyncCometSession.
+    """
+
+    async def fetch(self, attrs, start_dt, end_dt, strict=False):
+        """
+        retrieve the values of attrs from sth-comet like CometClient.fetch() without holding a thread.
+        The pages in flight are cancelled when the deadline passes.
+        """
+        def submit(attr, offset, limit):
+            fetch_page = self.__fetch_first_page if offset == 0 else self.__fetch_page
+            return asyncio.ensure_future(fetch_page(attr, start_dt, end_dt, offset, limit))
+
+        scheduler = self._schedule_pages(attrs, start_dt, end_dt, strict, submit)
+        try:
+            futures, first_completed = next(scheduler)
+            while True:
+                done, _ = await asyncio.wait(futures, timeout=self._get_wait_timeout(),
+                                             return_when=asyncio.FIRST_COMPLETED if first_completed
+                                             else asyncio.ALL_COMPLETED)
+                futures, first_completed = scheduler.send(done)
+        except StopIteration as e:
+            return e.value
+        finally:
+            scheduler.close()
+
+    async def __fetch_first_page(self, attr, start_dt, end_dt, offset, limit):
+        attempt = 0
+        while True:
+            count, values, latency = await self.__fetch_page(attr, start_dt, end_dt, offset, limit)
+            if self._is_counted(attr, count, values, attempt):
+                return count, values, latency
+            await asyncio.sleep(get_backoff(self.session.backoff, attempt, self.deadline))
+            attempt += 1
+
+    async def __fetch_page(self, attr, start_dt, end_dt, offset, limit):
+        """
+        return fiware-total-count, the values and the seconds of the round trip of a page.
+        """
+        logger.debug(f'get "{attr}" from {start_dt} to {end_dt}, offset={offset}, limit={limit}')
+        start = time.perf_counter()
+        response = await self.session.get(self._get_url(attr), self._get_headers(),
+                                          self._get_page_params(start_dt, end_dt, offset, limit), self.deadline)
+        latency = time.perf_counter() - start
+        values = self._read_values(response, latency)
+        count = self._get_total_count(response)
+        logger.debug(f'fetched {len(values)} data of {attr}, offset={offset}, total-count={count}, latency={latency:.3f}')
+        return count, values, latency
@@ -20,6 +20,7 @@ MONGODB_REPLICASET = 'MONGODB_REPLICASET'
 MONGODB_DATABASE = 'MONGODB_DATABASE'
 MONGODB_COLLECTION = 'MONGODB_COLLECTION'
 CYGNUS_MONGO_ATTR_PERSISTENCE = 'CYGNUS_MONGO_ATTR_PERSISTENCE'
+MONGODB_CREATE_INDEX = 'MONGODB_CREATE_INDEX'
 API_VERSION = 'API_VERSION'
 COMET_ENDPOINT = 'COMET_ENDPOINT'
 FIWARE_SERVICE = 'FIWARE_SERVICE'
@@ -27,7 +28,116 @@ FIWARE_SERVICEPATH = 'FIWARE_SERVICEPATH'
 ENTITY_TYPE = 'ENTITY_TYPE'
 ENTITY_ID = 'ENTITY_ID'
 FETCH_LIMIT = 'FETCH_LIMIT'
+FETCH_LIMIT_MIN = 'FETCH_LIMIT_MIN'
+FETCH_LIMIT_MAX = 'FETCH_LIMIT_MAX'
+FETCH_TARGET_LATENCY = 'FETCH_TARGET_LATENCY'
+COMET_FETCH_CONCURRENCY = 'COMET_FETCH_CONCURRENCY'
+COMET_POOL_MAXSIZE = 'COMET_POOL_MAXSIZE'
+COMET_TIMEOUT = 'COMET_TIMEOUT'
+COMET_RETRY = 'COMET_RETRY'
+COMET_RETRY_BACKOFF = 'COMET_RETRY_BACKOFF'
+POSITION_CACHE_SIZE = 'POSITION_CACHE_SIZE'
+POSITION_CACHE_BUCKET = 'POSITION_CACHE_BUCKET'
+POSITION_CACHE_PATH = 'POSITION_CACHE_PATH'
+POSITION_CACHE_MAX_BYTES = 'POSITION_CACHE_MAX_BYTES'
+TAIL_INTERVAL = 'TAIL_INTERVAL'
+TAIL_RETENTION = 'TAIL_RETENTION'
+BATCH_MAX_ENTITIES = 'BATCH_MAX_ENTITIES'
+POSITION_ATTRS = 'POSITION_ATTRS'
+AGGREGATE_MAX_POINTS = 'AGGREGATE_MAX_POINTS'
+METRICS_DIR = 'METRICS_DIR'
+METRICS_FLUSH_INTERVAL = 'METRICS_FLUSH_INTERVAL'
+SERVER_TIMING = 'SERVER_TIMING'
+COMET_ASYNC_MAX_CONNECTIONS = 'COMET_ASYNC_MAX_CONNECTIONS'
+ASGI_WSGI_THREADS = 'ASGI_WSGI_THREADS'
+POSITION_STORE_DIR = 'POSITION_STORE_DIR'
+INGEST_INTERVAL = 'INGEST_INTERVAL'
+INGEST_DELAY = 'INGEST_DELAY'
+INGEST_BACKFILL = 'INGEST_BACKFILL'
+INGEST_CHUNK = 'INGEST_CHUNK'
+LOD_BASE = 'LOD_BASE'
+LOD_LEVELS = 'LOD_LEVELS'
+LOD_BUCKET = 'LOD_BUCKET'
+LOD_CACHE_SIZE = 'LOD_CACHE_SIZE'
+RESPONSE_CACHE_SIZE = 'RESPONSE_CACHE_SIZE'
+RESPONSE_MAX_AGE = 'RESPONSE_MAX_AGE'
+REQUEST_DEADLINE = 'REQUEST_DEADLINE'
+SETTLE_DELAY = 'SETTLE_DELAY'
+ANALYTICS_IDLE_SPEED = 'ANALYTICS_IDLE_SPEED'
+ANALYTICS_IDLE_SECONDS = 'ANALYTICS_IDLE_SECONDS'
+ANALYTICS_CELL = 'ANALYTICS_CELL'
+
+# default parameters of cygnus
+DEFAULT_CYGNUS_MONGO_ATTR_PERSISTENCE = 'row'
+DEFAULT_MONGODB_CREATE_INDEX = 'false'
+DEFAULT_MONGO_ATTRS = 'x,y,theta'
 
 # default parameters of comet
 BASE_PATH = 'STH/v1/contextEntities/'
 DEFAULT_FETCH_LIMIT = '128'
+DEFAULT_FETCH_TARGET_LATENCY = '0.5'
+DEFAULT_COMET_ATTRS = 'x,y'
+
+# resolutions of aggregated data of comet and their seconds
+AGGREGATE_RESOLUTIONS = (('second', 1), ('minute', 60), ('hour', 3600), ('day', 86400))
+DEFAULT_AGGREGATE_MAX_POINTS = '2000'
+DEFAULT_COMET_FETCH_CONCURRENCY = '4'
+DEFAULT_COMET_POOL_MAXSIZE = '8'
+DEFAULT_COMET_TIMEOUT = '10.0'
+DEFAULT_COMET_RETRY = '3'
+DEFAULT_COMET_RETRY_BACKOFF = '0.1'
+
+# default parameters of live tailing
+DEFAULT_TAIL_INTERVAL = '1.0'
+DEFAULT_TAIL_RETENTION = '60.0'
+
+# default max number of entities in a batch request
+DEFAULT_BATCH_MAX_ENTITIES = '30'
+
+# default parameters of metrics
+DEFAULT_METRICS_DIR = '/tmp/fiware-robot-visualization-metrics'
+DEFAULT_METRICS_FLUSH_INTERVAL = '1.0'
+DEFAULT_SERVER_TIMING = 'false'
+MIMETYPE_METRICS = 'text/plain; version=0.0.4; charset=utf-8'
+
+# mimetypes of positions
+MIMETYPE_JSON = 'application/json'
+MIMETYPE_BINARY = 'application/octet-stream'
+
+# number of points in a chunk of streaming response
+STREAM_CHUNK_POINTS = 256
+
+# default parameters of position cache
+DEFAULT_POSITION_CACHE_SIZE = '200000'
+DEFAULT_POSITION_CACHE_BUCKET = '3600'
+DEFAULT_POSITION_CACHE_MAX_BYTES = '268435456'
+
+# default parameters of the asgi application
+DEFAULT_COMET_ASYNC_MAX_CONNECTIONS = '100'
+DEFAULT_ASGI_WSGI_THREADS = '8'
+
+# default parameters of the ingestion into the local position store
+DEFAULT_INGEST_INTERVAL = '5.0'
+DEFAULT_INGEST_BACKFILL = '86400'
+DEFAULT_INGEST_CHUNK = '3600'
+
+# default parameters of the levels of detail of viewport queries
+DEFAULT_LOD_BASE = '0.01'
+DEFAULT_LOD_LEVELS = '16'
+DEFAULT_LOD_BUCKET = '3600'
+DEFAULT_LOD_CACHE_SIZE = '1000000'
+DEFAULT_VIEWPORT_PX = '700'
+
+# default parameters of the responses of closed windows
+DEFAULT_RESPONSE_CACHE_SIZE = '67108864'
+DEFAULT_RESPONSE_MAX_AGE = '86400'
+# default seconds after which the samples of a window are regarded as persisted by comet, so that it can be cached
+DEFAULT_SETTLE_DELAY = '60.0'
+
+# default seconds within which a request to /positions/ retrieves the positions (shorter than harakiri of uwsgi)
+DEFAULT_REQUEST_DEADLINE = '50.0'
+
+# default parameters of the trajectory analytics
+DEFAULT_ANALYTICS_IDLE_SPEED = '0.05'
+DEFAULT_ANALYTICS_IDLE_SECONDS = '10.0'
+DEFAULT_ANALYTICS_CELL = '0.5'
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import time
+
+
+class Deadline:
+    """
+    the time by which a request should be answered, which bounds all the requests to the backend made for it.
+    A deadline of 0 seconds or less never passes.
+    """
+
+    def __init__(self, seconds):
+        self.at = time.monotonic() + seconds if seconds > 0 else float('inf')
+
+    def remaining(self):
+        return self.at - time.monotonic()
+
+    def is_passed(self):
+        return self.remaining() <= 0
+
+    def get_timeout(self, timeout):
+        """
+        return timeout shortened to the remaining seconds, or raise DeadlineExceeded if the deadline has passed.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(None, None)
+        return min(timeout, remaining)
+
+
+class DeadlineExceeded(Exception):
+    """
+    raised when the deadline passes before all the data is retrieved.
+
+    result holds the data retrieved so far, which is complete before resume (epoch seconds), so the data from
+    resume should be retrieved by another request. result and resume are None if nothing can be returned.
+    """
+
+    def __init__(self, result, resume):
+        super().__init__(f'the deadline has passed, resume={resume}')
+        self.result = result
+        self.resume = resume
+
+
+# the deadline of the requests which are not bounded
+NO_DEADLINE = Deadline(0)
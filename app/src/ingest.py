@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import timedelta
+
+from logging import getLogger
+
+import pytz
+
+from src import merge
+from src.comet import CometError
+
+logger = getLogger(__name__)
+
+
+class Ingester:
+    """
+    pull the new positions of an entity from sth-comet into a PositionStore.
+
+    Each pass retrieves the positions from the end of the store up to delay seconds before now, at most chunk
+    seconds at once, so that the values being persisted by sth-comet are not skipped. The positions of the last
+    settle seconds before now may still be persisted, so they are read again before a chunk reaching them is
+    committed, and the chunk is left to the next pass if the two reads differ. An empty store starts from backfill
+    seconds before now, and a store of another entity or other attrs is reset.
+    """
+
+    def __init__(self, store, client, attrs, delay, backfill, chunk, settle=0.0):
+        self.store = store
+        self.client = client
+        self.attrs = attrs
+        self.delay = delay
+        self.backfill = backfill
+        self.chunk = chunk
+        self.settle = settle
+        self.converter = merge.TimeConverter(pytz.utc)
+
+    def run(self, interval):
+        while True:
+            try:
+                self.ingest(time.time())
+            except CometError as e:
+                logger.error(f'can not ingest positions, error={str(e)}')
+            time.sleep(interval)
+
+    def ingest(self, now):
+        """
+        ingest the positions up to delay seconds before now, and return the number of ingested positions.
+        """
+        entity = (self.client.entity_type, self.client.entity_id)
+        until_us = int((now - self.delay) * 1000000)
+        if self.store.get_range(entity, self.attrs) is None:
+            meta = self.store.get_meta()
+            if meta is None or meta['entity'] != list(entity) or meta['attrs'] != list(self.attrs):
+                self.store.reset(entity, self.attrs, int((now - self.backfill) * 1000000))
+
+        num = 0
+        while True:
+            end_us = self.store.get_meta()['end']
+            if end_us >= until_us:
+                return num
+            start_us = end_us + 1
+            chunk_end_us = min(until_us, start_us + int(self.chunk * 1000000))
+            ingested = self.__ingest_chunk(start_us, chunk_end_us, now)
+            if ingested is None:
+                return num
+            num += ingested
+
+    def __ingest_chunk(self, start_us, end_us, now):
+        """
+        commit the positions between start_us and end_us, and return their number, or None if they are not settled.
+        """
+        rows = self.__read(start_us, end_us)
+        settle_us = max(start_us, int((now - self.settle) * 1000000))
+        if settle_us <= end_us:
+            unsettled = [row for row in rows if row[0] >= settle_us]
+            if self.__read(settle_us, end_us) != unsettled:
+                logger.info(f'the positions are still being persisted, start_dt={self.__to_isoformat(settle_us)}, '
+                            f'end_dt={self.__to_isoformat(end_us)}')
+                return None
+
+        micros = [microseconds for microseconds, _ in rows]
+        columns = [list(column) for column in zip(*(values for _, values in rows))] if rows else \
+            [[] for _ in self.attrs]
+        self.store.append(micros, columns, end_us)
+        logger.info(f'ingest {len(micros)} positions, start_dt={self.__to_isoformat(start_us)}, '
+                    f'end_dt={self.__to_isoformat(end_us)}')
+        return len(micros)
+
+    def __read(self, start_us, end_us):
+        """
+        return the rows of (microseconds, values of attrs) between start_us and end_us.
+        """
+        attr_values = self.client.fetch(self.attrs, self.__to_isoformat(start_us), self.__to_isoformat(end_us),
+                                        strict=True)
+        epochs, _, columns = merge.join(self.converter, [attr_values[attr] for attr in self.attrs])
+        rows = list()
+        for epoch, values in zip(epochs, zip(*columns)):
+            microseconds = int(round(epoch * 1000000))
+            if start_us <= microseconds <= end_us:
+                rows.append((microseconds, values))
+        return rows
+
+    def __to_isoformat(self, microseconds):
+        return pytz.utc.localize(merge.EPOCH + timedelta(microseconds=microseconds)).isoformat()
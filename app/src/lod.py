@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import math
+from array import array
+
+# the number of cells of a level along a side of a tile of its spatial index
+TILE_CELLS = 64
+
+
+class LODPyramid:
+    """
+    the levels of detail of a series of positions, which are thinned to the cells of a grid of each level.
+
+    The cells of level k are base * 2 ** k wide, and a position is kept at level k if it is in another cell than
+    the previous kept position, so that a level keeps the shape of the path at the resolution of its cells.
+    The kept positions of each level are indexed by the tiles of TILE_CELLS cells which contain them.
+    The positions which lack 'x' or 'y' are dropped.
+    """
+
+    def __init__(self, positions, base, levels):
+        self.positions = [(epoch, point) for epoch, point in positions if 'x' in point and 'y' in point]
+        self.base = base
+        self.xs = array('d', (point['x'] for _, point in self.positions))
+        self.ys = array('d', (point['y'] for _, point in self.positions))
+        self.levels = [self.__build_level(base * 2 ** k) for k in range(levels)]
+
+    def __len__(self):
+        return len(self.positions) + sum(len(kept) for kept, _ in self.levels)
+
+    def get_level(self, pixel):
+        """
+        return the finest level whose cells are not smaller than a pixel of pixel wide.
+        """
+        if pixel <= self.base:
+            return 0
+        return min(len(self.levels) - 1, int(math.floor(math.log2(pixel / self.base))))
+
+    def query(self, bbox, level):
+        """
+        return the positions of level in bbox (min_x, min_y, max_x, max_y) in epoch order, with the previous and
+        the next positions of the level so that the path can be drawn across the edges of bbox.
+        """
+        kept, tiles = self.levels[level]
+        size = self.base * 2 ** level * TILE_CELLS
+        min_x, min_y, max_x, max_y = bbox
+        first_tx, last_tx = int(math.floor(min_x / size)), int(math.floor(max_x / size))
+        first_ty, last_ty = int(math.floor(min_y / size)), int(math.floor(max_y / size))
+        if (last_tx - first_tx + 1) * (last_ty - first_ty + 1) <= len(tiles):
+            candidates = (tiles.get((tx, ty), ()) for tx in range(first_tx, last_tx + 1)
+                          for ty in range(first_ty, last_ty + 1))
+        else:
+            candidates = (js for (tx, ty), js in tiles.items()
+                          if first_tx <= tx <= last_tx and first_ty <= ty <= last_ty)
+
+        xs, ys = self.xs, self.ys
+        selected = set()
+        for js in candidates:
+            for j in js:
+                i = kept[j]
+                if min_x <= xs[i] <= max_x and min_y <= ys[i] <= max_y:
+                    selected.update((j - 1, j, j + 1))
+        return [self.positions[kept[j]] for j in sorted(selected) if 0 <= j < len(kept)]
+
+    def __build_level(self, cell):
+        kept = array('l')
+        tiles = dict()
+        last = None
+        for i, (x, y) in enumerate(zip(self.xs, self.ys)):
+            cx, cy = int(math.floor(x / cell)), int(math.floor(y / cell))
+            if (cx, cy) == last:
+                continue
+            last = (cx, cy)
+            tiles.setdefault((cx // TILE_CELLS, cy // TILE_CELLS), array('l')).append(len(kept))
+            kept.append(i)
+        return kept, tiles
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import re
+from datetime import date, datetime, timedelta
+
+from dateutil import parser
+import pytz
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+OFFSET_BLOCK = 900
+ISO8601 = re.compile(r'(\d{4}-\d{2}-\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:\d{2})$')
+DAYS = dict()
+
+
+class TimeConverter:
+    """
+    convert recvTime strings of sth-comet to epoch seconds and to isoformat strings in a timezone.
+
+    The fixed format of sth-comet (like '2018-01-02T03:04:05.678Z') is parsed by a regular expression, and the other
+    formats are parsed by dateutil. The utc offset of the timezone is looked up once per 15 minutes block, because
+    a timezone never changes its offset in the middle of a block.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.offsets = dict()
+
+    def convert(self, recv_times):
+        epochs = list()
+        times = list()
+        for recv_time in recv_times:
+            epoch, time = self.convert_one(recv_time)
+            epochs.append(epoch)
+            times.append(time)
+        return epochs, times
+
+    def convert_one(self, recv_time):
+        return self.convert_microseconds(parse_microseconds(recv_time))
+
+    def convert_datetime(self, dt):
+        """
+        convert a naive datetime in utc (like recvTime of cygnus stored in mongodb).
+        """
+        return self.convert_microseconds((dt - EPOCH) // timedelta(microseconds=1))
+
+    def convert_microseconds(self, microseconds):
+        block = microseconds // (OFFSET_BLOCK * 1000000)
+        if block not in self.offsets:
+            self.offsets[block] = self.__get_offset(microseconds)
+        offset, suffix = self.offsets[block]
+        local = EPOCH + timedelta(microseconds=microseconds + offset)
+        return microseconds / 1000000, local.isoformat() + suffix
+
+    def __get_offset(self, microseconds):
+        dt = pytz.utc.localize(EPOCH + timedelta(microseconds=microseconds)).astimezone(self.tz)
+        isoformat = dt.isoformat()
+        suffix = isoformat[len(dt.replace(tzinfo=None).isoformat()):]
+        return dt.utcoffset() // timedelta(microseconds=1), suffix
+
+
+def parse_microseconds(text):
+    """
+    parse an ISO 8601 string to microseconds since the unix epoch.
+    """
+    match = ISO8601.match(text)
+    if match is not None:
+        ymd, hour, minute, second, fraction, zone = match.groups()
+        days = DAYS.get(ymd)
+        if days is None:
+            days = DAYS.setdefault(ymd, date(int(ymd[0:4]), int(ymd[5:7]), int(ymd[8:10])).toordinal() - EPOCH_ORDINAL)
+        seconds = days * 86400 + int(hour) * 3600 + int(minute) * 60 + int(second)
+        if zone != 'Z':
+            sign = 1 if zone[0] == '+' else -1
+            seconds -= sign * (int(zone[1:3]) * 3600 + int(zone[4:6]) * 60)
+        return seconds * 1000000 + (int(fraction[:6].ljust(6, '0')) if fraction else 0)
+
+    dt = parser.parse(text)
+    if dt.tzinfo is None:
+        dt = pytz.utc.localize(dt)
+    return (dt - pytz.utc.localize(EPOCH)) // timedelta(microseconds=1)
+
+
+def join(converter, attr_values):
+    """
+    join the values of attrs sorted by recvTime in one pass, and return the columns of epoch, time and each attr.
+
+    attr_values is a list of the values of each attr. The positions are made from the first attr, and the value of
+    another attr is None if it has no value with the same recvTime. If an attr has several values with the same
+    recvTime, the last value is used.
+    """
+    primary = attr_values[0]
+    others = [([v['recvTime'] for v in values], [float(v['attrValue']) for v in values]) for values in attr_values[1:]]
+    indexes = [0] * len(others)
+
+    recv_times = list()
+    columns = [list() for _ in attr_values]
+    primary_column = columns[0]
+    for v in primary:
+        recv_time = v['recvTime']
+        if recv_times and recv_times[-1] == recv_time:
+            primary_column[-1] = float(v['attrValue'])
+            continue
+        recv_times.append(recv_time)
+        primary_column.append(float(v['attrValue']))
+
+        for k, (other_times, other_columns) in enumerate(others):
+            j = indexes[k]
+            num = len(other_times)
+            while j < num and other_times[j] < recv_time:
+                j += 1
+            value = None
+            while j < num and other_times[j] == recv_time:
+                value = other_columns[j]
+                j += 1
+            indexes[k] = j
+            columns[k + 1].append(value)
+
+    epochs, times = converter.convert(recv_times)
+    return epochs, times, columns
+
+
+def to_positions(attrs, epochs, times, columns):
+    positions = list()
+    for epoch, time, values in zip(epochs, times, zip(*columns)):
+        point = {'time': time}
+        for attr, value in zip(attrs, values):
+            if value is not None:
+                point[attr] = value
+        positions.append((epoch, point))
+    return positions
+
+
+def to_mean_positions(converter, attrs, attr_aggregates, period, start_ts, end_ts):
+    """
+    make a position per period from the means of the aggregated values of attrs.
+
+    attr_aggregates is a list of (microseconds of the start of a period, number of samples, sum) of each attr.
+    The positions are made from the periods of period seconds of the first attr which overlap start_ts to end_ts,
+    and the time of a position is the start of its period.
+    """
+    means = [{start: total / samples for start, samples, total in aggregates} for aggregates in attr_aggregates[1:]]
+    start_us = (start_ts - period) * 1000000
+    end_us = end_ts * 1000000
+
+    positions = list()
+    for start, samples, total in attr_aggregates[0]:
+        if not start_us < start <= end_us:
+            continue
+        epoch, time = converter.convert_microseconds(start)
+        point = {'time': time, attrs[0]: total / samples}
+        for attr, attr_means in zip(attrs[1:], means):
+            if start in attr_means:
+                point[attr] = attr_means[start]
+        positions.append((epoch, point))
+    return positions
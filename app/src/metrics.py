@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+import atexit
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAGE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# the snapshot of a process keyed by its pid and its start time in microseconds
+SNAPSHOT_PATTERN = re.compile(r'metrics-(\d+)-(\d+)\.json')
+TOTALS_FILE = 'totals.json'
+LOCK_FILE = 'metrics.lock'
+
+# name: (type, help, buckets of histogram)
+METRICS = OrderedDict([
+    ('robot_positions_requests_total', ('counter', 'the number of requests to /positions/', None)),
+    ('robot_positions_errors_total', ('counter', 'the number of failed requests to /positions/', None)),
+    ('robot_positions_rows_total', ('counter', 'the number of positions returned from /positions/', None)),
+    ('robot_positions_response_bytes_total', ('counter', 'the bytes of responses of /positions/ (not streamed)', None)),
+    ('robot_positions_not_modified_total', ('counter', 'the number of requests to /positions/ answered by 304', None)),
+    ('robot_positions_cached_responses_total', ('counter', 'the number of responses of /positions/ served from the cache',
+                                                None)),
+    ('robot_positions_partial_total', ('counter', 'the number of partial responses of /positions/', None)),
+    ('robot_analytics_requests_total', ('counter', 'the number of requests to /analytics/', None)),
+    ('robot_analytics_errors_total', ('counter', 'the number of failed requests to /analytics/', None)),
+    ('robot_positions_phase_seconds', ('histogram', 'the seconds of each phase of a request to /positions/',
+                                       DURATION_BUCKETS)),
+    ('comet_requests_total', ('counter', 'the number of requests to sth-comet by status code', None)),
+    ('comet_errors_total', ('counter', 'the number of pages which can not be retrieved from sth-comet', None)),
+    ('comet_rows_total', ('counter', 'the number of values retrieved from sth-comet', None)),
+    ('comet_response_bytes_total', ('counter', 'the bytes of responses of sth-comet', None)),
+    ('comet_deadline_exceeded_total', ('counter', 'the number of fetches from sth-comet cut by the deadline', None)),
+    ('comet_request_seconds', ('histogram', 'the seconds of a round trip to sth-comet', DURATION_BUCKETS)),
+    ('comet_pages', ('histogram', 'the number of pages retrieved for an attribute', PAGE_BUCKETS)),
+    ('position_cache_hits_total', ('counter', 'the number of buckets read from the position cache', None)),
+    ('position_cache_misses_total', ('counter', 'the number of buckets fetched for the position cache', None)),
+    ('position_cache_coalesced_total', ('counter', 'the number of buckets and runs shared with another request',
+                                        None)),
+])
+
+
+class Registry:
+    """
+    counters and histograms of a process, which are aggregated over all the processes sharing a directory.
+
+    Each process writes a snapshot of its own metrics to '<directory>/metrics-<pid>-<start>.json' by flush(), at
+    most once per flush_interval seconds (the skipped changes are written by a timer at the end of the interval),
+    and collect() sums the snapshots of all the processes, so any uwsgi worker can serve the metrics of the whole
+    application. collect() merges the snapshots of the exited processes, including a process whose pid is reused
+    by a later one, into '<directory>/totals.json', so that the counters never go back and the snapshots do not
+    pile up. If the directory is None, only the metrics of this process are collected.
+    """
+
+    def __init__(self, directory, flush_interval=0.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pid = None
+        self.started = None
+        self.flushed = None
+        self.timer = None
+        self.dirty = False
+        self.counters = dict()
+        self.histograms = dict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush, True)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.__check_pid()
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.dirty = True
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self.lock:
+            self.__check_pid()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+            self.dirty = True
+
+    def observe_timings(self, timings):
+        for phase, seconds in timings.items():
+            self.observe('robot_positions_phase_seconds', seconds, phase=phase)
+
+    def flush(self, force=False):
+        """
+        write the snapshot of this process if it is changed, unless the last one was written within flush_interval
+        seconds and not force.
+        """
+        if not self.directory:
+            return
+        with self.flush_lock:
+            with self.lock:
+                self.__check_pid()
+                if not self.dirty:
+                    return
+                now = time.monotonic()
+                if not force and self.flushed is not None and now - self.flushed < self.flush_interval:
+                    self.__schedule(self.flushed + self.flush_interval - now)
+                    return
+                self.flushed = now
+                self.dirty = False
+                snapshot = self.__snapshot()
+            path = os.path.join(self.directory, f'metrics-{self.pid}-{self.started}.json')
+            if not write_json(path, snapshot):
+                with self.lock:
+                    self.dirty = True
+
+    def collect(self):
+        """
+        return the metrics of all the processes in the prometheus text format.
+        """
+        self.flush(True)
+        counters = dict()
+        histograms = dict()
+        for snapshot in self.__read_snapshots():
+            merge_snapshot(counters, histograms, snapshot)
+
+        lines = list()
+        for name, (metric_type, description, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for key in sorted(k for k in counters if k[0] == name):
+                    lines.append(f'{name}{format_labels(key[1])} {format_value(counters[key])}')
+            else:
+                for key in sorted(k for k in histograms if k[0] == name):
+                    counts, total, count = histograms[key]
+                    cumulative = 0
+                    for bound, num in zip(buckets, counts):
+                        cumulative += num
+                        lines.append(f'{name}_bucket{format_labels(key[1] + (("le", format_value(bound)), ))} '
+                                     f'{cumulative}')
+                    lines.append(f'{name}_bucket{format_labels(key[1] + (("le", "+Inf"), ))} {count}')
+                    lines.append(f'{name}_sum{format_labels(key[1])} {format_value(total)}')
+                    lines.append(f'{name}_count{format_labels(key[1])} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.dirty = True
+
+    def __check_pid(self):
+        # the metrics inherited from the parent process belong to the parent process
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.started = int(time.time() * 1000000)
+            self.flushed = None
+            self.timer = None
+            self.dirty = False
+            self.counters = dict()
+            self.histograms = dict()
+
+    def __schedule(self, delay):
+        if self.timer is not None:
+            return
+        self.timer = threading.Timer(delay, self.__flush_later)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def __flush_later(self):
+        with self.lock:
+            self.timer = None
+        self.flush(True)
+
+    def __snapshot(self):
+        return to_snapshot(self.counters, self.histograms)
+
+    def __read_snapshots(self):
+        if not self.directory:
+            with self.lock:
+                self.__check_pid()
+                return [json.loads(json.dumps(self.__snapshot()))]
+
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return self.__merge_exited()
+
+    def __merge_exited(self):
+        """
+        merge the snapshots of the exited processes into the totals, and return the totals and the snapshots of the
+        live processes. The names of the merged snapshots are kept in the totals until the snapshots are removed,
+        so that a snapshot is never merged twice.
+        """
+        totals = read_json(os.path.join(self.directory, TOTALS_FILE)) or {'counters': [], 'histograms': []}
+        merged = set(totals.get('merged', []))
+        starts = dict()
+        processes = list()
+        for filename in os.listdir(self.directory):
+            match = SNAPSHOT_PATTERN.fullmatch(filename)
+            if match is not None:
+                pid, started = int(match.group(1)), int(match.group(2))
+                starts[pid] = max(starts.get(pid, started), started)
+                processes.append((filename, pid, started))
+
+        counters = dict()
+        histograms = dict()
+        merge_snapshot(counters, histograms, totals)
+        snapshots = list()
+        exited = list()
+        for filename, pid, started in processes:
+            if filename in merged:
+                exited.append(filename)
+                continue
+            snapshot = read_json(os.path.join(self.directory, filename))
+            if snapshot is None:
+                continue
+            if (pid, started) == (self.pid, self.started) or (started == starts[pid] and is_alive(pid)):
+                snapshots.append(snapshot)
+            else:
+                merge_snapshot(counters, histograms, snapshot)
+                merged.add(filename)
+                exited.append(filename)
+
+        if not exited:
+            return [totals] + snapshots
+        totals = to_snapshot(counters, histograms)
+        totals['merged'] = sorted(merged & set(exited))
+        if write_json(os.path.join(self.directory, TOTALS_FILE), totals):
+            for filename in exited:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError as e:
+                    logger.warning(f'can not remove metrics, filename={filename}, error={str(e)}')
+        return [totals] + snapshots
+
+
+class Timings:
+    """
+    the seconds of each phase of a request, which may be added from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = OrderedDict()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def items(self):
+        with self.lock:
+            return list(self.durations.items())
+
+    def to_header(self):
+        return ', '.join(f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self.items())
+
+
+def to_snapshot(counters, histograms):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, histogram[0], histogram[1], histogram[2]]
+                       for (name, labels), histogram in histograms.items()],
+    }
+
+
+def merge_snapshot(counters, histograms, snapshot):
+    """
+    add the metrics of snapshot to counters and histograms.
+    """
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(tuple(label) for label in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts, total, count in snapshot['histograms']:
+        key = (name, tuple(tuple(label) for label in labels))
+        histogram = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+        histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+        histogram[1] += total
+        histogram[2] += count
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f'can not read metrics, path={path}, error={str(e)}')
+        return None
+
+
+def write_json(path, value):
+    """
+    replace the file of path with value atomically, and return False if it can not be written.
+    """
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(value, f)
+        os.replace(path + '.tmp', path)
+        return True
+    except OSError as e:
+        logger.warning(f'can not write metrics, path={path}, error={str(e)}')
+        return False
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
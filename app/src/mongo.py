@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from datetime import timezone
+
+from logging import getLogger
+
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import PyMongoError
+
+logger = getLogger(__name__)
+
+
+class MongoReader:
+    """
+    read the positions persisted by cygnus from mongodb directly.
+
+    Both 'row' and 'column' attr_persistence of cygnus are supported. The positions in a time range are retrieved by
+    one range query on the recvTime index, projected to the attributes of a position. A position is made from a
+    recvTime which has the first attribute.
+
+    The recvTime index is created by create_index() as a deploy step, or on the first query if auto_index, since
+    building it on a large collection takes long and needs the privilege to create an index.
+    """
+
+    def __init__(self, endpoint, replicaset, database, collection, attr_persistence, auto_index=False):
+        self.endpoint = endpoint
+        self.replicaset = replicaset
+        self.database = database
+        self.collection = collection
+        self.attr_persistence = attr_persistence
+        self.auto_index = auto_index
+        self.client = None
+        self.indexed = False
+
+    def get_collection(self):
+        if self.client is None:
+            kwargs = {'replicaset': self.replicaset} if self.replicaset else {}
+            self.client = MongoClient(self.endpoint, connect=False, tz_aware=False, **kwargs)
+        collection = self.client[self.database][self.collection]
+        if self.auto_index and not self.indexed:
+            self.indexed = True
+            try:
+                self.create_index(collection)
+            except PyMongoError as e:
+                logger.warning(f'can not create index of recvTime, error={str(e)}')
+        return collection
+
+    def create_index(self, collection=None):
+        """
+        create the recvTime index of the collection if it does not exist.
+        """
+        collection = collection if collection is not None else self.get_collection()
+        name = collection.create_index([('recvTime', ASCENDING)])
+        logger.info(f'create index {name}, database={self.database}, collection={self.collection}')
+        return name
+
+    def iter_positions(self, converter, start_dt, end_dt, attrs):
+        start = start_dt.astimezone(timezone.utc).replace(tzinfo=None)
+        end = end_dt.astimezone(timezone.utc).replace(tzinfo=None)
+        logger.debug(f'find positions from {start} to {end}, attr_persistence={self.attr_persistence}')
+
+        if self.attr_persistence == 'column':
+            return self.__iter_column(converter, start, end, attrs)
+        return self.__iter_row(converter, start, end, attrs)
+
+    def __iter_column(self, converter, start, end, attrs):
+        projection = {'_id': 0, 'recvTime': 1}
+        projection.update({attr: 1 for attr in attrs})
+        cursor = self.get_collection().find({'recvTime': {'$gte': start, '$lte': end}},
+                                            projection).sort('recvTime', ASCENDING)
+        for doc in cursor:
+            if doc.get(attrs[0]) is None:
+                continue
+            epoch, time = converter.convert_datetime(doc['recvTime'])
+            point = {'time': time}
+            for attr in attrs:
+                if doc.get(attr) is not None:
+                    point[attr] = float(doc[attr])
+            yield epoch, point
+
+    def __iter_row(self, converter, start, end, attrs):
+        cursor = self.get_collection().find({'recvTime': {'$gte': start, '$lte': end},
+                                             'attrName': {'$in': list(attrs)}},
+                                            {'_id': 0, 'recvTime': 1, 'attrName': 1, 'attrValue': 1}
+                                            ).sort('recvTime', ASCENDING)
+        recv_time = None
+        values = dict()
+        for doc in cursor:
+            if doc['recvTime'] != recv_time:
+                if attrs[0] in values:
+                    yield self.__to_position(converter, recv_time, values, attrs)
+                recv_time = doc['recvTime']
+                values = dict()
+            values[doc['attrName']] = float(doc['attrValue'])
+        if attrs[0] in values:
+            yield self.__to_position(converter, recv_time, values, attrs)
+
+    def __to_position(self, converter, recv_time, values, attrs):
+        epoch, time = converter.convert_datetime(recv_time)
+        point = {'time': time}
+        for attr in attrs:
+            if attr in values:
+                point[attr] = values[attr]
+        return epoch, point
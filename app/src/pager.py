@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import math
+import threading
+
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class AdaptivePager:
+    """
+    choose hLimit of the requests to sth-comet between min_limit and max_limit to hit target_latency per page.
+
+    The rows per second of sth-comet are learned from the latency of every page in this process, and hLimit is moved
+    towards the rows which can be retrieved in target_latency seconds, at most doubled or halved at once. The pages
+    after the first page are also bounded by the remaining rows divided by the concurrency, so that a small window is
+    spread over the parallel requests. If min_limit equals max_limit, hLimit is fixed.
+    """
+
+    def __init__(self, limit, min_limit, max_limit, target_latency):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.target_latency = target_latency
+        self.limit = self.__clamp(limit)
+        self.lock = threading.Lock()
+
+    def is_adaptive(self):
+        return self.min_limit < self.max_limit
+
+    def get_limit(self, remaining=None, concurrency=1):
+        """
+        return hLimit of the next page. remaining is the number of rows not requested yet if it is known.
+        """
+        limit = self.limit
+        if remaining is not None and self.is_adaptive():
+            limit = min(limit, math.ceil(remaining / max(1, concurrency)))
+        return self.__clamp(limit)
+
+    def observe(self, limit, rows, latency):
+        """
+        learn from a page of rows retrieved in latency seconds, which was requested with limit.
+        """
+        if not self.is_adaptive() or rows <= 0 or latency <= 0:
+            return
+        with self.lock:
+            current = self.limit
+            expected = rows * self.target_latency / latency
+            # a short page (the last one) can only tell that a larger page is affordable
+            if rows < limit and expected < current:
+                return
+            chosen = self.__clamp(int(min(max(expected, current / 2), current * 2)))
+            if chosen != current:
+                logger.info(f'adapt hLimit from {current} to {chosen}, rows={rows}, latency={latency:.3f}, '
+                            f'target_latency={self.target_latency}')
+                self.limit = chosen
+
+    def __clamp(self, limit):
+        return max(self.min_limit, min(self.max_limit, limit))
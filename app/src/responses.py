@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import gzip
+import hashlib
+
+from logging import getLogger
+
+from src.cache import MemoryBackend
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = getLogger(__name__)
+
+# the content codings of the cached responses in the order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip', )
+
+
+def get_etag(key, encoding):
+    """
+    return the strong entity tag of the response of key encoded by encoding (None for identity).
+    """
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return digest if encoding is None else f'{digest}-{encoding}'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CachedResponse:
+    """
+    the body, the mimetype and the extra headers of a response, whose length is the bytes of the body.
+    """
+
+    def __init__(self, body, mimetype, headers):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+
+    def __len__(self):
+        return len(self.body)
+
+
+class ResponseCache:
+    """
+    an in-process LRU cache of the responses of closed windows, which holds at most max_bytes bytes of bodies.
+
+    The body of a response is kept as is, and compressed for each content coding when a client accepts it first,
+    so that the later requests are served without serializing nor compressing the positions again.
+    """
+
+    def __init__(self, max_bytes):
+        self.backend = MemoryBackend(max_bytes)
+
+    def is_enabled(self):
+        return self.backend.is_enabled()
+
+    def get(self, key, encoding):
+        """
+        return the cached response of key encoded by encoding (None for identity), or None if it is not cached.
+        """
+        cached = self.backend.get((key, encoding))
+        if cached is not None or encoding is None:
+            return cached
+        identity = self.backend.get((key, None))
+        return None if identity is None else self.__encode(key, identity, encoding)
+
+    def set(self, key, body, mimetype, headers, encoding):
+        """
+        cache the response of key, and return it encoded by encoding.
+        """
+        identity = CachedResponse(body, mimetype, headers)
+        self.backend.set((key, None), identity)
+        return identity if encoding is None else self.__encode(key, identity, encoding)
+
+    def clear(self):
+        self.backend.clear()
+
+    def __encode(self, key, identity, encoding):
+        cached = CachedResponse(compress(identity.body, encoding), identity.mimetype, identity.headers)
+        self.backend.set((key, encoding), cached)
+        logger.debug(f'compress a response, encoding={encoding}, bytes={len(identity)}, compressed={len(cached)}')
+        return cached
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the array operations of numpy pay off for a bucket or a segment of at least this number of points
+MIN_ARRAY_POINTS = 32
+
+
+def lttb(points, max_points):
+    """
+    downsample points to max_points by Largest-Triangle-Three-Buckets on the x-y plane.
+
+    The first and last points are always kept, and from each bucket the point which forms the largest triangle with
+    the previously selected point and the average of the next bucket is selected.
+
+    The areas of the buckets of MIN_ARRAY_POINTS or more points are computed by the array operations of numpy if it is
+    installed, and by a pure python loop otherwise. Both select the same points except for the rounding of the averages.
+    """
+    num = len(points)
+    if max_points >= num or max_points < 3:
+        return points
+    if np is not None and num / max_points >= MIN_ARRAY_POINTS:
+        return _lttb_arrays(points, max_points)
+
+    sampled = [points[0]]
+    every = (num - 2) / (max_points - 2)
+    selected = 0
+    for i in range(max_points - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, num)
+        next_points = points[next_start:next_end]
+        avg_x = sum(p['x'] for p in next_points) / len(next_points)
+        avg_y = sum(p['y'] for p in next_points) / len(next_points)
+
+        ax = points[selected]['x']
+        ay = points[selected]['y']
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        max_area = -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j]['y'] - ay) - (ax - points[j]['x']) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+        sampled.append(points[selected])
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def douglas_peucker(points, tolerance):
+    """
+    simplify points by Douglas-Peucker, removing the points which are closer than tolerance to the simplified path.
+
+    The distances of the segments of MIN_ARRAY_POINTS or more points are computed by the array operations of numpy if
+    it is installed, and by a pure python loop otherwise.
+    """
+    num = len(points)
+    if num < 3:
+        return points
+    if np is not None:
+        return _douglas_peucker_arrays(points, tolerance)
+
+    keep = [False] * num
+    keep[0] = keep[-1] = True
+    _douglas_peucker_loop(points, tolerance, keep, 0, num - 1)
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _douglas_peucker_loop(points, tolerance, keep, first, last):
+    """
+    mark the points to keep between first and last in keep one by one.
+    """
+    stack = [(first, last)]
+    while stack:
+        start, end = stack.pop()
+        max_distance = -1.0
+        index = start
+        for i in range(start + 1, end):
+            distance = _distance_to_segment(points[i], points[start], points[end])
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if max_distance > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+
+def _distance_to_segment(p, a, b):
+    dx = b['x'] - a['x']
+    dy = b['y'] - a['y']
+    length = dx * dx + dy * dy
+    if length == 0.0:
+        return math.hypot(p['x'] - a['x'], p['y'] - a['y'])
+    t = max(0.0, min(1.0, ((p['x'] - a['x']) * dx + (p['y'] - a['y']) * dy) / length))
+    return math.hypot(p['x'] - a['x'] - t * dx, p['y'] - a['y'] - t * dy)
+
+
+def _to_arrays(points):
+    xs = np.fromiter((p['x'] for p in points), np.float64, len(points))
+    ys = np.fromiter((p['y'] for p in points), np.float64, len(points))
+    return xs, ys
+
+
+def _lttb_arrays(points, max_points):
+    """
+    downsample three or more points by lttb() with the array operations of numpy.
+    """
+    num = len(points)
+    xs, ys = _to_arrays(points)
+    every = (num - 2) / (max_points - 2)
+    # the bucket i is [bounds[i], bounds[i + 1]), and the next bucket of the last one ends at most at the last point
+    bounds = [int(i * every) + 1 for i in range(max_points)]
+    bounds[-1] = min(bounds[-1], num)
+    starts = np.array(bounds[1:-1])
+    counts = np.diff(bounds[1:])
+    avg_xs = np.add.reduceat(xs[:bounds[-1]], starts) / counts
+    avg_ys = np.add.reduceat(ys[:bounds[-1]], starts) / counts
+
+    selected = 0
+    indexes = [0]
+    for i in range(max_points - 2):
+        ax = xs[selected]
+        ay = ys[selected]
+        start = bounds[i]
+        end = bounds[i + 1]
+        areas = np.abs((ax - avg_xs[i]) * (ys[start:end] - ay) - (ax - xs[start:end]) * (avg_ys[i] - ay))
+        selected = start + int(np.argmax(areas))
+        indexes.append(selected)
+    indexes.append(num - 1)
+    return [points[i] for i in indexes]
+
+
+def _douglas_peucker_arrays(points, tolerance):
+    """
+    simplify three or more points by douglas_peucker() with the array operations of numpy.
+    """
+    num = len(points)
+    xs, ys = _to_arrays(points)
+    keep = [False] * num
+    keep[0] = keep[-1] = True
+    stack = [(0, num - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < MIN_ARRAY_POINTS:
+            _douglas_peucker_loop(points, tolerance, keep, start, end)
+            continue
+        px = xs[start + 1:end] - xs[start]
+        py = ys[start + 1:end] - ys[start]
+        dx = xs[end] - xs[start]
+        dy = ys[end] - ys[start]
+        length = dx * dx + dy * dy
+        if length == 0.0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        offset = int(np.argmax(distances))
+        if distances[offset] > tolerance:
+            index = start + 1 + offset
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [p for p, k in zip(points, keep) if k]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import mmap
+import os
+import shutil
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+META = 'meta.json'
+TIME_COLUMN = 'time.i64'
+
+
+class PositionStore:
+    """
+    an append-only columnar store of the positions of an entity in a local directory, which is written by one
+    ingestion process and read by all worker processes.
+
+    The epochs are kept in 'time.i64' (sorted microseconds since the unix epoch) and the values of each attr in
+    '<attr>.f64' (NaN for a missing value) in the native byte order. 'meta.json' records the entity, the attrs,
+    the number of rows and the range [start, end] in microseconds where the store holds all the positions.
+    The columns are appended before meta.json is replaced, so a reader never sees a partial row. A reader locates
+    the rows by binary search on the memory-mapped time column, so only the located rows are read from the columns.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def is_enabled(self):
+        return bool(self.directory)
+
+    def get_meta(self):
+        try:
+            with open(os.path.join(self.directory, META)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_range(self, entity, attrs):
+        """
+        return (start, end) in microseconds where the store holds all the positions of attrs of the entity,
+        or None if it does not hold them.
+        """
+        if not self.is_enabled():
+            return None
+        meta = self.get_meta()
+        if meta is None or meta['entity'] != list(entity) or not set(attrs) <= set(meta['attrs']):
+            return None
+        if meta['end'] < meta['start']:
+            return None
+        return meta['start'], meta['end']
+
+    def get_positions(self, converter, attrs, start_us, end_us):
+        """
+        return the positions between start_us and end_us (inclusive) as a list of (epoch, point) in epoch order.
+        A position is made from the rows which have the value of the first attr. The located rows are copied out of
+        the mapped columns into the lists and the dicts of the positions.
+        """
+        meta = self.get_meta()
+        if meta is None or meta['rows'] == 0:
+            return []
+        rows = meta['rows']
+        with self.__map(TIME_COLUMN, 'q', rows) as times:
+            first = bisect_left(times, start_us)
+            last = bisect_right(times, end_us, first)
+            if first == last:
+                return []
+            with times[first:last] as part:
+                micros = part.tolist()
+        columns = list()
+        for attr in attrs:
+            with self.__map(self.__get_column(attr), 'd', rows) as values, values[first:last] as part:
+                columns.append(part.tolist())
+
+        positions = list()
+        for microseconds, values in zip(micros, zip(*columns)):
+            if math.isnan(values[0]):
+                continue
+            epoch, time = converter.convert_microseconds(microseconds)
+            point = {'time': time}
+            for attr, value in zip(attrs, values):
+                if not math.isnan(value):
+                    point[attr] = value
+            positions.append((epoch, point))
+        return positions
+
+    def reset(self, entity, attrs, start_us):
+        """
+        remove all the positions, and start to hold the positions of attrs of the entity from start_us.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self.__write_meta({'entity': list(entity), 'attrs': list(attrs), 'rows': 0, 'start': start_us,
+                           'end': start_us - 1})
+        logger.info(f'reset the position store, directory={self.directory}, entity={entity}, attrs={attrs}')
+
+    def append(self, micros, columns, end_us):
+        """
+        append the rows of micros (sorted microseconds after the end of the store) and the columns of the attrs,
+        where a missing value is None, and extend the end of the store to end_us.
+        """
+        meta = self.get_meta()
+        rows = meta['rows']
+        if micros and micros[0] <= meta['end']:
+            raise ValueError(f'can not append positions before the end of the store, end={meta["end"]}')
+
+        # the rows written after meta.json by an interrupted append are discarded
+        self.__append_column(TIME_COLUMN, rows, array('q', micros))
+        for attr, column in zip(meta['attrs'], columns):
+            self.__append_column(self.__get_column(attr), rows,
+                                 array('d', (float('nan') if value is None else value for value in column)))
+        meta['rows'] = rows + len(micros)
+        meta['end'] = end_us
+        self.__write_meta(meta)
+
+    def __get_column(self, attr):
+        return f'{attr}.f64'
+
+    def __append_column(self, name, rows, values):
+        path = os.path.join(self.directory, name)
+        with open(path, 'ab') as f:
+            if f.tell() != rows * values.itemsize:
+                f.truncate(rows * values.itemsize)
+            f.write(values.tobytes())
+
+    def __write_meta(self, meta):
+        path = os.path.join(self.directory, META)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    @contextmanager
+    def __map(self, name, typecode, rows):
+        """
+        map the first rows of a column as a memoryview of typecode.
+        """
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            size = rows * array(typecode).itemsize
+            buffer = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        view = memoryview(buffer).cast(typecode)
+        try:
+            yield view
+        finally:
+            view.release()
+            buffer.close()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class TailTracker:
+    """
+    keep a high-water mark and the recent positions of each entity for live tailing.
+
+    The backend is queried only for the positions newer than the high-water mark, and at most once per interval
+    seconds for each entity, so that tailing clients cost O(new positions) per tick. The positions newer than
+    retention seconds before the high-water mark are kept to answer the clients which are a little behind.
+    """
+
+    def __init__(self, interval, retention):
+        self.interval = interval
+        self.retention = retention
+        self.entities = dict()
+        self.lock = threading.Lock()
+
+    def get(self, entity, since, now, fetch):
+        """
+        return the positions of the entity newer than since as a list of (epoch, point).
+        fetch(start_ts, end_ts) is called to retrieve the positions from the backend.
+        """
+        with self.lock:
+            state = self.entities.setdefault(entity, _TailState())
+
+        with state.lock:
+            if state.start is None or since < state.start:
+                logger.debug(f'tail from the backend, entity={entity}, since={since}')
+                state.reset(since, [(epoch, point) for epoch, point in fetch(since, now) if epoch > since])
+                state.polled = now
+            elif now - state.polled >= self.interval:
+                hwm = state.hwm()
+                logger.debug(f'tail from the high-water mark, entity={entity}, hwm={hwm}')
+                state.extend([(epoch, point) for epoch, point in fetch(hwm, now) if epoch > hwm])
+                state.polled = now
+            positions = state.newer_than(since)
+            state.trim(self.retention)
+            return positions
+
+    def clear(self):
+        with self.lock:
+            self.entities.clear()
+
+
+class _TailState:
+    """
+    the positions of an entity newer than start, which are complete up to the high-water mark.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = None
+        self.epochs = list()
+        self.positions = list()
+        self.polled = float('-inf')
+
+    def hwm(self):
+        return self.epochs[-1] if self.epochs else self.start
+
+    def reset(self, start, positions):
+        self.start = start
+        self.epochs = [epoch for epoch, _ in positions]
+        self.positions = positions
+
+    def extend(self, positions):
+        self.epochs.extend(epoch for epoch, _ in positions)
+        self.positions.extend(positions)
+
+    def trim(self, retention):
+        index = bisect.bisect_left(self.epochs, self.hwm() - retention)
+        if index > 0:
+            self.start = self.epochs[index - 1]
+            self.epochs = self.epochs[index:]
+            self.positions = self.positions[index:]
+
+    def newer_than(self, since):
+        return self.positions[bisect.bisect_right(self.epochs, since):]
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+
+def parse_attrs(value):
+    """
+    return the attribute names in value separated by commas.
+    """
+    return tuple(attr.strip() for attr in value.split(',') if attr.strip())
@@ -1,38 +1,78 @@
 # -*- coding: utf-8 -*-
+import math
 import os
+import time
 from collections import OrderedDict
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import chain
 
 from logging import getLogger
 
 from dateutil import parser
 from pytz import timezone
 
-import requests
-
-from flask import request, render_template, jsonify, current_app, url_for
+from flask import request, render_template, jsonify, current_app, url_for, json, Response, stream_with_context
 from flask.views import MethodView
 from werkzeug.exceptions import BadRequest
 
-from src import const
+from src import const, analytics, columnar, lod, merge, responses, simplify
+from src.cache import MemoryBackend, SQLiteBackend, PositionCache
+from src.comet import CometError, CometSession, CometClient, IncompleteError
+from src.deadline import Deadline, DeadlineExceeded
+from src.metrics import Registry, Timings
+from src.pager import AdaptivePager
+from src.mongo import MongoReader
+from src.store import PositionStore
+from src.tail import TailTracker
+from src.utils import parse_attrs
 
 logger = getLogger(__name__)
 
+# the max seconds by which the clock of a client tailing an entity may be ahead of the server
+SINCE_MAX_SKEW = 60.0
+
 
 class RobotLocusPage(MethodView):
     NAME = 'robot_locus_page'
 
     def get(self):
         positions_path = url_for(RobotPositionsAPIBase.NAME)
-        return render_template('robotLocus.html', path=positions_path)
+        worker_path = url_for('static', filename='js/trackWorker.js')
+        return render_template('robotLocus.html', path=positions_path, worker_path=worker_path,
+                               timezone=current_app.config['TIMEZONE'])
+
+
+class MetricsAPI(MethodView):
+    NAME = 'metrics_api'
+
+    def get(self):
+        return Response(RobotPositionsAPIBase.METRICS.collect(), content_type=const.MIMETYPE_METRICS)
 
 
 class RobotPositionsAPIBase(MethodView):
     NAME = 'robot_positions_api'
+    METRICS = Registry(os.environ.get(const.METRICS_DIR, const.DEFAULT_METRICS_DIR),
+                       float(os.environ.get(const.METRICS_FLUSH_INTERVAL, const.DEFAULT_METRICS_FLUSH_INTERVAL)))
+    SERVER_TIMING = os.environ.get(const.SERVER_TIMING, const.DEFAULT_SERVER_TIMING).lower() in ('true', '1')
+    TAIL = TailTracker(float(os.environ.get(const.TAIL_INTERVAL, const.DEFAULT_TAIL_INTERVAL)),
+                       float(os.environ.get(const.TAIL_RETENTION, const.DEFAULT_TAIL_RETENTION)))
+    LOD_BASE = float(os.environ.get(const.LOD_BASE, const.DEFAULT_LOD_BASE))
+    LOD_LEVELS = int(os.environ.get(const.LOD_LEVELS, const.DEFAULT_LOD_LEVELS))
+    RESPONSES = responses.ResponseCache(int(os.environ.get(const.RESPONSE_CACHE_SIZE, const.DEFAULT_RESPONSE_CACHE_SIZE)))
+    MAX_AGE = int(os.environ.get(const.RESPONSE_MAX_AGE, const.DEFAULT_RESPONSE_MAX_AGE))
+    DEADLINE = float(os.environ.get(const.REQUEST_DEADLINE, const.DEFAULT_REQUEST_DEADLINE))
+    SETTLE_DELAY = float(os.environ.get(const.SETTLE_DELAY, const.DEFAULT_SETTLE_DELAY))
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.tz = timezone(current_app.config['TIMEZONE'])
+        self.fields = self._get_attrs()
+        self.timings = Timings()
+        self.deadline = Deadline(RobotPositionsAPIBase.DEADLINE)
+        # whether some attrs could not be retrieved for this request, whose response must not be cached
+        self.incomplete = False
 
     def _parse_params(self):
         st = request.args.get('st')
@@ -50,6 +90,442 @@ class RobotPositionsAPIBase(MethodView):
 
         return start_dt, end_dt
 
+    def _parse_since(self):
+        since = request.args.get('since')
+        if since is None:
+            return None
+
+        logger.info(f'RobotPositionAPI, since={since}')
+        try:
+            since_ts = float(since)
+        except ValueError:
+            raise BadRequest({'message': 'invalid query parameter "since"'})
+        if since_ts != since_ts or since_ts in (float('inf'), float('-inf')):
+            raise BadRequest({'message': 'invalid query parameter "since"'})
+        retention = RobotPositionsAPIBase.TAIL.retention
+        now = time.time()
+        if since_ts < now - retention:
+            raise BadRequest({'message': f'query parameter "since" must be within {retention:g} seconds before now, '
+                                         f'use "st" and "et" for the older positions'})
+        if since_ts > now + SINCE_MAX_SKEW:
+            raise BadRequest({'message': 'query parameter "since" must not be in the future'})
+        return since_ts
+
+    def _parse_entity_ids(self, max_entities):
+        ids = request.args.get('ids')
+        if ids is None:
+            return None
+        if max_entities <= 0:
+            raise BadRequest({'message': 'query parameter "ids" is not supported'})
+
+        logger.info(f'RobotPositionAPI, ids={ids}')
+        entity_ids = list(OrderedDict.fromkeys(entity_id.strip() for entity_id in ids.split(',') if entity_id.strip()))
+        if not entity_ids or len(entity_ids) > max_entities:
+            raise BadRequest({'message': f'query parameter "ids" must have 1 to {max_entities} entity ids'})
+        return entity_ids
+
+    def _parse_fields(self):
+        attrs = self._get_attrs()
+        fields = request.args.get('fields')
+        if fields is None:
+            return attrs
+
+        names = set(field.strip() for field in fields.split(',') if field.strip())
+        if not names or not names <= set(attrs):
+            raise BadRequest({'message': f'query parameter "fields" must be a subset of "{",".join(attrs)}"'})
+        return tuple(attr for attr in attrs if attr in names)
+
+    def _parse_resolution(self, start_dt, end_dt, max_points, default=None):
+        """
+        return the resolution of aggregated positions, which is chosen from the window length if it is "auto" or empty.
+        """
+        resolution = request.args.get('resolution', default)
+        if resolution is None:
+            return None
+
+        resolutions = dict(const.AGGREGATE_RESOLUTIONS)
+        if resolution in ('', 'auto'):
+            window = (end_dt - start_dt).total_seconds()
+            resolution = next((name for name, seconds in const.AGGREGATE_RESOLUTIONS if window / seconds <= max_points),
+                              const.AGGREGATE_RESOLUTIONS[-1][0])
+        elif resolution not in resolutions:
+            raise BadRequest({'message': f'query parameter "resolution" must be one of auto, {", ".join(resolutions)}'})
+        logger.info(f'RobotPositionAPI, resolution={resolution}')
+        return resolution
+
+    def _parse_viewport(self):
+        """
+        return the bounding box (min_x, min_y, max_x, max_y) and the width of a pixel of the viewport, or None.
+        """
+        bbox = request.args.get('bbox')
+        if bbox is None:
+            if 'px' in request.args:
+                raise BadRequest({'message': 'query parameter "px" can not be used without "bbox"'})
+            return None
+
+        logger.info(f'RobotPositionAPI, bbox={bbox}, px={request.args.get("px")}')
+        try:
+            values = tuple(float(value) for value in bbox.split(','))
+            px = int(request.args.get('px', const.DEFAULT_VIEWPORT_PX))
+        except ValueError:
+            raise BadRequest({'message': 'invalid query parameter "bbox" and/or "px"'})
+        if (len(values) != 4 or not all(math.isfinite(value) for value in values) or
+                values[0] >= values[2] or values[1] >= values[3] or px < 1):
+            raise BadRequest({'message': 'invalid query parameter "bbox" and/or "px"'})
+        return values, max(values[2] - values[0], values[3] - values[1]) / px
+
+    def _parse_simplify_params(self):
+        try:
+            max_points = int(request.args['max_points']) if 'max_points' in request.args else None
+            tolerance = float(request.args['tolerance']) if 'tolerance' in request.args else None
+        except ValueError:
+            raise BadRequest({'message': 'invalid query parameter "max_points" and/or "tolerance"'})
+        if (max_points is not None and max_points < 3) or (tolerance is not None and not 0.0 <= tolerance < float('inf')):
+            raise BadRequest({'message': 'invalid query parameter "max_points" and/or "tolerance"'})
+        return max_points, tolerance
+
+    def _check_planar(self, max_points, tolerance, viewport):
+        """
+        raise BadRequest if the positions are simplified or thinned on the x-y plane without 'x' or 'y' in the fields.
+        """
+        if (max_points is not None or tolerance is not None or viewport is not None) and \
+                not {'x', 'y'} <= set(self.fields):
+            raise BadRequest({'message': 'query parameter "max_points", "tolerance" and "bbox" can not be used '
+                                         'without "x" and "y" in "fields"'})
+
+    def _parse_format(self):
+        fmt = request.args.get('format')
+        if fmt is None:
+            best = request.accept_mimetypes.best_match([const.MIMETYPE_JSON, const.MIMETYPE_BINARY])
+            return 'binary' if best == const.MIMETYPE_BINARY else 'json'
+        if fmt not in ('json', 'columnar', 'binary'):
+            raise BadRequest({'message': 'invalid query parameter "format"'})
+        return fmt
+
+    def get(self):
+        metrics = RobotPositionsAPIBase.METRICS
+        metrics.inc('robot_positions_requests_total')
+        start = time.perf_counter()
+        try:
+            response = self.__get()
+        except Exception:
+            metrics.inc('robot_positions_errors_total')
+            metrics.flush()
+            raise
+        return self._finish_response(response, start)
+
+    def _finish_response(self, response, start):
+        """
+        record the metrics of a request started at start, and add the Server-Timing header to its response.
+        """
+        metrics = RobotPositionsAPIBase.METRICS
+        self.timings.add('total', time.perf_counter() - start)
+        metrics.observe_timings(self.timings)
+        if not response.is_streamed:
+            metrics.inc('robot_positions_response_bytes_total', response.content_length or 0)
+        if RobotPositionsAPIBase.SERVER_TIMING:
+            response.headers['Server-Timing'] = self.timings.to_header()
+        metrics.flush()
+        return response
+
+    def __get(self):
+        self.fields = self._parse_fields()
+        entity_ids = self._parse_entity_ids(self._get_max_entities())
+        if entity_ids is not None:
+            return self.__get_batch(entity_ids)
+
+        since = self._parse_since()
+        if since is not None and 'resolution' in request.args:
+            raise BadRequest({'message': 'query parameter "resolution" can not be used with "since"'})
+        start_dt, end_dt = self._parse_params() if since is None else (None, None)
+        resolution = self._parse_resolution(start_dt, end_dt, self._get_aggregate_max_points()) if since is None else None
+        viewport = self._parse_viewport()
+        if viewport is not None and (since is not None or resolution is not None):
+            raise BadRequest({'message': 'query parameter "bbox" can not be used with "since" and "resolution"'})
+        max_points, tolerance = self._parse_simplify_params()
+        self._check_planar(max_points, tolerance, viewport)
+        fmt = self._parse_format()
+
+        if (since is None and resolution is None and viewport is None and max_points is None and tolerance is None and
+                fmt == 'json' and request.args.get('stream', '').lower() in ('true', '1')):
+            positions = self._iter_positions(start_dt, end_dt)
+            return Response(stream_with_context(self.__generate_json(positions, start_dt)),
+                            mimetype=const.MIMETYPE_JSON)
+
+        key, response = self._get_cached_response(end_dt, fmt) if since is None else (None, None)
+        if response is not None:
+            return response
+
+        headers = dict()
+        with self.timings.measure('fetch'):
+            try:
+                if resolution is not None:
+                    positions = self._get_aggregated_positions(start_dt, end_dt, resolution)
+                    headers['X-Resolution'] = resolution
+                elif viewport is not None:
+                    positions = self._get_viewport_positions(start_dt, end_dt, *viewport)
+                elif since is None:
+                    positions = self._get_positions(start_dt, end_dt)
+                else:
+                    positions = RobotPositionsAPIBase.TAIL.get(self._get_entity(), since, time.time(), self.__fetch_tail)
+            except DeadlineExceeded as e:
+                # the partial positions are not cached
+                key = None
+                positions = self._get_partial_positions(e, since, headers)
+            if since is not None:
+                headers['X-Positions-Cursor'] = repr(positions[-1][0] if positions else since)
+        response = self._make_response(positions, headers, max_points, tolerance, fmt)
+        return response if key is None or self.incomplete else self._cache_response(key, response)
+
+    def _get_partial_positions(self, e, since, headers):
+        """
+        return the positions retrieved before the deadline, and mark the response as partial in headers.
+        The positions from X-Positions-Resume (or X-Positions-Cursor in the tail mode) should be retrieved again.
+        """
+        RobotPositionsAPIBase.METRICS.inc('robot_positions_partial_total')
+        positions = [(epoch, point) for epoch, point in e.result or [] if since is None or epoch > since]
+        headers['X-Positions-Partial'] = 'true'
+        if since is None and e.resume is not None:
+            headers['X-Positions-Resume'] = datetime.fromtimestamp(e.resume, self.tz).isoformat()
+        logger.warning(f'return partial positions, count={len(positions)}, resume={e.resume}')
+        return positions
+
+    def _get_cached_response(self, end_dt, fmt):
+        """
+        return the key of the response of a window closed SETTLE_DELAY before now, or None if the window may still
+        change, and the response which is served without retrieving the positions (304 Not Modified or the cached body)
+        if any. The response of a request whose positions are incomplete must not be cached by _cache_response().
+        """
+        if end_dt.timestamp() > time.time() - RobotPositionsAPIBase.SETTLE_DELAY:
+            return None, None
+        key = (request.path, self._get_entity(), str(self.tz), fmt, tuple(sorted(request.args.items(multi=True))))
+        encoding = self.__get_encoding()
+        etag = responses.get_etag(key, encoding)
+        if request.if_none_match.contains_weak(etag):
+            RobotPositionsAPIBase.METRICS.inc('robot_positions_not_modified_total')
+            return key, self.__set_cache_headers(Response(status=304), etag)
+
+        cached = RobotPositionsAPIBase.RESPONSES.get(key, encoding)
+        if cached is None:
+            return key, None
+        RobotPositionsAPIBase.METRICS.inc('robot_positions_cached_responses_total')
+        return key, self.__to_response(cached, etag, encoding)
+
+    def _cache_response(self, key, response):
+        """
+        cache the response of a closed window, and return it in the content coding accepted by the client.
+        """
+        encoding = self.__get_encoding()
+        with self.timings.measure('serialize'):
+            headers = [(name, value) for name, value in response.headers.items()
+                       if name in ('X-Original-Count', 'X-Resolution')]
+            cached = RobotPositionsAPIBase.RESPONSES.set(key, response.get_data(), response.mimetype, headers, encoding)
+        return self.__to_response(cached, responses.get_etag(key, encoding), encoding)
+
+    def __get_encoding(self):
+        if 'Accept-Encoding' not in request.headers:
+            return None
+        return request.accept_encodings.best_match(responses.ENCODINGS)
+
+    def __to_response(self, cached, etag, encoding):
+        response = Response(cached.body, mimetype=cached.mimetype)
+        response.headers.extend(cached.headers)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        return self.__set_cache_headers(response, etag)
+
+    def __set_cache_headers(self, response, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={RobotPositionsAPIBase.MAX_AGE}, immutable'
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        return response
+
+    def _make_response(self, positions, headers, max_points, tolerance, fmt):
+        """
+        simplify the positions if max_points or tolerance is given, and return them in fmt with headers.
+        """
+        if max_points is not None or tolerance is not None:
+            headers['X-Original-Count'] = str(len(positions))
+            positions = self.__simplify(positions, max_points, tolerance)
+        RobotPositionsAPIBase.METRICS.inc('robot_positions_rows_total', len(positions))
+
+        with self.timings.measure('serialize'):
+            if fmt == 'binary':
+                response = Response(columnar.pack(positions), mimetype=const.MIMETYPE_BINARY)
+            elif fmt == 'columnar':
+                response = jsonify(columnar.to_columns(positions))
+            else:
+                response = jsonify([point for _, point in positions])
+        response.headers.extend(headers)
+        return response
+
+    def __get_batch(self, entity_ids):
+        if 'since' in request.args or 'resolution' in request.args or 'bbox' in request.args:
+            raise BadRequest({'message': 'query parameter "since", "resolution" and "bbox" can not be used with "ids"'})
+        start_dt, end_dt = self._parse_params()
+        max_points, tolerance = self._parse_simplify_params()
+        self._check_planar(max_points, tolerance, None)
+        fmt = self._parse_format()
+        if fmt == 'binary':
+            if 'format' in request.args:
+                raise BadRequest({'message': 'query parameter "format" can not be "binary" with "ids"'})
+            fmt = 'json'
+
+        with self.timings.measure('fetch'):
+            batch = self._get_batch_positions(entity_ids, start_dt, end_dt)
+
+        result = dict()
+        for entity_id, positions, error, resume in batch:
+            if error is not None:
+                result[entity_id] = {'error': error}
+                continue
+            entity = dict()
+            if resume is not None:
+                entity['partial'] = True
+                entity['resume'] = datetime.fromtimestamp(resume, self.tz).isoformat()
+            if max_points is not None or tolerance is not None:
+                entity['original_count'] = len(positions)
+                positions = self.__simplify(positions, max_points, tolerance)
+            RobotPositionsAPIBase.METRICS.inc('robot_positions_rows_total', len(positions))
+            if fmt == 'columnar':
+                entity['columns'] = columnar.to_columns(positions)
+            else:
+                entity['positions'] = [point for _, point in positions]
+            result[entity_id] = entity
+        with self.timings.measure('serialize'):
+            return jsonify(result)
+
+    def __simplify(self, positions, max_points, tolerance):
+        start = time.perf_counter()
+        epochs = {id(point): epoch for epoch, point in positions}
+        points = [point for _, point in positions if 'x' in point and 'y' in point]
+        if tolerance is not None:
+            points = simplify.douglas_peucker(points, tolerance)
+        if max_points is not None:
+            points = simplify.lttb(points, max_points)
+        logger.debug(f'simplify positions, max_points={max_points}, tolerance={tolerance}, '
+                     f'original_count={len(positions)}, count={len(points)}')
+        self.timings.add('simplify', time.perf_counter() - start)
+        return [(epochs[id(point)], point) for point in points]
+
+    def _iter_positions(self, start_dt, end_dt):
+        """
+        yield the positions between start_dt and end_dt as (epoch, point) in time order.
+        """
+        raise NotImplementedError()
+
+    def _get_positions(self, start_dt, end_dt):
+        return list(self._iter_positions(start_dt, end_dt))
+
+    def _get_viewport_positions(self, start_dt, end_dt, bbox, pixel):
+        """
+        return the positions between start_dt and end_dt in bbox, thinned to the level of detail of pixel.
+        """
+        try:
+            positions = self._get_positions(start_dt, end_dt)
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(self._thin_positions(e.result or [], bbox, pixel), e.resume) from e
+        return self._thin_positions(positions, bbox, pixel)
+
+    def _thin_positions(self, positions, bbox, pixel):
+        pyramid = lod.LODPyramid(positions, RobotPositionsAPIBase.LOD_BASE, RobotPositionsAPIBase.LOD_LEVELS)
+        return pyramid.query(bbox, pyramid.get_level(pixel))
+
+    def _get_entity(self):
+        """
+        return the key which identifies the entity and the fields of this view.
+        """
+        raise NotImplementedError()
+
+    def _get_attrs(self):
+        """
+        return the configured attributes of a position. A position is made from the first attribute.
+        """
+        raise NotImplementedError()
+
+    def _get_max_entities(self):
+        return 0
+
+    def _get_aggregate_max_points(self):
+        return int(const.DEFAULT_AGGREGATE_MAX_POINTS)
+
+    def _get_aggregated_positions(self, start_dt, end_dt, resolution):
+        """
+        return the positions made from the means of each period of resolution between start_dt and end_dt.
+        """
+        raise BadRequest({'message': 'query parameter "resolution" is not supported'})
+
+    def _get_batch_positions(self, entity_ids, start_dt, end_dt):
+        """
+        return (entity_id, positions, error message, resume) of each entity id. positions is None if error is not None,
+        and resume is the epoch seconds from which the positions are not retrieved before the deadline, or None.
+        The positions of an entity other than the configured one can not be retrieved by default.
+        """
+        raise BadRequest({'message': 'query parameter "ids" is not supported'})
+
+    def __fetch_tail(self, start_ts, end_ts):
+        return self._get_positions(datetime.fromtimestamp(start_ts, self.tz), datetime.fromtimestamp(end_ts, self.tz))
+
+    def __generate_json(self, positions, start_dt):
+        """
+        generate the same json array as jsonify chunk by chunk. The headers have been sent when the retrieval fails
+        or the deadline passes, so the array is ended by {"partial": true, "resume": <time>} instead, where the
+        positions from resume (just after the last streamed position) should be retrieved again.
+        """
+        separator = '['
+        chunk = list()
+        num = 0
+        last = None
+        marker = None
+        try:
+            for epoch, point in positions:
+                num += 1
+                last = epoch
+                chunk.append(separator)
+                chunk.append(json.dumps(point, separators=(',', ':')))
+                separator = ','
+                if len(chunk) >= const.STREAM_CHUNK_POINTS * 2:
+                    yield ''.join(chunk)
+                    chunk = list()
+        except DeadlineExceeded:
+            RobotPositionsAPIBase.METRICS.inc('robot_positions_partial_total')
+            logger.warning(f'the deadline has passed, the stream is truncated after {num} positions')
+            marker = {'partial': True}
+        except CometError as e:
+            RobotPositionsAPIBase.METRICS.inc('robot_positions_errors_total')
+            logger.error(f'the stream is truncated after {num} positions, error={str(e)}')
+            marker = {'partial': True, 'error': str(e)}
+        if marker is not None:
+            resume = start_dt if last is None else datetime.fromtimestamp(last + 0.000001, self.tz)
+            marker['resume'] = resume.isoformat()
+            chunk.append(separator)
+            chunk.append(json.dumps(marker, separators=(',', ':')))
+            separator = ','
+        chunk.append('[]\n' if separator == '[' else ']\n')
+        yield ''.join(chunk)
+        RobotPositionsAPIBase.METRICS.inc('robot_positions_rows_total', num)
+        RobotPositionsAPIBase.METRICS.flush()
+
+
+class RobotPositionsAPIv1(RobotPositionsAPIBase):
+    ATTRS = parse_attrs(os.environ.get(const.POSITION_ATTRS, const.DEFAULT_MONGO_ATTRS))
+    READER = MongoReader(os.environ.get(const.MONGODB_ENDPOINT),
+                         os.environ.get(const.MONGODB_REPLICASET),
+                         os.environ.get(const.MONGODB_DATABASE),
+                         os.environ.get(const.MONGODB_COLLECTION),
+                         os.environ.get(const.CYGNUS_MONGO_ATTR_PERSISTENCE, const.DEFAULT_CYGNUS_MONGO_ATTR_PERSISTENCE),
+                         os.environ.get(const.MONGODB_CREATE_INDEX,
+                                        const.DEFAULT_MONGODB_CREATE_INDEX).lower() in ('true', '1'))
+
+    def _iter_positions(self, start_dt, end_dt):
+        return RobotPositionsAPIv1.READER.iter_positions(merge.TimeConverter(self.tz), start_dt, end_dt, self.fields)
+
+    def _get_entity(self):
+        return (RobotPositionsAPIv1.READER.database, RobotPositionsAPIv1.READER.collection, self.fields)
+
+    def _get_attrs(self):
+        return RobotPositionsAPIv1.ATTRS
+
 
 class RobotPositionsAPIv2(RobotPositionsAPIBase):
     ENDPOINT = os.environ.get(const.COMET_ENDPOINT)
@@ -58,77 +534,327 @@ class RobotPositionsAPIv2(RobotPositionsAPIBase):
     ENTITY_TYPE = os.environ.get(const.ENTITY_TYPE)
     ENTITY_ID = os.environ.get(const.ENTITY_ID)
     FETCH_LIMIT = int(os.environ.get(const.FETCH_LIMIT, const.DEFAULT_FETCH_LIMIT))
+    PAGER = AdaptivePager(FETCH_LIMIT,
+                          int(os.environ.get(const.FETCH_LIMIT_MIN, FETCH_LIMIT)),
+                          int(os.environ.get(const.FETCH_LIMIT_MAX, FETCH_LIMIT)),
+                          float(os.environ.get(const.FETCH_TARGET_LATENCY, const.DEFAULT_FETCH_TARGET_LATENCY)))
+    ATTRS = parse_attrs(os.environ.get(const.POSITION_ATTRS, const.DEFAULT_COMET_ATTRS))
+    SESSION = CometSession(int(os.environ.get(const.COMET_FETCH_CONCURRENCY, const.DEFAULT_COMET_FETCH_CONCURRENCY)),
+                           int(os.environ.get(const.COMET_POOL_MAXSIZE, const.DEFAULT_COMET_POOL_MAXSIZE)),
+                           float(os.environ.get(const.COMET_TIMEOUT, const.DEFAULT_COMET_TIMEOUT)),
+                           int(os.environ.get(const.COMET_RETRY, const.DEFAULT_COMET_RETRY)),
+                           float(os.environ.get(const.COMET_RETRY_BACKOFF, const.DEFAULT_COMET_RETRY_BACKOFF)),
+                           RobotPositionsAPIBase.METRICS)
+    BATCH_MAX_ENTITIES = int(os.environ.get(const.BATCH_MAX_ENTITIES, const.DEFAULT_BATCH_MAX_ENTITIES))
+    AGGREGATE_MAX_POINTS = int(os.environ.get(const.AGGREGATE_MAX_POINTS, const.DEFAULT_AGGREGATE_MAX_POINTS))
+    CACHE_PATH = os.environ.get(const.POSITION_CACHE_PATH)
+    CACHE = PositionCache(
+        SQLiteBackend(CACHE_PATH, int(os.environ.get(const.POSITION_CACHE_MAX_BYTES, const.DEFAULT_POSITION_CACHE_MAX_BYTES)))
+        if CACHE_PATH else
+        MemoryBackend(int(os.environ.get(const.POSITION_CACHE_SIZE, const.DEFAULT_POSITION_CACHE_SIZE))),
+        int(os.environ.get(const.POSITION_CACHE_BUCKET, const.DEFAULT_POSITION_CACHE_BUCKET)),
+        RobotPositionsAPIBase.SETTLE_DELAY,
+        RobotPositionsAPIBase.METRICS)
+    STORE = PositionStore(os.environ.get(const.POSITION_STORE_DIR))
+    LOD_BUCKET = int(os.environ.get(const.LOD_BUCKET, const.DEFAULT_LOD_BUCKET))
+    LOD = MemoryBackend(int(os.environ.get(const.LOD_CACHE_SIZE, const.DEFAULT_LOD_CACHE_SIZE)))
 
-    def get(self):
-        start_dt, end_dt = [dt.isoformat() for dt in super()._parse_params()]
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.converter = merge.TimeConverter(self.tz)
 
-        points = OrderedDict()
-        for attr in self.__send_request_to_comet('x', start_dt, end_dt):
-            recv_time = attr['recvTime']
-            if recv_time not in points:
-                points[recv_time] = {'time': parser.parse(recv_time).astimezone(self.tz).isoformat()}
-            points[recv_time]['x'] = float(attr['attrValue'])
+    def _get_entity(self):
+        return (RobotPositionsAPIv2.ENTITY_TYPE, RobotPositionsAPIv2.ENTITY_ID, self.fields)
 
-        for attrName in ('y'):
-            for attr in self.__send_request_to_comet(attrName, start_dt, end_dt):
-                recv_time = attr['recvTime']
-                if recv_time in points:
-                    points[recv_time][attrName] = float(attr['attrValue'])
+    def _get_attrs(self):
+        return RobotPositionsAPIv2.ATTRS
 
-        return jsonify(list(points.values()))
+    def _iter_positions(self, start_dt, end_dt):
+        entity = self._get_entity()
+        cache = RobotPositionsAPIv2.CACHE
+        before, positions, after = self._split_by_store(start_dt.timestamp(), end_dt.timestamp())
+        return chain(cache.iter(entity, *before, time.time(), self.__iter_positions, self.deadline) if before else [],
+                     positions,
+                     cache.iter(entity, *after, time.time(), self.__iter_positions, self.deadline) if after else [])
 
-    def __send_request_to_comet(self, attr, start_dt, end_dt):
-        logger.debug(f'get "{attr}" from {start_dt} to {end_dt}')
-        headers = dict()
-        headers['Fiware-Service'] = RobotPositionsAPIv2.FIWARE_SERVICE
-        headers['Fiware-Servicepath'] = RobotPositionsAPIv2.FIWARE_SERVICEPATH
-
-        path = os.path.join(const.BASE_PATH,
-                            "type",
-                            RobotPositionsAPIv2.ENTITY_TYPE,
-                            "id",
-                            RobotPositionsAPIv2.ENTITY_ID,
-                            "attributes",
-                            attr)
-        endpoint = urljoin(RobotPositionsAPIv2.ENDPOINT, path)
-
-        current_num = 0
-        result = list()
+    def _get_positions(self, start_dt, end_dt):
+        entity = self._get_entity()
+        cache = RobotPositionsAPIv2.CACHE
+        before, positions, after = self._split_by_store(start_dt.timestamp(), end_dt.timestamp())
+        if before:
+            positions = cache.get(entity, *before, time.time(), self.__fetch, self.deadline) + positions
+        if after:
+            try:
+                positions = positions + cache.get(entity, *after, time.time(), self.__fetch, self.deadline)
+            except DeadlineExceeded as e:
+                raise DeadlineExceeded(positions + e.result, e.resume) from e
+        return positions
+
+    def _get_viewport_positions(self, start_dt, end_dt, bbox, pixel):
+        """
+        use the pyramids of the closed buckets of LOD_BUCKET seconds which are entirely in the window, which are
+        built once in a process, and thin the positions of the partial buckets at both ends for each request.
+        The pyramids built from incomplete positions are used for this request only.
+        """
+        seconds = RobotPositionsAPIv2.LOD_BUCKET
+        start_ts = start_dt.timestamp()
+        end_ts = end_dt.timestamp()
+        first = math.ceil(start_ts / seconds)
+        last = min(math.floor(end_ts / seconds),
+                   math.floor((time.time() - RobotPositionsAPIBase.SETTLE_DELAY) / seconds)) - 1
+        if not RobotPositionsAPIv2.LOD.is_enabled() or seconds <= 0 or first > last:
+            return super()._get_viewport_positions(start_dt, end_dt, bbox, pixel)
+
+        entity = self._get_entity()
+        pyramids = {index: RobotPositionsAPIv2.LOD.get((entity, index)) for index in range(first, last + 1)}
+        positions = list()
+        try:
+            if start_ts < first * seconds:
+                positions.extend(super()._get_viewport_positions(start_dt, self.__to_datetime(first * seconds - 1e-6),
+                                                                 bbox, pixel))
+            for index in range(first, last + 1):
+                if pyramids[index] is None:
+                    run = [index]
+                    while run[-1] < last and pyramids[run[-1] + 1] is None:
+                        run.append(run[-1] + 1)
+                    try:
+                        pyramids.update(self.__build_pyramids(entity, run))
+                    except DeadlineExceeded as e:
+                        raise DeadlineExceeded(self._thin_positions(e.result, bbox, pixel), e.resume) from e
+                positions.extend(pyramids[index].query(bbox, pyramids[index].get_level(pixel)))
+            if (last + 1) * seconds <= end_ts:
+                positions.extend(super()._get_viewport_positions(self.__to_datetime((last + 1) * seconds), end_dt,
+                                                                 bbox, pixel))
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(positions + e.result, e.resume) from e
+        return positions
+
+    def __build_pyramids(self, entity, run):
+        seconds = RobotPositionsAPIv2.LOD_BUCKET
+        buckets = {index: list() for index in run}
+        incomplete = self.incomplete
+        self.incomplete = False
+        for epoch, point in self._get_positions(self.__to_datetime(run[0] * seconds),
+                                                self.__to_datetime((run[-1] + 1) * seconds - 1e-6)):
+            index = math.floor(epoch / seconds)
+            if index in buckets:
+                buckets[index].append((epoch, point))
+        complete = not self.incomplete
+        self.incomplete = incomplete or not complete
+
+        pyramids = dict()
+        for index, positions in buckets.items():
+            pyramids[index] = lod.LODPyramid(positions, RobotPositionsAPIBase.LOD_BASE, RobotPositionsAPIBase.LOD_LEVELS)
+            if complete:
+                RobotPositionsAPIv2.LOD.set((entity, index), pyramids[index])
+        logger.debug(f'build the levels of detail, entity={entity}, buckets={run[0]}..{run[-1]}, complete={complete}')
+        return pyramids
+
+    def __to_datetime(self, ts):
+        return datetime.fromtimestamp(ts, self.tz)
+
+    def _split_by_store(self, start_ts, end_ts):
+        """
+        return the range before the local store, the positions in the store and the range after the store between
+        start_ts and end_ts. The ranges are retrieved from sth-comet, and are None if they are empty.
+        """
+        store = RobotPositionsAPIv2.STORE
+        start_us = int(round(start_ts * 1000000))
+        end_us = int(round(end_ts * 1000000))
+        try:
+            covered = store.get_range((RobotPositionsAPIv2.ENTITY_TYPE, RobotPositionsAPIv2.ENTITY_ID), self.fields)
+            if covered is None or covered[1] < start_us or end_us < covered[0]:
+                return (start_ts, end_ts), [], None
+            first_us, last_us = covered
+            positions = store.get_positions(self.converter, self.fields, max(start_us, first_us), min(end_us, last_us))
+        except (OSError, ValueError) as e:
+            logger.warning(f'can not read the position store, error={str(e)}')
+            return (start_ts, end_ts), [], None
+        logger.debug(f'read {len(positions)} positions from the position store')
+        before = (start_ts, (first_us - 1) / 1000000) if start_us < first_us else None
+        after = ((last_us + 1) / 1000000, end_ts) if last_us < end_us else None
+        return before, positions, after
+
+    def _get_max_entities(self):
+        return RobotPositionsAPIv2.BATCH_MAX_ENTITIES
+
+    def _get_aggregate_max_points(self):
+        return RobotPositionsAPIv2.AGGREGATE_MAX_POINTS
 
-        while True:
-            params = {
-                'hLimit': RobotPositionsAPIv2.FETCH_LIMIT,
-                'hOffset': current_num,
-                'dateFrom': start_dt,
-                'dateTo': end_dt,
-                'count': 'true',
-            }
-
-            response = requests.get(endpoint, headers=headers, params=params)
-
-            if response.status_code != 200:
-                logger.error(f'can not retrieve data from sth-coment, status_code={response.status_code}, '
-                             f'data={response.text}')
-                return []
+    def _get_aggregated_positions(self, start_dt, end_dt, resolution):
+        client = RobotPositionsAPIv2.__get_client(self.timings, self.deadline)
+        try:
+            aggregates = client.fetch_aggregates(self.fields, resolution, start_dt.isoformat(), end_dt.isoformat(),
+                                                 strict=True)
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded([], e.resume) from e
+        except IncompleteError as e:
+            self.incomplete = True
+            aggregates = e.result
+        with self.timings.measure('merge'):
+            return merge.to_mean_positions(self.converter, self.fields, [aggregates[attr] for attr in self.fields],
+                                           dict(const.AGGREGATE_RESOLUTIONS)[resolution],
+                                           start_dt.timestamp(), end_dt.timestamp())
+
+    def _get_batch_positions(self, entity_ids, start_dt, end_dt):
+        """
+        retrieve the positions of the entities of ENTITY_TYPE concurrently.
+
+        The threads of each entity only wait for the pages requested through SESSION, so the requests to sth-comet
+        are bounded by COMET_FETCH_CONCURRENCY shared by all the entities.
+        """
+        start_ts = start_dt.timestamp()
+        end_ts = end_dt.timestamp()
+        now = time.time()
+        with ThreadPoolExecutor(max_workers=len(entity_ids)) as executor:
+            futures = [(entity_id, executor.submit(RobotPositionsAPIv2.CACHE.get,
+                                                   (RobotPositionsAPIv2.ENTITY_TYPE, entity_id, self.fields),
+                                                   start_ts, end_ts, now,
+                                                   partial(self.__fetch, entity_id=entity_id, strict=True),
+                                                   self.deadline))
+                       for entity_id in entity_ids]
+
+        result = list()
+        for entity_id, future in futures:
             try:
-                count = int(response.headers.get('fiware-total-count', '0'))
-                logger.debug(f'total-count of {attr} = {count}')
-                if count == 0:
-                    logger.warning(f'total-count is 0, continue')
-                    continue
-            except (ValueError, TypeError) as e:
-                logger.error(f'invalid fiware-total-count, fiware-total-count={response.get("fiware-total-count")}'
-                             f'error={str(e)}')
-                return []
-
-            result.extend(response.json()["contextResponses"][0]["contextElement"]["attributes"][0]["values"])
-            logger.debug(f'result length of {attr} = {len(result)}')
-
-            current_num += RobotPositionsAPIv2.FETCH_LIMIT
-            logger.debug(f'next fetch count of {attr} = {current_num}')
-            if current_num >= count:
-                break
-
-        logger.info(f'retrieve {len(result)} data, entity_type={RobotPositionsAPIv2.ENTITY_TYPE}, '
-                    f'entity_id={RobotPositionsAPIv2.ENTITY_ID}, attr={attr}, start_dt={start_dt}, end_dt={end_dt}')
+                result.append((entity_id, future.result(), None, None))
+            except DeadlineExceeded as e:
+                result.append((entity_id, e.result, None, e.resume))
+            except CometError as e:
+                logger.error(f'can not retrieve positions, entity_id={entity_id}, error={str(e)}')
+                result.append((entity_id, None, str(e), None))
         return result
+
+    def __iter_positions(self, start_ts, end_ts):
+        start_dt = datetime.fromtimestamp(start_ts, self.tz).isoformat()
+        end_dt = datetime.fromtimestamp(end_ts, self.tz).isoformat()
+
+        client = RobotPositionsAPIv2.__get_client(self.timings, self.deadline)
+        primary = self.fields[0]
+        primary_values = chain.from_iterable(client.iter_values(primary, start_dt, end_dt))
+        others = [(attr, chain.from_iterable(client.iter_values(attr, start_dt, end_dt))) for attr in self.fields[1:]]
+        heads = [next(values, None) for _, values in others]
+
+        current_time = None
+        current = None
+        for attr in primary_values:
+            recv_time = attr['recvTime']
+            if recv_time != current_time:
+                if current is not None:
+                    yield current
+                epoch, iso_time = self.converter.convert_one(recv_time)
+                current_time = recv_time
+                current = (epoch, {'time': iso_time})
+            current[1][primary] = float(attr['attrValue'])
+
+            for k, (name, values) in enumerate(others):
+                head = heads[k]
+                while head is not None and head['recvTime'] < recv_time:
+                    head = next(values, None)
+                while head is not None and head['recvTime'] == recv_time:
+                    current[1][name] = float(head['attrValue'])
+                    head = next(values, None)
+                heads[k] = head
+        if current is not None:
+            yield current
+
+    def __fetch(self, start_ts, end_ts, entity_id=None, strict=False):
+        """
+        return the positions between start_ts and end_ts. If some attrs can not be retrieved, CometError is raised
+        if strict, or IncompleteError is raised with the positions of the other attrs, which are not cached.
+        """
+        start_dt = datetime.fromtimestamp(start_ts, self.tz).isoformat()
+        end_dt = datetime.fromtimestamp(end_ts, self.tz).isoformat()
+
+        client = RobotPositionsAPIv2.__get_client(self.timings, self.deadline, entity_id)
+        try:
+            attrs = client.fetch(self.fields, start_dt, end_dt, strict=True)
+        except DeadlineExceeded as e:
+            raise DeadlineExceeded(self._to_positions(e.result), e.resume) from e
+        except IncompleteError as e:
+            if strict:
+                raise CometError(str(e)) from e
+            self.incomplete = True
+            raise IncompleteError(str(e), self._to_positions(e.result)) from e
+        return self._to_positions(attrs)
+
+    def _to_positions(self, attrs):
+        """
+        return the positions merged from the values of each attr retrieved from sth-comet.
+        """
+        with self.timings.measure('merge'):
+            return merge.to_positions(self.fields, *merge.join(self.converter, [attrs[attr] for attr in self.fields]))
+
+    @classmethod
+    def __get_client(cls, timings, deadline, entity_id=None):
+        return CometClient(cls.SESSION,
+                           cls.ENDPOINT,
+                           cls.FIWARE_SERVICE,
+                           cls.FIWARE_SERVICEPATH,
+                           cls.ENTITY_TYPE,
+                           entity_id if entity_id is not None else cls.ENTITY_ID,
+                           cls.PAGER,
+                           timings,
+                           deadline)
+
+
+class RobotAnalyticsAPI(RobotPositionsAPIv2):
+    """
+    the travel distance, the speed profile, the idle periods and the occupancy heatmap of the positions between
+    st and et, which are computed from the same positions as /positions/ so that the track is not transferred.
+    """
+    NAME = 'robot_analytics_api'
+    IDLE_SPEED = float(os.environ.get(const.ANALYTICS_IDLE_SPEED, const.DEFAULT_ANALYTICS_IDLE_SPEED))
+    IDLE_SECONDS = float(os.environ.get(const.ANALYTICS_IDLE_SECONDS, const.DEFAULT_ANALYTICS_IDLE_SECONDS))
+    CELL = float(os.environ.get(const.ANALYTICS_CELL, const.DEFAULT_ANALYTICS_CELL))
+
+    def get(self):
+        metrics = RobotPositionsAPIBase.METRICS
+        metrics.inc('robot_analytics_requests_total')
+        start = time.perf_counter()
+        try:
+            response = self.__get()
+        except Exception:
+            metrics.inc('robot_analytics_errors_total')
+            metrics.flush()
+            raise
+        return self._finish_response(response, start)
+
+    def _parse_analytics_params(self):
+        try:
+            idle_speed = float(request.args.get('idle_speed', RobotAnalyticsAPI.IDLE_SPEED))
+            idle_seconds = float(request.args.get('idle_seconds', RobotAnalyticsAPI.IDLE_SECONDS))
+            cell = float(request.args.get('cell', RobotAnalyticsAPI.CELL))
+        except ValueError:
+            raise BadRequest({'message': 'invalid query parameter "idle_speed", "idle_seconds" and/or "cell"'})
+        if not (0.0 <= idle_speed < float('inf') and 0.0 <= idle_seconds < float('inf') and 0.0 < cell < float('inf')):
+            raise BadRequest({'message': 'invalid query parameter "idle_speed", "idle_seconds" and/or "cell"'})
+        return idle_speed, idle_seconds, cell
+
+    def __get(self):
+        start_dt, end_dt = self._parse_params()
+        resolution = self._parse_resolution(start_dt, end_dt, self._get_aggregate_max_points(), 'auto')
+        idle_speed, idle_seconds, cell = self._parse_analytics_params()
+
+        key, response = self._get_cached_response(end_dt, 'json')
+        if response is not None:
+            return response
+
+        headers = {'X-Resolution': resolution}
+        with self.timings.measure('fetch'):
+            try:
+                positions = self._get_positions(start_dt, end_dt)
+            except DeadlineExceeded as e:
+                # the analytics of the partial positions are not cached
+                key = None
+                positions = self._get_partial_positions(e, None, headers)
+        with self.timings.measure('analyze'):
+            result = analytics.analyze(positions, dict(const.AGGREGATE_RESOLUTIONS)[resolution],
+                                       idle_speed, idle_seconds, cell)
+        logger.debug(f'analyze positions, count={len(positions)}, segments={len(result["segments"])}, '
+                     f'idle={len(result["idle"])}, bins={len(result["heatmap"]["bins"])}')
+
+        with self.timings.measure('serialize'):
+            response = jsonify(result)
+        response.headers.extend(headers)
+        return response if key is None or self.incomplete else self._cache_response(key, response)
@@ -22,7 +22,8 @@ def app_config():
 
 
 @pytest.fixture(scope='function', autouse=True)
-def setup():
+def setup(tmp_path_factory):
+    os.environ[const.METRICS_DIR] = str(tmp_path_factory.getbasetemp() / 'metrics')
     os.environ[const.MONGODB_ENDPOINT] = 'mongo'
     os.environ[const.MONGODB_REPLICASET] = 'rs'
     os.environ[const.MONGODB_DATABASE] = 'db'
@@ -32,6 +33,11 @@ def setup():
     os.environ[const.FIWARE_SERVICEPATH] = '/fiware-servicepath'
     os.environ[const.ENTITY_TYPE] = 'entity-type'
     os.environ[const.ENTITY_ID] = 'entity-id'
+    import src.views
+    src.views.RobotPositionsAPIv2.CACHE.clear()
+    src.views.RobotPositionsAPIBase.TAIL.clear()
+    src.views.RobotPositionsAPIv2.LOD.clear()
+    src.views.RobotPositionsAPIBase.RESPONSES.clear()
     yield
 
 
@@ -56,6 +62,39 @@ def teardown():
         del os.environ[const.ENTITY_TYPE]
     if const.ENTITY_ID in os.environ:
         del os.environ[const.ENTITY_ID]
+    if const.API_VERSION in os.environ:
+        del os.environ[const.API_VERSION]
+    if const.METRICS_DIR in os.environ:
+        del os.environ[const.METRICS_DIR]
+
+
+@pytest.fixture
+def clientv1():
+    os.environ[const.API_VERSION] = 'v1'
+    import main
+    importlib.reload(main)
+    return main.app.test_client()
+
+
+@pytest.fixture
+def mongo():
+    import mongomock
+    import src.views
+    client = mongomock.MongoClient()
+    src.views.RobotPositionsAPIv1.READER.client = client
+    yield client[os.environ[const.MONGODB_DATABASE]][os.environ[const.MONGODB_COLLECTION]]
+    src.views.RobotPositionsAPIv1.READER.client = None
+
+
+@pytest.fixture
+def set_column_persistence():
+    os.environ[const.CYGNUS_MONGO_ATTR_PERSISTENCE] = 'column'
+    import src.views
+    importlib.reload(src.views)
+    yield
+    if const.CYGNUS_MONGO_ATTR_PERSISTENCE in os.environ:
+        del os.environ[const.CYGNUS_MONGO_ATTR_PERSISTENCE]
+    importlib.reload(src.views)
 
 
 @pytest.fixture
@@ -82,3 +121,25 @@ def set_limit_as_2():
     yield
     if const.FETCH_LIMIT in os.environ:
         del os.environ[const.FETCH_LIMIT]
+
+
+@pytest.fixture
+def set_pose_attrs():
+    os.environ[const.POSITION_ATTRS] = 'x,y,z,theta'
+    import src.views
+    importlib.reload(src.views)
+    yield
+    if const.POSITION_ATTRS in os.environ:
+        del os.environ[const.POSITION_ATTRS]
+    importlib.reload(src.views)
+
+
+@pytest.fixture
+def metrics_dir(tmp_path):
+    os.environ[const.METRICS_DIR] = str(tmp_path)
+    os.environ[const.SERVER_TIMING] = 'true'
+    import src.views
+    importlib.reload(src.views)
+    yield str(tmp_path)
+    del os.environ[const.SERVER_TIMING]
+    importlib.reload(src.views)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from src import analytics
+
+
+def to_positions(points):
+    return [(float(epoch), {'time': str(epoch), 'x': x, 'y': y}) for epoch, x, y in points]
+
+
+class TestAnalyze:
+
+    @pytest.fixture(autouse=True, params=['numpy', 'python'])
+    def scan(self, request, monkeypatch):
+        if request.param == 'numpy' and analytics.np is None:
+            pytest.skip('numpy is not installed')
+        if request.param == 'python':
+            monkeypatch.setattr(analytics, 'np', None)
+        return request.param
+
+    def test_analyze(self):
+        # moves 3 then 4 along the axes, stays for 20 seconds, and moves 5 diagonally
+        positions = to_positions([(0, 0.0, 0.0), (1, 3.0, 0.0), (2, 3.0, 4.0), (12, 3.0, 4.0), (22, 3.0, 4.1),
+                                  (23, 6.0, 8.1)])
+        positions.insert(3, (5.0, {'time': '5', 'x': 9.0}))
+        result = analytics.analyze(positions, 10, 0.05, 10.0, 2.0)
+
+        summary = result['summary']
+        assert summary['count'] == 6
+        assert summary['distance'] == pytest.approx(12.1)
+        assert summary['duration'] == 23.0
+        assert summary['moving_seconds'] == 3.0
+        assert summary['idle_seconds'] == 20.0
+        assert summary['mean_speed'] == pytest.approx(12.1 / 23)
+        assert summary['max_speed'] == pytest.approx(5.0)
+
+        assert [(s['start'], s['end'], s['count']) for s in result['segments']] == \
+            [('0', '12', 3), ('12', '22', 1), ('22', '23', 2)]
+        assert [s['distance'] for s in result['segments']] == pytest.approx([7.0, 0.1, 5.0])
+        assert result['segments'][1]['mean_speed'] == pytest.approx(0.01)
+        assert result['segments'][0]['max_speed'] == pytest.approx(4.0)
+
+        assert result['idle'] == [{'start': '2', 'end': '22', 'seconds': 20.0,
+                                   'x': pytest.approx(3.0), 'y': pytest.approx(4.1 / 3 + 8.0 / 3)}]
+
+        assert result['heatmap']['cell'] == 2.0
+        assert result['heatmap']['bins'] == [
+            {'x': 0.0, 'y': 0.0, 'count': 1, 'seconds': 1.0},
+            {'x': 2.0, 'y': 0.0, 'count': 1, 'seconds': 1.0},
+            {'x': 2.0, 'y': 4.0, 'count': 3, 'seconds': 21.0},
+            {'x': 6.0, 'y': 8.0, 'count': 1, 'seconds': 0.0},
+        ]
+
+    def test_analyze_short_idle(self):
+        positions = to_positions([(0, 0.0, 0.0), (5, 0.0, 0.0), (6, 1.0, 0.0)])
+        result = analytics.analyze(positions, 60, 0.05, 10.0, 1.0)
+
+        assert result['summary']['idle_seconds'] == 5.0
+        assert result['idle'] == []
+
+    def test_analyze_empty(self):
+        result = analytics.analyze([], 60, 0.05, 10.0, 1.0)
+
+        assert result['summary'] == {'count': 0, 'distance': 0.0, 'duration': 0.0, 'moving_seconds': 0.0,
+                                     'idle_seconds': 0.0, 'mean_speed': None, 'max_speed': None}
+        assert result['segments'] == []
+        assert result['idle'] == []
+        assert result['heatmap']['bins'] == []
+
+    def test_analyze_single(self):
+        result = analytics.analyze(to_positions([(5, 1.0, 1.0)]), 60, 0.05, 10.0, 1.0)
+
+        assert result['summary']['count'] == 1
+        assert result['summary']['duration'] == 0.0
+        assert result['segments'] == [{'start': '5', 'end': '5', 'count': 1, 'distance': 0.0, 'duration': 0.0,
+                                       'mean_speed': None, 'max_speed': None}]
+        assert result['heatmap']['bins'] == [{'x': 1.0, 'y': 1.0, 'count': 1, 'seconds': 0.0}]
+
+    def test_analyze_wide_heatmap(self):
+        positions = to_positions([(0, -1e18, 0.0), (1, 1e18, 1e18), (2, -1e18, 0.0)])
+        result = analytics.analyze(positions, 60, 0.05, 10.0, 0.5)
+
+        assert result['heatmap']['bins'] == [
+            {'x': -1e18, 'y': 0.0, 'count': 2, 'seconds': 1.0},
+            {'x': 1e18, 'y': 1e18, 'count': 1, 'seconds': 1.0},
+        ]
+
+
+def test_analyze_same_by_numpy_and_python(monkeypatch):
+    if analytics.np is None:
+        pytest.skip('numpy is not installed')
+    rand = random.Random(0)
+    points = list()
+    epoch = 0.0
+    x, y = 0.0, 0.0
+    for _ in range(2000):
+        # repeated epochs, idle runs and jumps across the periods and the cells
+        epoch += rand.choice([0.0, 0.5, 1.0, 1.0, 7.0])
+        if rand.random() < 0.6:
+            x += rand.uniform(-2.0, 2.0)
+            y += rand.uniform(-2.0, 2.0)
+        points.append((epoch, x, y))
+    positions = to_positions(points)
+
+    expected = analytics.analyze(positions, 30, 0.05, 5.0, 1.5)
+    monkeypatch.setattr(analytics, 'np', None)
+    result = analytics.analyze(positions, 30, 0.05, 5.0, 1.5)
+
+    assert result['summary'] == pytest.approx(expected['summary'])
+    assert len(result['segments']) == len(expected['segments'])
+    for segment, expected_segment in zip(result['segments'], expected['segments']):
+        assert segment == pytest.approx(expected_segment)
+    assert len(result['idle']) == len(expected['idle']) > 0
+    for idle, expected_idle in zip(result['idle'], expected['idle']):
+        assert idle == pytest.approx(expected_idle)
+    assert len(result['heatmap']['bins']) == len(expected['heatmap']['bins'])
+    for bin_, expected_bin in zip(result['heatmap']['bins'], expected['heatmap']['bins']):
+        assert bin_ == pytest.approx(expected_bin)
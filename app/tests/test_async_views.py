@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import importlib
+import json
+import os
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src import const
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('a2wsgi')
+
+RECV_TIMES = ['2018-01-03T03:04:05.000Z', '2018-01-04T03:04:05.000Z', '2018-01-05T03:04:05.000Z',
+              '2018-01-06T03:04:05.000Z', '2018-01-07T03:04:05.000Z']
+
+
+class FakeComet:
+
+    def __init__(self):
+        self.requests = list()
+
+    def __call__(self, request):
+        self.requests.append(request)
+        attr = urlparse(str(request.url)).path.split('/')[-1]
+        params = parse_qs(urlparse(str(request.url)).query)
+        offset = int(params['hOffset'][0])
+        limit = int(params['hLimit'][0])
+        values = [{'recvTime': t, 'attrType': 'float', 'attrValue': i + (0.0 if attr == 'x' else 0.5)}
+                  for i, t in enumerate(RECV_TIMES)][offset:offset + limit]
+        body = {'contextResponses': [{'contextElement': {'attributes': [{'values': values}]}}]}
+        return httpx.Response(200, json=body, headers={'fiware-total-count': str(len(RECV_TIMES))})
+
+
+@pytest.fixture
+def comet():
+    return FakeComet()
+
+
+@pytest.fixture
+def asgi_app(comet):
+    os.environ[const.API_VERSION] = 'v2'
+    os.environ[const.FETCH_LIMIT] = '2'
+    import main
+    import src.views
+    import src.async_views
+    importlib.reload(src.views)
+    importlib.reload(src.async_views)
+    importlib.reload(main)
+    src.async_views.RobotPositionsAsyncAPI.SESSION.transport = httpx.MockTransport(comet)
+    yield src.async_views.PositionsASGI(main.app, 2)
+    del os.environ[const.FETCH_LIMIT]
+    importlib.reload(src.views)
+
+
+def request(app, path, params=None):
+    async def get():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+                return await client.get(path, params=params)
+        finally:
+            import src.async_views
+            await src.async_views.RobotPositionsAsyncAPI.SESSION.aclose()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(get())
+    finally:
+        loop.close()
+
+
+class TestPositionsASGI:
+
+    def test_get(self, asgi_app, comet):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = request(asgi_app, '/positions/', params)
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/json'
+        assert response.json() == [
+            {'time': '2018-01-03T12:04:05+09:00', 'x': 0.0, 'y': 0.5},
+            {'time': '2018-01-04T12:04:05+09:00', 'x': 1.0, 'y': 1.5},
+            {'time': '2018-01-05T12:04:05+09:00', 'x': 2.0, 'y': 2.5},
+            {'time': '2018-01-06T12:04:05+09:00', 'x': 3.0, 'y': 3.5},
+            {'time': '2018-01-07T12:04:05+09:00', 'x': 4.0, 'y': 4.5},
+        ]
+        assert len(comet.requests) == 6
+
+        response = request(asgi_app, '/positions/', params)
+        assert len(response.json()) == 5
+        assert len(comet.requests) == 6
+
+    def test_get_columnar_fields(self, asgi_app, comet):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'fields': 'x',
+                  'format': 'columnar'}
+        response = request(asgi_app, '/positions/', params)
+
+        assert response.status_code == 200
+        assert json.loads(response.content)['x'] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert {urlparse(str(r.url)).path.split('/')[-1] for r in comet.requests} == {'x'}
+
+    @pytest.mark.parametrize('params', [{}, {'st': 'invalid', 'et': '2018-01-08T03:04:05+09:00'}])
+    def test_get_invalid_params(self, asgi_app, comet, params):
+        response = request(asgi_app, '/positions/', params)
+
+        assert response.status_code == 400
+        assert response.json()['error'] == 'Bad Request'
+        assert not comet.requests
+
+    def test_analytics(self, asgi_app, comet, requests_mock):
+        def get_page(request, context):
+            offset = int(request.qs['hoffset'][0])
+            limit = int(request.qs['hlimit'][0])
+            context.headers['fiware-total-count'] = str(len(RECV_TIMES))
+            values = [{'recvTime': t, 'attrType': 'float', 'attrValue': float(i)}
+                      for i, t in enumerate(RECV_TIMES)][offset:offset + limit]
+            return {'contextResponses': [{'contextElement': {'attributes': [{'values': values}]}}]}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=get_page)
+        requests_mock.get(urlstr + 'y', json=get_page)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        for _ in range(2):
+            response = request(asgi_app, '/analytics/', params)
+
+            assert response.status_code == 200
+            assert response.json()['summary']['count'] == 5
+        assert not comet.requests
+
+    def test_locus_page(self, asgi_app, comet):
+        response = request(asgi_app, '/locus/')
+
+        assert response.status_code == 200
+        assert 'text/html' in response.headers['content-type']
+        assert not comet.requests
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import errno
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import src.cache
+from src.cache import MemoryBackend, SQLiteBackend, PositionCache
+from src.comet import IncompleteError
+from src.deadline import Deadline
+from src.metrics import Registry
+
+
+class Fetcher:
+
+    def __init__(self, epochs):
+        self.epochs = epochs
+        self.calls = list()
+
+    def __call__(self, start_ts, end_ts):
+        self.calls.append((start_ts, end_ts))
+        return [(e, {'time': e}) for e in self.epochs if start_ts <= e <= end_ts]
+
+
+class SlowFetcher(Fetcher):
+
+    def __init__(self, epochs, delay, fail=False):
+        super().__init__(epochs)
+        self.delay = delay
+        self.fail = fail
+
+    def __call__(self, start_ts, end_ts):
+        time.sleep(self.delay)
+        result = super().__call__(start_ts, end_ts)
+        if self.fail and len(self.calls) == 1:
+            raise IOError('failed')
+        return result
+
+
+def get_concurrently(caches, ranges, fetcher):
+    results = [None] * len(ranges)
+
+    def get(i):
+        try:
+            results[i] = [e for e, _ in caches[i].get('entity', ranges[i][0], ranges[i][1], 1000, fetcher)]
+        except IOError as e:
+            results[i] = e
+
+    threads = list()
+    for i in range(len(ranges)):
+        threads.append(threading.Thread(target=get, args=(i, )))
+        threads[-1].start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class ThreadRecordingBackend(MemoryBackend):
+
+    def __init__(self, max_points):
+        super().__init__(max_points)
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def contains(self, key):
+        self.threads.add(threading.get_ident())
+        return super().contains(key)
+
+    def set(self, key, value):
+        self.threads.add(threading.get_ident())
+        return super().set(key, value)
+
+
+class TestPositionCache:
+
+    @pytest.fixture
+    def fetcher(self):
+        return Fetcher(list(range(0, 1000, 5)))
+
+    def test_get_from_buckets(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+
+        result = cache.get('entity', 150, 420, 1000, fetcher)
+        assert [e for e, _ in result] == list(range(150, 421, 5))
+        assert fetcher.calls == [(100, 500)]
+        assert cache.stats() == {'hits': 0, 'misses': 4, 'coalesced': 0, 'size': 80}
+
+        result = cache.get('entity', 210, 380, 1000, fetcher)
+        assert [e for e, _ in result] == list(range(210, 381, 5))
+        assert fetcher.calls == [(100, 500)]
+        assert cache.stats() == {'hits': 2, 'misses': 4, 'coalesced': 0, 'size': 80}
+
+    def test_get_metrics(self, fetcher):
+        registry = Registry(None)
+        cache = PositionCache(MemoryBackend(1000), 100, registry=registry)
+
+        cache.get('entity', 150, 420, 1000, fetcher)
+        cache.get('entity', 210, 380, 1000, fetcher)
+
+        lines = registry.collect().splitlines()
+        assert 'position_cache_hits_total 2' in lines
+        assert 'position_cache_misses_total 4' in lines
+        assert 'position_cache_coalesced_total 0' in lines
+
+    def test_get_missing_edges(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+        cache.get('entity', 200, 399, 1000, fetcher)
+
+        result = cache.get('entity', 50, 650, 1000, fetcher)
+        assert [e for e, _ in result] == list(range(50, 651, 5))
+        assert fetcher.calls == [(200, 400), (0, 200), (400, 700)]
+
+    def test_get_open_bucket(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+
+        result = cache.get('entity', 150, 250, 230, fetcher)
+        assert [e for e, _ in result] == list(range(150, 251, 5))
+        assert fetcher.calls == [(100, 200), (200, 250)]
+
+        result = cache.get('entity', 150, 250, 230, fetcher)
+        assert fetcher.calls == [(100, 200), (200, 250), (200, 250)]
+        assert cache.stats()['size'] == 20
+
+    def test_get_settling_bucket(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100, 50)
+
+        cache.get('entity', 150, 250, 340, fetcher)
+        cache.get('entity', 150, 250, 340, fetcher)
+        assert fetcher.calls == [(100, 200), (200, 250), (200, 250)]
+
+    @pytest.mark.parametrize('backend', [MemoryBackend(1000), MemoryBackend(0)])
+    def test_get_open_bucket_shared(self, backend):
+        fetcher = SlowFetcher(list(range(0, 1300, 5)), 0.3)
+        cache = PositionCache(backend, 100)
+
+        # the open buckets from 1000, which are fetched while the positions are being persisted
+        results = get_concurrently([cache, cache, cache], [(1050, 1200), (1050, 1200), (1050, 1150)], fetcher)
+        assert results[0] == results[1] == list(range(1050, 1201, 5))
+        assert results[2] == list(range(1050, 1151, 5))
+        assert len(fetcher.calls) == 2
+        assert cache.stats()['coalesced'] == 1
+
+    def test_aget_open_bucket_shared(self):
+        fetcher = Fetcher(list(range(0, 1300, 5)))
+        cache = PositionCache(MemoryBackend(1000), 100)
+
+        async def fetch(start_ts, end_ts):
+            await asyncio.sleep(0.2)
+            return fetcher(start_ts, end_ts)
+
+        async def get_both():
+            return await asyncio.gather(cache.aget('entity', 1050, 1200, 1000, fetch),
+                                        cache.aget('entity', 1050, 1200, 1000, fetch))
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(get_both())
+        finally:
+            loop.close()
+        assert [e for e, _ in results[0]] == [e for e, _ in results[1]] == list(range(1050, 1201, 5))
+        assert fetcher.calls == [(1000, 1200)]
+        assert cache.stats()['coalesced'] == 1
+
+    def test_get_open_bucket_incomplete(self):
+        fetcher = SlowFetcher(list(range(0, 1300, 5)), 0.3)
+
+        def fetch(start_ts, end_ts):
+            result = fetcher(start_ts, end_ts)
+            if len(fetcher.calls) == 1:
+                raise IncompleteError('failed', result)
+            return result
+        cache = PositionCache(MemoryBackend(1000), 100)
+
+        results = get_concurrently([cache, cache], [(1050, 1150), (1050, 1150)], fetch)
+        assert results[0] == results[1] == list(range(1050, 1151, 5))
+        assert fetcher.calls == [(1000, 1150), (1000, 1150)]
+        assert cache.stats()['coalesced'] == 0
+
+    def test_evict(self, fetcher):
+        cache = PositionCache(MemoryBackend(40), 100)
+
+        cache.get('entity', 0, 99, 1000, fetcher)
+        cache.get('entity', 100, 199, 1000, fetcher)
+        cache.get('entity', 0, 99, 1000, fetcher)
+        cache.get('entity', 200, 299, 1000, fetcher)
+        assert cache.stats()['size'] == 40
+
+        cache.get('entity', 0, 99, 1000, fetcher)
+        cache.get('entity', 100, 199, 1000, fetcher)
+        assert fetcher.calls == [(0, 100), (100, 200), (200, 300), (100, 200)]
+
+    def test_get_incomplete(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+
+        def fetch_incomplete(start_ts, end_ts):
+            raise IncompleteError('failed', fetcher(start_ts, end_ts))
+
+        result = cache.get('entity', 150, 250, 1000, fetch_incomplete)
+        assert [e for e, _ in result] == list(range(150, 251, 5))
+        assert cache.stats()['size'] == 0
+
+        result = cache.get('entity', 150, 250, 1000, fetcher)
+        assert [e for e, _ in result] == list(range(150, 251, 5))
+        assert fetcher.calls == [(100, 300), (100, 300)]
+        assert cache.stats()['size'] == 40
+
+    def test_disabled(self, fetcher):
+        cache = PositionCache(MemoryBackend(0), 100)
+
+        cache.get('entity', 150, 250, 1000, fetcher)
+        cache.get('entity', 150, 250, 1000, fetcher)
+        assert fetcher.calls == [(150, 250), (150, 250)]
+
+    def test_coalesce(self):
+        cache = PositionCache(MemoryBackend(1000), 100)
+        fetcher = SlowFetcher(list(range(0, 1000, 5)), 0.3)
+
+        results = get_concurrently([cache] * 3, [(150, 420), (150, 420), (250, 480)], fetcher)
+        assert results[0] == results[1] == list(range(150, 421, 5))
+        assert results[2] == list(range(250, 481, 5))
+        assert fetcher.calls == [(100, 500)]
+        assert cache.stats()['coalesced'] == 7
+
+    def test_coalesce_failure(self):
+        cache = PositionCache(MemoryBackend(1000), 100)
+        fetcher = SlowFetcher(list(range(0, 1000, 5)), 0.3, fail=True)
+
+        results = get_concurrently([cache] * 2, [(150, 420), (150, 420)], fetcher)
+        assert isinstance(results[0], IOError)
+        assert results[1] == list(range(150, 421, 5))
+        assert len(fetcher.calls) == 2
+
+    def test_wait_stalled_stream(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+        stream = cache.iter('entity', 150, 420, 1000, fetcher)
+        assert next(stream)[0] == 150
+
+        start = time.monotonic()
+        result = cache.get('entity', 150, 420, 1000, fetcher, Deadline(0.3))
+        assert 0.3 <= time.monotonic() - start < 1.0
+        assert [e for e, _ in result] == list(range(150, 421, 5))
+        assert fetcher.calls == [(100, 500), (100, 500)]
+        stream.close()
+
+    def test_iter_claims_next_run(self, fetcher):
+        cache = PositionCache(MemoryBackend(1000), 100)
+        cache.get('entity', 200, 299, 1000, fetcher)
+        stream = cache.iter('entity', 150, 420, 1000, fetcher)
+        assert next(stream)[0] == 150
+
+        start = time.monotonic()
+        result = cache.get('entity', 300, 420, 1000, fetcher, Deadline(1.0))
+        assert time.monotonic() - start < 0.5
+        assert [e for e, _ in result] == list(range(300, 421, 5))
+        assert [e for e, _ in stream] == list(range(155, 421, 5))
+        assert fetcher.calls == [(200, 300), (100, 200), (300, 500)]
+
+    def test_aget_off_loop(self, fetcher):
+        backend = ThreadRecordingBackend(1000)
+        cache = PositionCache(backend, 100)
+
+        async def fetch(start_ts, end_ts):
+            return fetcher(start_ts, end_ts)
+
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(2):
+                result = loop.run_until_complete(cache.aget('entity', 150, 420, 1000, fetch))
+                assert [e for e, _ in result] == list(range(150, 421, 5))
+        finally:
+            loop.close()
+        assert fetcher.calls == [(100, 500)]
+        assert backend.threads
+        assert threading.get_ident() not in backend.threads
+
+    def test_get_max_claims(self, fetcher, monkeypatch):
+        monkeypatch.setattr(src.cache, 'MAX_CLAIMS', 2)
+        backend = MemoryBackend(1000)
+        claims = list()
+        claim = backend.claim
+
+        def count_claim(key):
+            claims.append(key)
+            return claim(key)
+        backend.claim = count_claim
+        cache = PositionCache(backend, 100)
+
+        result = cache.get('entity', 150, 720, 1000, fetcher)
+        assert [e for e, _ in result] == list(range(150, 721, 5))
+        assert claims == [('entity', 1), ('entity', 2)]
+        assert fetcher.calls == [(100, 800)]
+        assert cache.stats()['size'] == 140
+
+
+class TestSQLiteBackend:
+
+    def test_shared(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        fetcher = Fetcher(list(range(0, 1000, 5)))
+        worker1 = PositionCache(SQLiteBackend(path, 1024 * 1024), 100)
+        worker2 = PositionCache(SQLiteBackend(path, 1024 * 1024), 100)
+
+        result1 = worker1.get(('entity-type', 'entity-id'), 150, 420, 1000, fetcher)
+        result2 = worker2.get(('entity-type', 'entity-id'), 150, 420, 1000, fetcher)
+        assert [e for e, _ in result2] == [e for e, _ in result1]
+        assert fetcher.calls == [(100, 500)]
+        assert worker2.stats()['hits'] == 4
+
+    def test_coalesce_across_workers(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        fetcher = SlowFetcher(list(range(0, 1000, 5)), 0.3)
+        worker1 = PositionCache(SQLiteBackend(path, 1024 * 1024), 100)
+        worker2 = PositionCache(SQLiteBackend(path, 1024 * 1024), 100)
+
+        results = get_concurrently([worker1, worker2], [(150, 420), (150, 420)], fetcher)
+        assert results[0] == results[1] == list(range(150, 421, 5))
+        assert fetcher.calls == [(100, 500)]
+        assert worker2.stats()['coalesced'] == 4
+
+    def test_claim(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        backend1 = SQLiteBackend(path, 1024 * 1024)
+        backend2 = SQLiteBackend(path, 1024 * 1024)
+
+        release = backend1.claim(('entity', 0))
+        assert backend1.claim(('entity', 0)) is None
+        assert backend2.claim(('entity', 0)) is None
+        threading.Timer(0.1, release).start()
+        backend2.wait(('entity', 0))
+        backend2.claim(('entity', 0))()
+
+    def test_wait_timeout(self, tmp_path):
+        path = str(tmp_path / 'cache.db')
+        backend1 = SQLiteBackend(path, 1024 * 1024)
+        backend2 = SQLiteBackend(path, 1024 * 1024)
+        release = backend1.claim(('entity', 0))
+
+        start = time.monotonic()
+        assert not backend2.wait(('entity', 0), 0.2)
+        assert 0.2 <= time.monotonic() - start < 1.0
+        release()
+        assert backend2.wait(('entity', 0), 0.2)
+
+    def test_claim_without_lock_file(self, tmp_path, monkeypatch):
+        backend = SQLiteBackend(str(tmp_path / 'cache.db'), 1024 * 1024)
+
+        def open_nothing(*args):
+            raise OSError(errno.EMFILE, 'Too many open files')
+        monkeypatch.setattr(os, 'open', open_nothing)
+
+        release = backend.claim(('entity', 0))
+        assert release is not None
+        assert backend.claim(('entity', 0)) is None
+        assert backend.wait(('entity', 1), 0.1)
+        release()
+        backend.claim(('entity', 0))()
+
+    def test_evict(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / 'cache.db'), 40)
+
+        backend.set(('entity', 0), [[0, {'time': 0}]])
+        backend.set(('entity', 1), [[1, {'time': 1}]])
+        assert backend.get(('entity', 0)) == [[0, {'time': 0}]]
+        backend.set(('entity', 2), [[2, {'time': 2}]])
+
+        assert backend.get(('entity', 0)) == [[0, {'time': 0}]]
+        assert backend.get(('entity', 1)) is None
+        assert backend.get(('entity', 2)) == [[2, {'time': 2}]]
+        assert backend.size() <= 40
+
+    @pytest.mark.parametrize('touch_interval, written', [(3600.0, False), (0.0, True)])
+    def test_touch(self, tmp_path, touch_interval, written):
+        path = str(tmp_path / 'cache.db')
+        backend = SQLiteBackend(path, 1024 * 1024, touch_interval)
+
+        def get_accessed():
+            with sqlite3.connect(path) as conn:
+                return dict(conn.execute('SELECT key, accessed FROM positions').fetchall())
+
+        backend.set(('entity', 0), [[0, {'time': 0}]])
+        accessed = get_accessed()
+        time.sleep(0.01)
+        assert backend.get(('entity', 0)) == [[0, {'time': 0}]]
+        assert (get_accessed() != accessed) == written
+
+        backend.set(('entity', 1), [[1, {'time': 1}]])
+        assert get_accessed()['["entity", 0]'] > accessed['["entity", 0]']
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import math
+
+from src import columnar
+
+
+class TestColumnar:
+
+    positions = [
+        (1514916245.0, {'time': '2018-01-03T03:04:05+09:00', 'x': 0.0, 'y': 1.0}),
+        (1515002645.5, {'time': '2018-01-04T03:04:05.500000+09:00', 'x': 0.1, 'theta': 2.1}),
+    ]
+
+    def test_to_columns(self):
+        assert columnar.to_columns(self.positions) == {
+            'time': ['2018-01-03T03:04:05+09:00', '2018-01-04T03:04:05.500000+09:00'],
+            'x': [0.0, 0.1],
+            'y': [1.0, None],
+            'theta': [None, 2.1],
+        }
+
+    def test_pack(self):
+        data = columnar.pack(self.positions)
+        columns = columnar.unpack(data)
+
+        assert data[:4] == b'RPOS'
+        assert list(columns) == ['time', 'x', 'y', 'theta']
+        assert list(columns['time']) == [1514916245000.0, 1515002645500.0]
+        assert list(columns['x']) == [0.0, 0.1]
+        assert columns['y'][0] == 1.0 and math.isnan(columns['y'][1])
+        assert math.isnan(columns['theta'][0]) and columns['theta'][1] == 2.1
+
+    def test_pack_empty(self):
+        data = columnar.pack([])
+
+        assert len(data) % 8 == 0
+        assert {name: list(column) for name, column in columnar.unpack(data).items()} == {'time': []}
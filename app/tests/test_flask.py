@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
+import gzip
+import json
+import math
 import os
+import time
+from datetime import datetime, timedelta
 
 from dateutil import parser
 import pytz
+import requests
 
 import pytest
 from pyquery import PyQuery as pq
 
-from src import const
+from src import const, columnar
 
 
 class TestRobotLocusPage:
@@ -57,6 +63,10 @@ class TestRobotLocusPage:
 
         assert len(q.find('input#path[type="hidden"]')) == 1
         assert q.find('input#path[type="hidden"]').val() == '/positions/'
+        assert len(q.find('div#locus svg#robotLocus')) == 1
+        assert len(q.find('div#locus canvas#robotTrack')) == 1
+        assert q.find('input#worker_path[type="hidden"]').val() == '/static/js/trackWorker.js'
+        assert q.find('input#timezone[type="hidden"]').val() == 'Asia/Tokyo'
 
         if const.BEARER_AUTH in os.environ:
             del os.environ[const.BEARER_AUTH]
@@ -81,6 +91,130 @@ class TestNotFound:
         assert not hasattr(response, 'body')
 
 
+class TestRobotPositionsAPIv1:
+
+    def __insert(self, mongo, persistence, params):
+        for recvTime, attrs in params:
+            dt = parser.parse(recvTime).astimezone(pytz.UTC).replace(tzinfo=None)
+            if persistence == 'column':
+                doc = {'recvTime': dt, 'entityId': 'entity-id', 'entityType': 'entity-type'}
+                doc.update({name: str(value) for name, value in attrs.items()})
+                mongo.insert_one(doc)
+            else:
+                for name, value in attrs.items():
+                    mongo.insert_one({'recvTime': dt, 'attrName': name, 'attrType': 'float', 'attrValue': str(value)})
+
+    def test_get_success_row(self, mongo, clientv1):
+        self.__assert_get_success(mongo, clientv1, 'row')
+
+    @pytest.mark.usefixtures('set_column_persistence')
+    def test_get_success_column(self, mongo, clientv1):
+        self.__assert_get_success(mongo, clientv1, 'column')
+
+    def __assert_get_success(self, mongo, clientv1, persistence):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recv_time_1 = '2018-01-04T03:04:05.123000+09:00'
+        recv_time_2 = '2018-01-05T03:04:05+09:00'
+        self.__insert(mongo, persistence, [
+            ('2018-01-01T03:04:05+09:00', {'x': 9.0, 'y': 9.0, 'theta': 9.0}),
+            (recv_time_0, {'x': 0.0, 'y': 1.0, 'theta': 2.0}),
+            (recv_time_1, {'x': 0.1, 'y': 1.1, 'z': 3.1}),
+            ('2018-01-04T12:00:00+09:00', {'y': 1.5}),
+            (recv_time_2, {'x': 0.2, 'y': 1.2, 'theta': 2.2}),
+            ('2018-01-09T03:04:05+09:00', {'x': 9.0, 'y': 9.0, 'theta': 9.0}),
+        ])
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.content_type == 'application/json'
+        assert response.json == [
+            {'time': recv_time_0, 'x': 0.0, 'y': 1.0, 'theta': 2.0},
+            {'time': recv_time_1, 'x': 0.1, 'y': 1.1},
+            {'time': recv_time_2, 'x': 0.2, 'y': 1.2, 'theta': 2.2},
+        ]
+
+    def test_get_stream(self, mongo, clientv1):
+        self.__insert(mongo, 'row', [('2018-01-03T03:04:05+09:00', {'x': 0.0, 'y': 1.0, 'theta': 2.0})])
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        streamed = clientv1.get('/positions/', query_string=dict(params, stream='true'))
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert streamed.is_streamed
+        assert streamed.data == response.data
+
+    def test_get_fields(self, mongo, clientv1):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        self.__insert(mongo, 'row', [(recv_time_0, {'x': 0.0, 'y': 1.0, 'theta': 2.0})])
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'fields': 'x,theta'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'theta': 2.0}]
+
+    @pytest.mark.parametrize('auto_index, indexes', [
+        (False, ['_id_']),
+        (True, ['_id_', 'recvTime_1']),
+    ])
+    def test_get_index(self, monkeypatch, mongo, clientv1, auto_index, indexes):
+        import src.views
+        monkeypatch.setattr(src.views.RobotPositionsAPIv1.READER, 'auto_index', auto_index)
+        monkeypatch.setattr(src.views.RobotPositionsAPIv1.READER, 'indexed', False)
+        self.__insert(mongo, 'row', [('2018-01-03T03:04:05+09:00', {'x': 0.0, 'y': 1.0, 'theta': 2.0})])
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert sorted(mongo.index_information()) == indexes
+
+    def test_create_index(self, mongo):
+        import src.views
+        reader = src.views.RobotPositionsAPIv1.READER
+        self.__insert(mongo, 'row', [('2018-01-03T03:04:05+09:00', {'x': 0.0, 'y': 1.0, 'theta': 2.0})])
+
+        assert reader.create_index() == 'recvTime_1'
+        assert reader.create_index() == 'recvTime_1'
+        assert sorted(mongo.index_information()) == ['_id_', 'recvTime_1']
+
+    def test_get_aggregated_not_supported(self, mongo, clientv1):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'resolution': 'hour'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def test_get_batch_not_supported(self, mongo, clientv1):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'ids': 'robot1'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def test_get_batch_not_implemented(self, monkeypatch, mongo, clientv1):
+        import src.views
+        monkeypatch.setattr(src.views.RobotPositionsAPIv1, '_get_max_entities', lambda self: 5)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'ids': 'robot1'}
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+        assert response.json['description'] == {'message': 'query parameter "ids" is not supported'}
+
+    @pytest.mark.parametrize('st', [None, '', 'dummy'])
+    @pytest.mark.parametrize('et', [None, '', 'dummy'])
+    def test_get_invalid_params(self, mongo, clientv1, st, et):
+        params = {}
+        if st is not None:
+            params['st'] = st
+        if et is not None:
+            params['et'] = et
+
+        response = clientv1.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+
 class TestRobotPositionsAPIv2:
 
     def __get_json(self, params):
@@ -271,6 +405,714 @@ class TestRobotPositionsAPIv2:
         else:
             assert response.json == base_expected
 
+    @pytest.mark.usefixtures('set_limit_as_2')
+    def test_get_success_w_parallel_pages(self, requests_mock, clientv2):
+        st = '2018-01-02T03:04:05+09:00'
+        et = '2018-01-08T03:04:05+09:00'
+        recv_times = [
+            '2018-01-03T03:04:05+09:00',
+            '2018-01-04T03:04:05+09:00',
+            '2018-01-05T03:04:05+09:00',
+            '2018-01-06T03:04:05+09:00',
+            '2018-01-07T03:04:05+09:00',
+        ]
+        recvTimes = [parser.parse(t).astimezone(pytz.UTC).isoformat() for t in recv_times]
+
+        def callback(base):
+            def json_callback(request, context):
+                context.headers['fiware-total-count'] = '5'
+                offset = int(request.qs['hoffset'][0])
+                limit = int(request.qs['hlimit'][0])
+                return self.__get_json([(t, base + i / 10) for i, t in enumerate(recvTimes)][offset:offset + limit])
+            return json_callback
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=callback(0.0))
+        my = requests_mock.get(urlstr + 'y', json=callback(1.0))
+
+        response = clientv2.get('/positions/', query_string={'st': st, 'et': et})
+
+        assert response.status_code == 200
+        assert response.json == [{'time': t, 'x': i / 10, 'y': 1.0 + i / 10} for i, t in enumerate(recv_times)]
+        assert sorted(int(r.qs['hoffset'][0]) for r in mx.request_history) == [0, 2, 4]
+        assert sorted(int(r.qs['hoffset'][0]) for r in my.request_history) == [0, 2, 4]
+
+    @pytest.mark.usefixtures('set_limit_as_2')
+    def test_get_retry_failed_page(self, requests_mock, clientv2):
+        st = '2018-01-02T03:04:05+09:00'
+        et = '2018-01-08T03:04:05+09:00'
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recv_time_1 = '2018-01-04T03:04:05+09:00'
+        recv_time_2 = '2018-01-05T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        recvTime1 = parser.parse(recv_time_1).astimezone(pytz.UTC).isoformat()
+        recvTime2 = parser.parse(recv_time_2).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '3'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', [
+            {'json': self.__get_json([(recvTime0, 0.0), (recvTime1, 0.1)]), 'headers': headers},
+            {'status_code': 503, 'text': 'unavailable'},
+            {'exc': requests.exceptions.ConnectionError},
+            {'json': self.__get_json([(recvTime2, 0.2)]), 'headers': headers},
+        ])
+        my = requests_mock.get(urlstr + 'y', [
+            {'json': self.__get_json([(recvTime0, 1.0), (recvTime1, 1.1)]), 'headers': headers},
+            {'json': self.__get_json([(recvTime2, 1.2)]), 'headers': headers},
+        ])
+
+        response = clientv2.get('/positions/', query_string={'st': st, 'et': et})
+
+        assert response.status_code == 200
+        assert response.json == [
+            {'time': recv_time_0, 'x': 0.0, 'y': 1.0},
+            {'time': recv_time_1, 'x': 0.1, 'y': 1.1},
+            {'time': recv_time_2, 'x': 0.2, 'y': 1.2},
+        ]
+        assert [int(r.qs['hoffset'][0]) for r in mx.request_history] == [0, 2, 2, 2]
+        assert [int(r.qs['hoffset'][0]) for r in my.request_history] == [0, 2]
+
+    def test_get_retry_exhausted(self, requests_mock, clientv2):
+        params = {
+            'st': '2018-01-02T03:04:05+09:00',
+            'et': '2018-01-08T03:04:05+09:00',
+        }
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', status_code=500, text='error')
+        requests_mock.get(urlstr + 'y', status_code=500, text='error')
+
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json == []
+        assert mx.call_count == 1 + int(const.DEFAULT_COMET_RETRY)
+
+    def test_get_attr_failed(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        requests_mock.get(urlstr + 'y', status_code=500, text='error')
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.status_code == 200
+        assert response.json == [{'time': recv_time_0, 'x': 0.0}]
+        assert 'ETag' not in response.headers
+        assert 'Cache-Control' not in response.headers
+
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+        assert 'ETag' in response.headers
+        response = clientv2.get('/positions/', query_string=dict(params, format='columnar'))
+        assert response.json == {'time': [recv_time_0], 'x': [0.0], 'y': [1.0]}
+
+    def test_get_stream_attr_failed(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'stream': 'true'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        requests_mock.get(urlstr + 'y', status_code=500, text='error')
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.status_code == 200
+        assert response.json == [{
+            'partial': True, 'resume': '2018-01-02T03:04:05+09:00',
+            'error': 'can not retrieve data from sth-comet, status_code=500, data=error',
+        }]
+
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+
+    def test_get_total_count_missing(self, requests_mock, clientv2):
+        import src.views
+        src.views.RobotPositionsAPIv2.SESSION.backoff = 0.0
+        recvTime0 = parser.parse('2018-01-03T03:04:05+09:00').astimezone(pytz.UTC).isoformat()
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers={'fiware-total-count': '0'})
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers={'fiware-total-count': '0'})
+
+        response = clientv2.get('/positions/', query_string={'st': '2018-01-02T03:04:05+09:00',
+                                                             'et': '2018-01-08T03:04:05+09:00'})
+        src.views.RobotPositionsAPIv2.SESSION.backoff = float(const.DEFAULT_COMET_RETRY_BACKOFF)
+
+        assert response.status_code == 200
+        assert response.json == []
+        assert mx.call_count == 1 + int(const.DEFAULT_COMET_RETRY)
+
+    @pytest.mark.usefixtures('set_limit_as_2')
+    def test_get_deadline_exceeded(self, requests_mock, clientv2):
+        import src.views
+        src.views.RobotPositionsAPIBase.DEADLINE = 0.3
+        recv_times = [f'2018-01-0{i + 3}T03:04:05+09:00' for i in range(5)]
+        recvTimes = [parser.parse(t).astimezone(pytz.UTC).isoformat() for t in recv_times]
+
+        def get_page(values):
+            def callback(request, context):
+                offset = int(request.qs['hoffset'][0])
+                if offset > 0:
+                    time.sleep(1.0)
+                context.headers['fiware-total-count'] = '5'
+                return self.__get_json(values[offset:offset + 2])
+            return callback
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=get_page([(t, i / 10) for i, t in enumerate(recvTimes)]))
+        requests_mock.get(urlstr + 'y', json=get_page([(t, 1 + i / 10) for i, t in enumerate(recvTimes)]))
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        start = time.monotonic()
+        response = clientv2.get('/positions/', query_string=params)
+        elapsed = time.monotonic() - start
+        src.views.RobotPositionsAPIBase.DEADLINE = float(const.DEFAULT_REQUEST_DEADLINE)
+
+        assert response.status_code == 200
+        assert elapsed < 1.0
+        assert response.json == [{'time': recv_times[0], 'x': 0.0, 'y': 1.0}]
+        assert response.headers['X-Positions-Partial'] == 'true'
+        assert response.headers['X-Positions-Resume'] == recv_times[1]
+        assert 'ETag' not in response.headers
+
+    def test_get_stream_deadline_exceeded(self, mocker, clientv2):
+        import src.views
+        from src.deadline import DeadlineExceeded
+        recv_times = [f'2018-01-0{i + 3}T03:04:05+09:00' for i in range(2)]
+
+        def iter_positions(start_dt, end_dt):
+            for i, recv_time in enumerate(recv_times):
+                yield parser.parse(recv_time).timestamp(), {'time': recv_time, 'x': float(i)}
+            raise DeadlineExceeded([], None)
+        mocker.patch.object(src.views.RobotPositionsAPIv2, '_iter_positions', side_effect=iter_positions)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'stream': 'true'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json == [
+            {'time': recv_times[0], 'x': 0.0},
+            {'time': recv_times[1], 'x': 1.0},
+            {'partial': True, 'resume': '2018-01-04T03:04:05.000001+09:00'},
+        ]
+
+    def test_get_cached(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        my = requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+
+        params = {'st': '2018-01-03T00:00:00+09:00', 'et': '2018-01-04T00:00:00+09:00'}
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+
+        assert mx.call_count == 1
+        assert my.call_count == 1
+
+    def test_get_conditional(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = clientv2.get('/positions/', query_string=params, headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Cache-Control'] == 'public, max-age=86400, immutable'
+        assert json.loads(gzip.decompress(response.data)) == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+        etag = response.headers['ETag']
+
+        response = clientv2.get('/positions/', query_string=params,
+                                headers={'Accept-Encoding': 'gzip, deflate', 'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+        response = clientv2.get('/positions/', query_string=params)
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['ETag'] != etag
+        assert response.json == [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]
+
+        response = clientv2.get('/positions/', query_string=dict(params, format='columnar'))
+        assert response.json == {'time': [recv_time_0], 'x': [0.0], 'y': [1.0]}
+        assert mx.call_count == 1
+
+    def test_get_analytics(self, requests_mock, clientv2):
+        recv_times = ['2018-01-03T03:04:05+09:00', '2018-01-03T03:04:15+09:00', '2018-01-03T03:04:35+09:00']
+        recvTimes = [parser.parse(t).astimezone(pytz.UTC).isoformat() for t in recv_times]
+        headers = {'fiware-total-count': '3'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_json(list(zip(recvTimes, [0.0, 3.0, 3.0]))),
+                               headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json(list(zip(recvTimes, [0.0, 4.0, 4.0]))), headers=headers)
+
+        params = {'st': '2018-01-03T03:00:00+09:00', 'et': '2018-01-03T04:00:00+09:00', 'cell': '1'}
+        response = clientv2.get('/analytics/', query_string=params)
+        assert response.status_code == 200
+        assert response.headers['X-Resolution'] == 'minute'
+        assert response.headers['Cache-Control'] == 'public, max-age=86400, immutable'
+        result = response.json
+        assert result['summary'] == {'count': 3, 'distance': 5.0, 'duration': 30.0, 'moving_seconds': 10.0,
+                                     'idle_seconds': 20.0, 'mean_speed': 5.0 / 30, 'max_speed': 0.5}
+        assert len(result['segments']) == 1
+        assert result['idle'] == [{'start': recv_times[1], 'end': recv_times[2], 'seconds': 20.0, 'x': 3.0, 'y': 4.0}]
+        assert result['heatmap']['bins'] == [{'x': 0.0, 'y': 0.0, 'count': 1, 'seconds': 10.0},
+                                             {'x': 3.0, 'y': 4.0, 'count': 2, 'seconds': 20.0}]
+        etag = response.headers['ETag']
+        count = mx.call_count
+
+        response = clientv2.get('/analytics/', query_string=params, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+        response = clientv2.get('/analytics/', query_string=dict(params, resolution='second'))
+        assert response.headers['X-Resolution'] == 'second'
+        assert response.headers['ETag'] != etag
+        assert [segment['count'] for segment in response.json['segments']] == [1, 1, 1]
+
+        response = clientv2.get('/positions/', query_string=params)
+        assert len(response.json) == 3
+        assert mx.call_count == count
+
+    @pytest.mark.parametrize('params', [
+        {},
+        {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'resolution': 'week'},
+        {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'cell': '0'},
+        {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'idle_speed': 'a'},
+        {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'idle_seconds': '-1'},
+    ])
+    def test_get_invalid_analytics(self, clientv2, params):
+        response = clientv2.get('/analytics/', query_string=params)
+        assert response.status_code == 400
+
+    def test_get_analytics_v1(self, clientv1):
+        response = clientv1.get('/analytics/', query_string={'st': '2018-01-02T03:04:05+09:00',
+                                                             'et': '2018-01-08T03:04:05+09:00'})
+        assert response.status_code == 404
+
+    def test_get_open_window(self, requests_mock, clientv2):
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([]), headers={'fiware-total-count': '0'})
+        requests_mock.get(urlstr + 'y', json=self.__get_json([]), headers={'fiware-total-count': '0'})
+
+        # a window closed within SETTLE_DELAY may still receive late samples
+        for delta in (timedelta(hours=1), -timedelta(seconds=float(const.DEFAULT_SETTLE_DELAY) / 2)):
+            et = (datetime.now(pytz.UTC) + delta).isoformat()
+            response = clientv2.get('/positions/', query_string={'st': '2018-01-02T03:04:05+09:00', 'et': et},
+                                    headers={'Accept-Encoding': 'gzip'})
+            assert response.status_code == 200
+            assert 'ETag' not in response.headers
+            assert 'Cache-Control' not in response.headers
+            assert 'Content-Encoding' not in response.headers
+
+    @pytest.mark.usefixtures('set_limit_as_2')
+    @pytest.mark.parametrize('num', [0, 1, 5])
+    def test_get_stream(self, requests_mock, clientv2, num):
+        import src.views
+
+        recvTimes = [parser.parse(f'2018-01-0{i + 3}T03:04:05+09:00').astimezone(pytz.UTC).isoformat() for i in range(num)]
+
+        def callback(base):
+            def json_callback(request, context):
+                context.headers['fiware-total-count'] = str(max(num, 1))
+                offset = int(request.qs['hoffset'][0])
+                limit = int(request.qs['hlimit'][0])
+                return self.__get_json([(t, base + i / 10) for i, t in enumerate(recvTimes)][offset:offset + limit])
+            return json_callback
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=callback(0.0))
+        requests_mock.get(urlstr + 'y', json=callback(1.0))
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        streamed = clientv2.get('/positions/', query_string=dict(params, stream='true'))
+        src.views.RobotPositionsAPIv2.CACHE.clear()
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert streamed.status_code == 200
+        assert streamed.content_type == 'application/json'
+        assert streamed.is_streamed
+        assert streamed.data == response.data
+        assert len(streamed.json) == num
+
+    @pytest.mark.parametrize('params, expected', [
+        ({'max_points': '3'}, [0, 1, 4]),
+        ({'tolerance': '0.05'}, [0, 4]),
+        ({'tolerance': '0.0', 'max_points': '10'}, [0, 1, 2, 3, 4]),
+    ])
+    def test_get_simplified(self, requests_mock, clientv2, params, expected):
+        recv_times = [f'2018-01-0{i + 3}T03:04:05+09:00' for i in range(5)]
+        recvTimes = [parser.parse(t).astimezone(pytz.UTC).isoformat() for t in recv_times]
+        headers = {'fiware-total-count': '5'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(t, i / 10) for i, t in enumerate(recvTimes)]),
+                          headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(t, (i % 2) / 100) for i, t in enumerate(recvTimes)]),
+                          headers=headers)
+
+        params = dict(params, st='2018-01-02T03:04:05+09:00', et='2018-01-08T03:04:05+09:00')
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.headers['X-Original-Count'] == '5'
+        assert response.json == [{'time': recv_times[i], 'x': i / 10, 'y': (i % 2) / 100} for i in expected]
+
+    @pytest.mark.parametrize('params', [
+        {'max_points': '2'}, {'max_points': 'dummy'}, {'tolerance': '-1'}, {'tolerance': 'nan'}, {'tolerance': 'dummy'},
+        {'max_points': '3', 'fields': 'x'}, {'tolerance': '0.1', 'fields': 'y,theta'},
+        {'max_points': '3', 'fields': 'x', 'ids': 'robot1'},
+    ])
+    def test_get_invalid_simplify_params(self, requests_mock, clientv2, params):
+        params = dict(params, st='2018-01-02T03:04:05+09:00', et='2018-01-08T03:04:05+09:00')
+        response = clientv2.get('/positions/', query_string=params)
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        assert not requests_mock.get(urlstr + 'x').called
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('query, accept', [
+        ({'format': 'columnar'}, None),
+        ({'format': 'binary'}, None),
+        ({}, 'application/octet-stream'),
+    ])
+    def test_get_columnar(self, requests_mock, clientv2, query, accept):
+        recv_times = [f'2018-01-0{i + 3}T03:04:05+09:00' for i in range(3)]
+        recvTimes = [parser.parse(t).astimezone(pytz.UTC).isoformat() for t in recv_times]
+        headers = {'fiware-total-count': '3'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(t, i / 10) for i, t in enumerate(recvTimes)]),
+                          headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(t, 1 + i / 10) for i, t in enumerate(recvTimes[:2])]),
+                          headers=headers)
+
+        params = dict(query, st='2018-01-02T03:04:05+09:00', et='2018-01-08T03:04:05+09:00')
+        response = clientv2.get('/positions/', query_string=params, headers={'Accept': accept} if accept else {})
+
+        assert response.status_code == 200
+        if query.get('format') == 'columnar':
+            assert response.content_type == 'application/json'
+            assert response.json == {'time': recv_times, 'x': [0.0, 0.1, 0.2], 'y': [1.0, 1.1, None]}
+        else:
+            assert response.content_type == 'application/octet-stream'
+            columns = columnar.unpack(response.data)
+            assert list(columns['time']) == [parser.parse(t).timestamp() * 1000 for t in recv_times]
+            assert list(columns['x']) == [0.0, 0.1, 0.2]
+            assert list(columns['y'])[:2] == [1.0, 1.1] and math.isnan(columns['y'][2])
+
+    def test_get_invalid_format(self, requests_mock, clientv2):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'format': 'dummy'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def test_get_since(self, requests_mock, clientv2):
+        now = datetime.now(pytz.UTC).replace(microsecond=0)
+        recvTimes = [(now - timedelta(seconds=10 - i)).isoformat() for i in range(3)]
+        headers = {'fiware-total-count': '3'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_json([(t, i / 10) for i, t in enumerate(recvTimes)]),
+                               headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(t, 1 + i / 10) for i, t in enumerate(recvTimes)]),
+                          headers=headers)
+
+        since = (now - timedelta(seconds=10)).timestamp()
+        response = clientv2.get('/positions/', query_string={'since': repr(since)})
+
+        assert response.status_code == 200
+        assert [p['x'] for p in response.json] == [0.1, 0.2]
+        assert float(response.headers['X-Positions-Cursor']) == (now - timedelta(seconds=8)).timestamp()
+        assert parser.parse(mx.last_request.qs['datefrom'][0]).timestamp() == since
+        call_count = mx.call_count
+
+        response = clientv2.get('/positions/', query_string={'since': response.headers['X-Positions-Cursor']})
+
+        assert response.status_code == 200
+        assert response.json == []
+        assert float(response.headers['X-Positions-Cursor']) == (now - timedelta(seconds=8)).timestamp()
+        assert mx.call_count == call_count
+
+    @pytest.mark.parametrize('since', ['', 'dummy', 'nan', 'inf', '0', repr(time.time() - 3600), '1e12',
+                                       repr(time.time() + 3600)])
+    def test_get_invalid_since(self, requests_mock, clientv2, since):
+        response = clientv2.get('/positions/', query_string={'since': since})
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        assert not requests_mock.get(urlstr + 'x').called
+        assert response.status_code == 400
+
+    def test_get_viewport(self, requests_mock, clientv2):
+        import src.views
+        recv_times = [(datetime(2018, 1, 3, tzinfo=pytz.UTC) + timedelta(minutes=10 * i)).isoformat() for i in range(16)]
+        headers = {'fiware-total-count': '16'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(t, float(i)) for i, t in enumerate(recv_times)]),
+                          headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(t, 0.0) for t in recv_times]), headers=headers)
+
+        params = {'st': '2018-01-03T00:00:00+00:00', 'et': '2018-01-03T02:30:00+00:00', 'bbox': '-1,-1,5.5,1'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert [p['x'] for p in response.json] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+        bucket = int(datetime(2018, 1, 3, tzinfo=pytz.UTC).timestamp()) // 3600
+        entity = ('entity-type', 'entity-id', ('x', 'y'))
+        assert [src.views.RobotPositionsAPIv2.LOD.contains((entity, bucket + i)) for i in range(3)] == [True, True, False]
+
+        response = clientv2.get('/positions/', query_string=dict(params, bbox='4.5,-1,12.5,1', px='1'))
+
+        assert response.status_code == 200
+        assert [p['x'] for p in response.json] == [6.0, 11.0, 12.0]
+
+    def test_get_viewport_attr_failed(self, requests_mock, clientv2):
+        import src.views
+        recv_times = [(datetime(2018, 1, 3, tzinfo=pytz.UTC) + timedelta(minutes=10 * i)).isoformat() for i in range(6)]
+        headers = {'fiware-total-count': '6'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(t, float(i)) for i, t in enumerate(recv_times)]),
+                          headers=headers)
+        requests_mock.get(urlstr + 'y', status_code=500, text='error')
+
+        params = {'st': '2018-01-03T00:00:00+00:00', 'et': '2018-01-03T01:00:00+00:00', 'bbox': '-1,-1,5.5,1'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json == []
+        assert 'ETag' not in response.headers
+        bucket = int(datetime(2018, 1, 3, tzinfo=pytz.UTC).timestamp()) // 3600
+        entity = ('entity-type', 'entity-id', ('x', 'y'))
+        assert not src.views.RobotPositionsAPIv2.LOD.contains((entity, bucket))
+
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(t, 0.0) for t in recv_times]), headers=headers)
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert [p['x'] for p in response.json] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+        assert src.views.RobotPositionsAPIv2.LOD.contains((entity, bucket))
+
+    @pytest.mark.parametrize('params', [
+        {'px': '100'},
+        {'bbox': '0,0,1'},
+        {'bbox': '0,0,1,dummy'},
+        {'bbox': '0,0,1,inf'},
+        {'bbox': '1,0,0,1'},
+        {'bbox': '0,0,1,1', 'px': '0'},
+        {'bbox': '0,0,1,1', 'resolution': 'hour'},
+        {'bbox': '0,0,1,1', 'ids': 'robot1'},
+        {'bbox': '0,0,1,1', 'fields': 'x'},
+    ])
+    def test_get_invalid_viewport(self, requests_mock, clientv2, params):
+        params.update({'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'})
+        response = clientv2.get('/positions/', query_string=params)
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        assert not requests_mock.get(urlstr + 'x').called
+        assert response.status_code == 400
+
+    def test_get_fields(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        my = requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'fields': 'x'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json == [{'time': recv_time_0, 'x': 0.0}]
+        assert not my.called
+
+    @pytest.mark.usefixtures('set_pose_attrs')
+    @pytest.mark.parametrize('stream', ['false', 'true'])
+    def test_get_pose(self, requests_mock, clientv2, stream):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recv_time_1 = '2018-01-04T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        recvTime1 = parser.parse(recv_time_1).astimezone(pytz.UTC).isoformat()
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0), (recvTime1, 0.1)]),
+                          headers={'fiware-total-count': '2'})
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0), (recvTime1, 1.1)]),
+                          headers={'fiware-total-count': '2'})
+        mz = requests_mock.get(urlstr + 'z', json=self.__get_json([]), headers={'fiware-total-count': '1'})
+        requests_mock.get(urlstr + 'theta', json=self.__get_json([(recvTime1, 2.1)]), headers={'fiware-total-count': '1'})
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'fields': 'theta,y,x',
+                  'stream': stream}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json == [
+            {'time': recv_time_0, 'x': 0.0, 'y': 1.0},
+            {'time': recv_time_1, 'x': 0.1, 'y': 1.1, 'theta': 2.1},
+        ]
+        assert not mz.called
+
+    @pytest.mark.parametrize('fields', ['', ',', 'theta', 'x,z'])
+    def test_get_invalid_fields(self, requests_mock, clientv2, fields):
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'fields': fields}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def __get_aggregated_json(self, resolution, origins):
+        return {
+            'contextResponses': [
+                {
+                    'contextElement': {
+                        'attributes': [
+                            {
+                                'values': [
+                                    {
+                                        '_id': {'origin': origin, 'resolution': resolution},
+                                        'points': [{'offset': offset, 'samples': samples, 'sum': total}
+                                                   for offset, samples, total in points],
+                                    } for origin, points in origins
+                                ],
+                            }
+                        ]
+                    }
+                }
+            ]
+        }
+
+    @pytest.mark.parametrize('resolution', ['hour', 'auto'])
+    def test_get_aggregated(self, requests_mock, clientv2, resolution):
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        mx = requests_mock.get(urlstr + 'x', json=self.__get_aggregated_json('hour', [
+            ('2018-01-02T00:00:00.000Z', [(17, 2, 9.0), (18, 4, 2.0), (19, 0, 0)]),
+            ('2018-01-03T00:00:00.000Z', [(0, 1, 0.5)]),
+        ]))
+        requests_mock.get(urlstr + 'y', json=self.__get_aggregated_json('hour', [
+            ('2018-01-02T00:00:00.000Z', [(18, 2, 3.0)]),
+        ]))
+
+        params = {'st': '2018-01-03T03:04:05+09:00', 'et': '2018-01-10T03:04:05+09:00', 'resolution': resolution}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.headers['X-Resolution'] == 'hour'
+        assert response.json == [
+            {'time': '2018-01-03T03:00:00+09:00', 'x': 0.5, 'y': 1.5},
+            {'time': '2018-01-03T09:00:00+09:00', 'x': 0.5},
+        ]
+        assert mx.call_count == 1
+        assert mx.last_request.qs['aggrmethod'] == ['sum']
+        assert mx.last_request.qs['aggrperiod'] == ['hour']
+
+    def test_get_aggregated_day(self, requests_mock, clientv2):
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_aggregated_json('day', [
+            ('2018-01-01T00:00:00.000Z', [(1, 1, 1.0), (3, 2, 1.0)]),
+        ]))
+        requests_mock.get(urlstr + 'y', json=self.__get_aggregated_json('day', []))
+
+        params = {'st': '2018-01-01T00:00:00+00:00', 'et': '2018-01-08T00:00:00+00:00', 'resolution': 'day'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert [(p['time'], p['x']) for p in response.json] == [
+            ('2018-01-01T09:00:00+09:00', 1.0),
+            ('2018-01-03T09:00:00+09:00', 0.5),
+        ]
+
+    @pytest.mark.parametrize('params', [
+        {'resolution': 'week'},
+        {'resolution': 'hour', 'since': '0'},
+        {'resolution': 'hour', 'ids': 'robot1'},
+    ])
+    def test_get_invalid_resolution(self, requests_mock, clientv2, params):
+        params.update({'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'})
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def test_get_batch(self, requests_mock, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/{}/attributes/'
+        for i, entity_id in enumerate(['robot1', 'robot2']):
+            requests_mock.get(urlstr.format(entity_id) + 'x', json=self.__get_json([(recvTime0, i)]), headers=headers)
+            requests_mock.get(urlstr.format(entity_id) + 'y', json=self.__get_json([(recvTime0, i + 1)]), headers=headers)
+        requests_mock.get(urlstr.format('robot3') + 'x', status_code=404, text='not found')
+        requests_mock.get(urlstr.format('robot3') + 'y', status_code=404, text='not found')
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00', 'ids': 'robot1,robot2,robot3'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 200
+        assert response.json['robot1'] == {'positions': [{'time': recv_time_0, 'x': 0.0, 'y': 1.0}]}
+        assert response.json['robot2'] == {'positions': [{'time': recv_time_0, 'x': 1.0, 'y': 2.0}]}
+        assert set(response.json['robot3'].keys()) == {'error'}
+
+        response = clientv2.get('/positions/', query_string=dict(params, format='columnar'))
+
+        assert response.json['robot1'] == {'columns': {'time': [recv_time_0], 'x': [0.0], 'y': [1.0]}}
+        assert set(response.json['robot3'].keys()) == {'error'}
+
+    @pytest.mark.parametrize('params', [
+        {'ids': ''},
+        {'ids': ','.join(f'robot{i}' for i in range(int(const.DEFAULT_BATCH_MAX_ENTITIES) + 1))},
+        {'ids': 'robot1', 'format': 'binary'},
+        {'ids': 'robot1', 'since': '0'},
+    ])
+    def test_get_invalid_batch(self, requests_mock, clientv2, params):
+        params.update({'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'})
+        response = clientv2.get('/positions/', query_string=params)
+
+        assert response.status_code == 400
+
+    def test_get_metrics(self, requests_mock, metrics_dir, clientv2):
+        recv_time_0 = '2018-01-03T03:04:05+09:00'
+        recvTime0 = parser.parse(recv_time_0).astimezone(pytz.UTC).isoformat()
+        headers = {'fiware-total-count': '1'}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        requests_mock.get(urlstr + 'x', json=self.__get_json([(recvTime0, 0.0)]), headers=headers)
+        requests_mock.get(urlstr + 'y', json=self.__get_json([(recvTime0, 1.0)]), headers=headers)
+
+        params = {'st': '2018-01-02T03:04:05+09:00', 'et': '2018-01-08T03:04:05+09:00'}
+        response = clientv2.get('/positions/', query_string=params)
+
+        phases = [timing.split(';')[0] for timing in response.headers['Server-Timing'].split(', ')]
+        assert set(phases) == {'fetch', 'comet', 'decode', 'merge', 'serialize', 'total'}
+
+        response = clientv2.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        lines = response.data.decode('utf-8').splitlines()
+        assert 'robot_positions_requests_total 1' in lines
+        assert 'robot_positions_rows_total 1' in lines
+        assert 'comet_requests_total{status="200"} 2' in lines
+        assert 'comet_rows_total 2' in lines
+        assert 'comet_pages_count 2' in lines
+        assert 'robot_positions_phase_seconds_count{phase="merge"} 1' in lines
+
     def test_get_no_param(self, requests_mock, clientv2):
         response = clientv2.get('/positions/')
 
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from src import lod
+
+
+def to_positions(points):
+    return [(float(i), {'time': str(i), 'x': x, 'y': y}) for i, (x, y) in enumerate(points)]
+
+
+class TestLODPyramid:
+
+    def test_levels(self):
+        positions = to_positions([(0.0, 0.0), (0.1, 0.0), (0.6, 0.0), (1.1, 0.0), (3.0, 0.0)])
+        positions.insert(2, (1.5, {'time': '1.5', 'x': 0.2}))
+        pyramid = lod.LODPyramid(positions, 0.5, 3)
+
+        assert len(pyramid.positions) == 5
+        assert [e for e, _ in pyramid.query((-10.0, -10.0, 10.0, 10.0), 0)] == [0.0, 2.0, 3.0, 4.0]
+        assert [e for e, _ in pyramid.query((-10.0, -10.0, 10.0, 10.0), 1)] == [0.0, 3.0, 4.0]
+        assert [e for e, _ in pyramid.query((-10.0, -10.0, 10.0, 10.0), 2)] == [0.0, 4.0]
+
+    def test_get_level(self):
+        pyramid = lod.LODPyramid([], 0.5, 3)
+
+        assert pyramid.get_level(0.1) == 0
+        assert pyramid.get_level(0.99) == 0
+        assert pyramid.get_level(1.0) == 1
+        assert pyramid.get_level(100.0) == 2
+
+    def test_query_bbox(self):
+        points = [(float(i), 0.0) for i in range(10)] + [(9.0, float(i)) for i in range(1, 10)]
+        pyramid = lod.LODPyramid(to_positions(points), 0.5, 1)
+
+        assert [e for e, _ in pyramid.query((2.5, -1.0, 4.5, 1.0), 0)] == [2.0, 3.0, 4.0, 5.0]
+        assert [e for e, _ in pyramid.query((8.5, 3.5, 9.5, 4.5), 0)] == [12.0, 13.0, 14.0]
+        assert pyramid.query((100.0, 100.0, 200.0, 200.0), 0) == []
+
+    def test_query_tiles(self):
+        points = [(i * 0.5, 0.0) for i in range(1000)]
+        pyramid = lod.LODPyramid(to_positions(points), 0.5, 1)
+
+        assert [e for e, _ in pyramid.query((100.0, -1.0, 100.9, 1.0), 0)] == [199.0, 200.0, 201.0, 202.0]
+        assert [e for e, _ in pyramid.query((-1e9, -1e9, 1e9, 1e9), 0)] == [float(i) for i in range(1000)]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from dateutil import parser
+import pytest
+from pytz import timezone
+
+from src import merge
+
+
+class TestTimeConverter:
+
+    @pytest.mark.parametrize('tz', ['Asia/Tokyo', 'Europe/Madrid', 'UTC'])
+    @pytest.mark.parametrize('recv_time', [
+        '2018-01-02T03:04:05.678Z',
+        '2018-01-02T03:04:05Z',
+        '2018-01-02T03:04:05.000Z',
+        '2018-01-02T03:04:05.123456789Z',
+        '2018-01-02T03:04:05+09:00',
+        '2018-01-02T03:04:05.5-05:30',
+        '2018-03-25T00:59:59.999Z',
+        '2018-03-25T01:00:00.000Z',
+        '2018-10-28T00:30:00.000Z',
+        '2018-10-28T01:30:00.000Z',
+        '2018/01/02 03:04:05 +0000',
+    ])
+    def test_convert_one(self, tz, recv_time):
+        converter = merge.TimeConverter(timezone(tz))
+        dt = parser.parse(recv_time)
+
+        epoch, time = converter.convert_one(recv_time)
+
+        assert epoch == pytest.approx(dt.timestamp(), abs=1e-6)
+        assert time == dt.astimezone(timezone(tz)).isoformat()
+
+    def test_convert(self):
+        converter = merge.TimeConverter(timezone('Europe/Madrid'))
+        recv_times = ['2018-10-28T00:30:00.000Z', '2018-10-28T01:30:00.000Z']
+
+        epochs, times = converter.convert(recv_times)
+
+        assert times == ['2018-10-28T02:30:00+02:00', '2018-10-28T02:30:00+01:00']
+        assert epochs[1] - epochs[0] == 3600
+
+
+class TestJoin:
+
+    def __values(self, params):
+        return [{'recvTime': t, 'attrValue': v} for t, v in params]
+
+    def test_join(self):
+        converter = merge.TimeConverter(timezone('Asia/Tokyo'))
+        x_values = self.__values([
+            ('2018-01-02T00:00:00.000Z', '0.0'),
+            ('2018-01-02T00:00:01.000Z', '0.1'),
+            ('2018-01-02T00:00:01.000Z', '0.15'),
+            ('2018-01-02T00:00:03.000Z', '0.3'),
+        ])
+        y_values = self.__values([
+            ('2018-01-01T23:59:59.000Z', '0.9'),
+            ('2018-01-02T00:00:01.000Z', '1.1'),
+            ('2018-01-02T00:00:02.000Z', '1.2'),
+            ('2018-01-02T00:00:03.000Z', '1.3'),
+        ])
+
+        positions = merge.to_positions(('x', 'y'), *merge.join(converter, [x_values, y_values]))
+
+        assert [point for _, point in positions] == [
+            {'time': '2018-01-02T09:00:00+09:00', 'x': 0.0},
+            {'time': '2018-01-02T09:00:01+09:00', 'x': 0.15, 'y': 1.1},
+            {'time': '2018-01-02T09:00:03+09:00', 'x': 0.3, 'y': 1.3},
+        ]
+        assert [epoch for epoch, _ in positions] == [1514851200.0, 1514851201.0, 1514851203.0]
+
+    def test_join_attrs(self):
+        converter = merge.TimeConverter(timezone('UTC'))
+        x_values = self.__values([('2018-01-02T00:00:00.000Z', '0.0'), ('2018-01-02T00:00:01.000Z', '0.1')])
+        theta_values = self.__values([('2018-01-02T00:00:01.000Z', '2.1')])
+        z_values = self.__values([('2018-01-02T00:00:00.000Z', '3.0'), ('2018-01-02T00:00:02.000Z', '3.2')])
+
+        positions = merge.to_positions(('x', 'theta', 'z'), *merge.join(converter, [x_values, theta_values, z_values]))
+
+        assert [point for _, point in positions] == [
+            {'time': '2018-01-02T00:00:00+00:00', 'x': 0.0, 'z': 3.0},
+            {'time': '2018-01-02T00:00:01+00:00', 'x': 0.1, 'theta': 2.1},
+        ]
+
+    def test_join_empty(self):
+        converter = merge.TimeConverter(timezone('UTC'))
+
+        assert merge.to_positions(('x', 'y'), *merge.join(converter, [[], []])) == []
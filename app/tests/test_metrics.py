@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from src.metrics import METRICS, Registry, Timings
+
+
+class TestRegistry:
+
+    def test_collect(self):
+        registry = Registry(None)
+        registry.inc('comet_requests_total', status='200')
+        registry.inc('comet_requests_total', 2, status='200')
+        registry.inc('comet_requests_total', status='500')
+        registry.observe('comet_pages', 3)
+        registry.observe('comet_pages', 2000)
+
+        lines = registry.collect().splitlines()
+
+        assert '# TYPE comet_requests_total counter' in lines
+        assert 'comet_requests_total{status="200"} 3' in lines
+        assert 'comet_requests_total{status="500"} 1' in lines
+        assert 'comet_pages_bucket{le="2"} 0' in lines
+        assert 'comet_pages_bucket{le="4"} 1' in lines
+        assert 'comet_pages_bucket{le="1024"} 1' in lines
+        assert 'comet_pages_bucket{le="+Inf"} 2' in lines
+        assert 'comet_pages_sum 2003.0' in lines
+        assert 'comet_pages_count 2' in lines
+
+    def test_collect_processes(self, tmp_path):
+        registry = Registry(str(tmp_path))
+        registry.inc('robot_positions_requests_total')
+        registry.observe('robot_positions_phase_seconds', 0.02, phase='total')
+        with open(os.path.join(str(tmp_path), f'metrics-{os.getppid()}-1.json'), 'w') as f:
+            json.dump({
+                'counters': [['robot_positions_requests_total', [], 2]],
+                'histograms': [['robot_positions_phase_seconds', [['phase', 'total']], [1] + [0] * 10, 0.001, 1]],
+            }, f)
+
+        lines = registry.collect().splitlines()
+
+        assert 'robot_positions_requests_total 3' in lines
+        assert 'robot_positions_phase_seconds_bucket{phase="total",le="0.005"} 1' in lines
+        assert 'robot_positions_phase_seconds_bucket{phase="total",le="0.025"} 2' in lines
+        assert 'robot_positions_phase_seconds_count{phase="total"} 2' in lines
+        assert os.path.exists(os.path.join(str(tmp_path), f'metrics-{os.getpid()}-{registry.started}.json'))
+        assert os.path.exists(os.path.join(str(tmp_path), f'metrics-{os.getppid()}-1.json'))
+
+    def test_collect_exited_processes(self, tmp_path):
+        directory = str(tmp_path)
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        # an exited process, and a process whose pid is reused by a later process
+        for pid, started, value in [(process.pid, 1, 2), (os.getppid(), 1, 3), (os.getppid(), 2, 5)]:
+            with open(os.path.join(directory, f'metrics-{pid}-{started}.json'), 'w') as f:
+                json.dump({'counters': [['robot_positions_requests_total', [], value]], 'histograms': []}, f)
+        registry = Registry(directory)
+        registry.inc('robot_positions_requests_total')
+
+        assert 'robot_positions_requests_total 11' in registry.collect().splitlines()
+        assert sorted(os.listdir(directory)) == sorted([
+            'metrics.lock', 'totals.json', f'metrics-{os.getppid()}-2.json',
+            f'metrics-{os.getpid()}-{registry.started}.json'])
+        registry.inc('robot_positions_requests_total')
+        assert 'robot_positions_requests_total 12' in registry.collect().splitlines()
+
+    def test_collect_merged_once(self, tmp_path):
+        directory = str(tmp_path)
+        # a snapshot merged into the totals but not removed
+        with open(os.path.join(directory, 'totals.json'), 'w') as f:
+            json.dump({'counters': [['robot_positions_requests_total', [], 2]], 'histograms': [],
+                       'merged': [f'metrics-{os.getppid()}-1.json']}, f)
+        with open(os.path.join(directory, f'metrics-{os.getppid()}-1.json'), 'w') as f:
+            json.dump({'counters': [['robot_positions_requests_total', [], 2]], 'histograms': []}, f)
+
+        assert 'robot_positions_requests_total 2' in Registry(directory).collect().splitlines()
+        assert not os.path.exists(os.path.join(directory, f'metrics-{os.getppid()}-1.json'))
+
+    def test_flush_interval(self, tmp_path):
+        registry = Registry(str(tmp_path), 0.2)
+        registry.inc('robot_positions_requests_total')
+        registry.flush()
+        path = os.path.join(str(tmp_path), f'metrics-{os.getpid()}-{registry.started}.json')
+        with open(path) as f:
+            assert json.load(f)['counters'] == [['robot_positions_requests_total', [], 1]]
+
+        registry.inc('robot_positions_requests_total')
+        registry.flush()
+        with open(path) as f:
+            assert json.load(f)['counters'] == [['robot_positions_requests_total', [], 1]]
+
+        time.sleep(0.5)
+        with open(path) as f:
+            assert json.load(f)['counters'] == [['robot_positions_requests_total', [], 2]]
+
+    def test_registered(self):
+        names = set()
+        for path in glob.glob(os.path.join(os.path.dirname(__file__), '..', 'src', '*.py')):
+            with open(path) as f:
+                names.update(re.findall(r"\.(?:inc|observe)\('([a-z_]+)'", f.read()))
+
+        assert names
+        assert names <= set(METRICS)
+
+
+class TestTimings:
+
+    def test_to_header(self):
+        timings = Timings()
+        timings.add('comet', 0.01)
+        timings.add('merge', 0.002)
+        timings.add('comet', 0.005)
+
+        assert timings.to_header() == 'comet;dur=15.0, merge;dur=2.0'
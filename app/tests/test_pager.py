@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.comet import CometSession, CometClient
+from src.pager import AdaptivePager
+
+
+class TestAdaptivePager:
+
+    def test_fixed(self):
+        pager = AdaptivePager(128, 128, 128, 0.5)
+        pager.observe(128, 128, 10.0)
+
+        assert not pager.is_adaptive()
+        assert pager.get_limit() == 128
+        assert pager.get_limit(10, 4) == 128
+
+    @pytest.mark.parametrize('rows, latency, expected', [
+        (100, 0.25, 200),
+        (100, 0.1, 200),
+        (100, 1.0, 50),
+        (100, 10.0, 50),
+        (100, 0.4, 125),
+        (40, 1.0, 100),
+        (40, 0.01, 200),
+    ])
+    def test_observe(self, rows, latency, expected):
+        pager = AdaptivePager(100, 10, 1000, 0.5)
+        pager.observe(100, rows, latency)
+
+        assert pager.get_limit() == expected
+
+    def test_bounds(self):
+        pager = AdaptivePager(100, 80, 150, 0.5)
+        pager.observe(100, 100, 0.01)
+        assert pager.get_limit() == 150
+
+        pager.observe(150, 150, 10.0)
+        assert pager.get_limit() == 80
+
+    @pytest.mark.parametrize('remaining, concurrency, expected', [
+        (1000, 4, 100),
+        (150, 4, 38),
+        (20, 4, 10),
+    ])
+    def test_get_limit_remaining(self, remaining, concurrency, expected):
+        pager = AdaptivePager(100, 10, 1000, 0.5)
+
+        assert pager.get_limit(remaining, concurrency) == expected
+
+
+class TestCometClientPaging:
+
+    def test_fetch_adaptive(self, requests_mock):
+        start = datetime(2018, 1, 2)
+        recv_times = [(start + timedelta(seconds=i)).isoformat() + '.000Z' for i in range(50)]
+
+        def json_callback(request, context):
+            offset = int(request.qs['hoffset'][0])
+            limit = int(request.qs['hlimit'][0])
+            context.headers['fiware-total-count'] = str(len(recv_times))
+            values = [{'recvTime': t, 'attrValue': i} for i, t in enumerate(recv_times)][offset:offset + limit]
+            return {'contextResponses': [{'contextElement': {'attributes': [{'values': values}]}}]}
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        m = requests_mock.get(urlstr + 'x', json=json_callback)
+        session = CometSession(2, 2, 1.0, 0, 0.0)
+        client = CometClient(session, 'http://comet:8666', 'service', '/path', 'entity-type', 'entity-id',
+                             AdaptivePager(2, 2, 8, 10.0))
+
+        result = client.fetch(('x', ), '2018-01-02T00:00:00Z', '2018-01-03T00:00:00Z')
+
+        assert [v['attrValue'] for v in result['x']] == list(range(50))
+        limits = [int(r.qs['hlimit'][0]) for r in m.request_history]
+        assert limits[0] == 2
+        assert max(limits) == 8
+        pages = sorted((int(r.qs['hoffset'][0]), int(r.qs['hlimit'][0])) for r in m.request_history)
+        assert all(offset + limit == next_offset for (offset, limit), (next_offset, _) in zip(pages, pages[1:]))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import pytest
+
+from src import simplify
+
+
+def _points(coords):
+    return [{'time': i, 'x': x, 'y': y} for i, (x, y) in enumerate(coords)]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def arrays(request, monkeypatch):
+    if request.param == 'numpy' and simplify.np is None:
+        pytest.skip('numpy is not installed')
+    if request.param == 'python':
+        monkeypatch.setattr(simplify, 'np', None)
+    # the array operations are used even for the small inputs of the tests
+    monkeypatch.setattr(simplify, 'MIN_ARRAY_POINTS', 2)
+    return request.param
+
+
+@pytest.mark.usefixtures('arrays')
+class TestLTTB:
+
+    def test_lttb(self):
+        points = _points([(i / 100, math.sin(i / 10)) for i in range(1000)])
+
+        sampled = simplify.lttb(points, 50)
+
+        assert len(sampled) == 50
+        assert sampled[0] is points[0]
+        assert sampled[-1] is points[-1]
+        assert [p['time'] for p in sampled] == sorted(p['time'] for p in sampled)
+
+    def test_lttb_keeps_peak(self):
+        points = _points([(i, 0.0) for i in range(100)])
+        points[42]['y'] = 10.0
+
+        sampled = simplify.lttb(points, 10)
+
+        assert points[42] in sampled
+
+    @pytest.mark.parametrize('max_points', [2, 5, 10])
+    def test_lttb_not_sampled(self, max_points):
+        points = _points([(i, i) for i in range(5)])
+        assert simplify.lttb(points, max_points) == points
+
+
+@pytest.mark.usefixtures('arrays')
+class TestDouglasPeucker:
+
+    def test_douglas_peucker(self):
+        points = _points([(0, 0), (1, 0.01), (2, -0.01), (3, 0), (3, 1), (3.01, 2), (3, 3)])
+
+        assert [p['time'] for p in simplify.douglas_peucker(points, 0.1)] == [0, 3, 6]
+        assert simplify.douglas_peucker(points, 0.0) == points
+
+    def test_douglas_peucker_loop(self):
+        points = _points([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
+
+        assert simplify.douglas_peucker(points, 0.8) == [points[0], points[2], points[4]]
+        assert simplify.douglas_peucker(points, 0.5) == points
+
+
+@pytest.mark.parametrize('min_array_points', [2, 32])
+def test_same_by_numpy_and_python(monkeypatch, min_array_points):
+    if simplify.np is None:
+        pytest.skip('numpy is not installed')
+    monkeypatch.setattr(simplify, 'MIN_ARRAY_POINTS', min_array_points)
+    rand = random.Random(0)
+    coords = list()
+    x, y = 0.0, 0.0
+    for _ in range(5000):
+        x += rand.uniform(-1.0, 1.0)
+        y += rand.uniform(-1.0, 1.0)
+        coords.append((x, y))
+    points = _points(coords)
+
+    expected = ([simplify.lttb(points, max_points) for max_points in (3, 50, 1000)],
+                [simplify.douglas_peucker(points, tolerance) for tolerance in (0.0, 0.5, 5.0)])
+    monkeypatch.setattr(simplify, 'np', None)
+    result = ([simplify.lttb(points, max_points) for max_points in (3, 50, 1000)],
+              [simplify.douglas_peucker(points, tolerance) for tolerance in (0.0, 0.5, 5.0)])
+
+    assert result == expected
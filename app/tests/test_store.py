@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import importlib
+import os
+from datetime import datetime
+
+import pytest
+import pytz
+
+from src import const, merge
+from src.comet import CometError
+from src.ingest import Ingester
+from src.store import PositionStore
+
+ENTITY = ('entity-type', 'entity-id')
+
+
+def to_recv_time(seconds):
+    return datetime.fromtimestamp(seconds, pytz.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class FakeClient:
+    entity_type, entity_id = ENTITY
+
+    def __init__(self, epochs, fail=False):
+        self.epochs = epochs
+        self.fail = fail
+        self.calls = list()
+
+    def fetch(self, attrs, start_dt, end_dt, strict=False):
+        self.calls.append((start_dt, end_dt))
+        if self.fail:
+            raise CometError('failed')
+        start_us = merge.parse_microseconds(start_dt)
+        end_us = merge.parse_microseconds(end_dt)
+        epochs = [e for e in self.epochs if start_us <= e * 1000000 <= end_us]
+        return {attr: [{'recvTime': to_recv_time(e), 'attrValue': e + k} for e in epochs if attr == 'x' or e % 2 == 0]
+                for k, attr in enumerate(attrs)}
+
+
+class TestPositionStore:
+
+    def test_append_and_get(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        store.reset(ENTITY, ('x', 'y'), 0)
+        assert store.get_range(ENTITY, ('x', 'y')) is None
+
+        store.append([1000000, 2000000, 3000000], [[1.0, 2.0, 3.0], [10.0, None, 30.0]], 3000000)
+        store.append([], [[], []], 4000000)
+        store.append([5000000], [[5.0], [50.0]], 5000000)
+        assert store.get_range(ENTITY, ('x', 'y')) == (0, 5000000)
+        assert store.get_range(ENTITY, ('x', 'z')) is None
+        assert store.get_range(('entity-type', 'another'), ('x', )) is None
+
+        positions = store.get_positions(merge.TimeConverter(pytz.utc), ('x', 'y'), 2000000, 5000000)
+        assert positions == [
+            (2.0, {'time': '1970-01-01T00:00:02+00:00', 'x': 2.0}),
+            (3.0, {'time': '1970-01-01T00:00:03+00:00', 'x': 3.0, 'y': 30.0}),
+            (5.0, {'time': '1970-01-01T00:00:05+00:00', 'x': 5.0, 'y': 50.0}),
+        ]
+        assert store.get_positions(merge.TimeConverter(pytz.utc), ('y', ), 1500000, 2500000) == []
+
+        with pytest.raises(ValueError):
+            store.append([5000000], [[5.0], [50.0]], 6000000)
+
+    def test_discard_interrupted_append(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        store.reset(ENTITY, ('x', ), 0)
+        store.append([1000000], [[1.0]], 1000000)
+        with open(str(tmp_path / 'store' / 'time.i64'), 'ab') as f:
+            f.write(b'\0' * 8)
+
+        store.append([2000000], [[2.0]], 2000000)
+        positions = store.get_positions(merge.TimeConverter(pytz.utc), ('x', ), 0, 2000000)
+        assert [epoch for epoch, _ in positions] == [1.0, 2.0]
+
+
+class TestIngester:
+
+    def test_ingest(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        client = FakeClient(list(range(0, 100)))
+        ingester = Ingester(store, client, ('x', 'y'), 5, 50, 20)
+
+        assert ingester.ingest(100) == 46
+        assert store.get_range(ENTITY, ('x', 'y')) == (50000000, 95000000)
+        assert len(client.calls) == 3
+
+        assert ingester.ingest(103) == 3
+        positions = store.get_positions(merge.TimeConverter(pytz.utc), ('x', 'y'), 0, 100000000)
+        assert [epoch for epoch, _ in positions] == [float(e) for e in range(50, 99)]
+        assert positions[1][1] == {'time': '1970-01-01T00:00:51+00:00', 'x': 51.0}
+        assert positions[2][1] == {'time': '1970-01-01T00:00:52+00:00', 'x': 52.0, 'y': 53.0}
+
+    def test_ingest_unsettled(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        client = FakeClient(list(range(0, 100)))
+        ingester = Ingester(store, client, ('x', 'y'), 5, 50, 100, 10)
+        fetch = client.fetch
+
+        def fetch_late(attrs, start_dt, end_dt, strict=False):
+            # the position at 94 is persisted between the two reads
+            result = fetch(attrs, start_dt, end_dt, strict)
+            if len(client.calls) == 1:
+                result = {attr: [v for v in values if v['recvTime'] != to_recv_time(94)]
+                          for attr, values in result.items()}
+            return result
+        client.fetch = fetch_late
+
+        assert ingester.ingest(100) == 0
+        assert store.get_range(ENTITY, ('x', 'y')) is None
+        assert ingester.ingest(100) == 46
+        assert store.get_range(ENTITY, ('x', 'y')) == (50000000, 95000000)
+        assert len(client.calls) == 4
+
+    def test_ingest_failed(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        ingester = Ingester(store, FakeClient([], fail=True), ('x', 'y'), 5, 50, 20)
+
+        with pytest.raises(CometError):
+            ingester.ingest(100)
+        assert store.get_range(ENTITY, ('x', 'y')) is None
+
+    def test_reset_other_attrs(self, tmp_path):
+        store = PositionStore(str(tmp_path / 'store'))
+        Ingester(store, FakeClient(list(range(0, 100))), ('x', ), 5, 50, 20).ingest(100)
+
+        ingester = Ingester(store, FakeClient(list(range(0, 100))), ('x', 'y'), 5, 10, 20)
+        assert ingester.ingest(100) == 6
+        assert store.get_range(ENTITY, ('x', 'y')) == (90000000, 95000000)
+
+
+class TestRobotPositionsAPIv2Store:
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        os.environ[const.POSITION_STORE_DIR] = str(tmp_path / 'store')
+        os.environ[const.API_VERSION] = 'v2'
+        import src.views
+        importlib.reload(src.views)
+        import main
+        importlib.reload(main)
+        yield src.views.RobotPositionsAPIv2.STORE, main.app.test_client()
+        del os.environ[const.POSITION_STORE_DIR]
+        importlib.reload(src.views)
+
+    def test_get_from_store(self, requests_mock, store):
+        position_store, client = store
+        position_store.reset(ENTITY, ('x', 'y'), 1514851200000000)
+        position_store.append([1514851200000000, 1514851201000000], [[0.0, 0.1], [1.0, None]], 1514851202000000)
+
+        urlstr = 'http://comet:8666/STH/v1/contextEntities/type/entity-type/id/entity-id/attributes/'
+        body = {'contextResponses': [{'contextElement': {'attributes': [{'values': [
+            {'recvTime': '2018-01-02T00:00:03.000Z', 'attrValue': 0.3}]}]}}]}
+        mx = requests_mock.get(urlstr + 'x', json=body, headers={'fiware-total-count': '1'})
+        requests_mock.get(urlstr + 'y', json=body, headers={'fiware-total-count': '1'})
+
+        response = client.get('/positions/', query_string={'st': '2018-01-02T09:00:00+09:00',
+                                                           'et': '2018-01-02T09:00:05+09:00'})
+        assert response.status_code == 200
+        assert response.get_json() == [
+            {'time': '2018-01-02T09:00:00+09:00', 'x': 0.0, 'y': 1.0},
+            {'time': '2018-01-02T09:00:01+09:00', 'x': 0.1},
+            {'time': '2018-01-02T09:00:03+09:00', 'x': 0.3, 'y': 0.3},
+        ]
+        assert mx.call_count == 1
+
+        response = client.get('/positions/', query_string={'st': '2018-01-02T09:00:00+09:00',
+                                                           'et': '2018-01-02T09:00:01+09:00'})
+        assert len(response.get_json()) == 2
+        assert mx.call_count == 1
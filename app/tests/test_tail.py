@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.tail import TailTracker
+
+
+class Fetcher:
+
+    def __init__(self):
+        self.epochs = list()
+        self.calls = list()
+
+    def __call__(self, start_ts, end_ts):
+        self.calls.append((start_ts, end_ts))
+        return [(e, {'time': e}) for e in self.epochs if start_ts <= e <= end_ts]
+
+
+class TestTailTracker:
+
+    @pytest.fixture
+    def fetcher(self):
+        return Fetcher()
+
+    def test_get(self, fetcher):
+        tail = TailTracker(1.0, 60.0)
+        fetcher.epochs = [100, 101, 102]
+
+        assert [e for e, _ in tail.get('entity', 100, 103, fetcher)] == [101, 102]
+        assert fetcher.calls == [(100, 103)]
+
+        fetcher.epochs += [103, 104]
+        assert [e for e, _ in tail.get('entity', 102, 103.5, fetcher)] == []
+        assert fetcher.calls == [(100, 103)]
+
+        assert [e for e, _ in tail.get('entity', 102, 105, fetcher)] == [103, 104]
+        assert fetcher.calls == [(100, 103), (102, 105)]
+
+    def test_get_shared(self, fetcher):
+        tail = TailTracker(1.0, 60.0)
+        fetcher.epochs = [100, 101, 102]
+
+        tail.get('entity', 99, 103, fetcher)
+        assert [e for e, _ in tail.get('entity', 100, 103.5, fetcher)] == [101, 102]
+        assert [e for e, _ in tail.get('entity', 101, 103.5, fetcher)] == [102]
+        assert len(fetcher.calls) == 1
+
+        assert [e for e, _ in tail.get('another', 101, 103.5, fetcher)] == [102]
+        assert len(fetcher.calls) == 2
+
+    def test_get_behind(self, fetcher):
+        tail = TailTracker(1.0, 10.0)
+        fetcher.epochs = list(range(100, 200))
+
+        tail.get('entity', 150, 200, fetcher)
+        assert [e for e, _ in tail.get('entity', 189, 200.5, fetcher)] == list(range(190, 200))
+        assert len(fetcher.calls) == 1
+
+        assert [e for e, _ in tail.get('entity', 170, 200.5, fetcher)] == list(range(171, 200))
+        assert fetcher.calls[-1] == (170, 200.5)
@@ -3,10 +3,14 @@ const path = require('path')
 module.exports = {
     mode: 'production',
     target: 'web',
-    entry: ['@babel/polyfill', path.resolve(__dirname, 'js/robotLocus.js')],
+    entry: {
+        robotLocus: ['@babel/polyfill', path.resolve(__dirname, 'js/robotLocus.js')],
+        trackWorker: path.resolve(__dirname, 'js/trackWorker.js')
+    },
     output: {
         path: path.resolve(__dirname, 'static/js'),
-        filename: 'robotLocus.js'
+        filename: '[name].js',
+        globalObject: 'self'
     },
     module: {
         rules: [
@@ -1,3 +1,8 @@
 #!/bin/sh
+SUPERVISORD_CONF=/etc/supervisord.conf
+if [ "${SERVER_INTERFACE}" = "asgi" ]; then
+    cp /etc/nginx/flask-nginx-asgi.conf /etc/nginx/conf.d/flask-nginx.conf
+    SUPERVISORD_CONF=/etc/supervisord-asgi.conf
+fi
 sed -i -e "s/<<LISTEN_PORT>>/${LISTEN_PORT}/g" /etc/nginx/conf.d/flask-nginx.conf
-/usr/bin/supervisord --nodaemon --configuration /etc/supervisord.conf
+/usr/bin/supervisord --nodaemon --configuration ${SUPERVISORD_CONF}